@@ -23,10 +23,14 @@
 #
 #########################################################################
 
+import collections
 import copy
 import re
 import datetime
 import functools
+import json
+import operator
+import os
 import time
 import threading
 
@@ -40,6 +44,7 @@ from lib.model.smartplugin import SmartPlugin
 from lib.module import Modules
 
 from .constants import *
+from . import columnar
 from .webif import WebInterface
 
 
@@ -65,9 +70,19 @@ class Database(SmartPlugin):
         '4': ["CREATE INDEX {log}_{item}_id_changed ON {log} (item_id, changed);",
               "DROP INDEX {log}_{item}_id_changed;"],
         '5': ["CREATE UNIQUE INDEX {item}_id ON {item} (id);", "DROP INDEX {item}_id;"],
-        '6': ["CREATE INDEX {item}_name ON {item} (name);", "DROP INDEX {item}_name;"]
+        '6': ["CREATE INDEX {item}_name ON {item} (name);", "DROP INDEX {item}_name;"],
+        '7': ["CREATE TABLE {log_hour} (time BIGINT, item_id INTEGER, val_min REAL, val_max REAL, val_sum REAL, val_count INTEGER, val_wsum REAL, on_wsum REAL, duration BIGINT, PRIMARY KEY (item_id, time));",
+              "DROP TABLE {log_hour};"],
+        '8': ["CREATE TABLE {log_day} (time BIGINT, item_id INTEGER, val_min REAL, val_max REAL, val_sum REAL, val_count INTEGER, val_wsum REAL, on_wsum REAL, duration BIGINT, PRIMARY KEY (item_id, time));",
+              "DROP TABLE {log_day};"]
     }
 
+    # Rollup tables (coarsest tier last): table name, bucket width in ms
+    _rollup_tiers = [('log_hour', 3600 * 1000), ('log_day', 24 * 3600 * 1000)]
+
+    # max. number of records written by one multi-row statement of the bulk dump
+    _bulk_chunk_size = 100
+
 
     def __init__(self, sh, *args, **kwargs):
         """
@@ -99,18 +114,36 @@ class Database(SmartPlugin):
         self._dump_cycle = self.get_parameter_value('cycle')
         self._precision = self.get_parameter_value('precision')
         self.count_logentries = self.get_parameter_value('count_logentries')
-
-        self._replace = {table: table if self._prefix == "" else self._prefix + table for table in ["log", "item"]}
+        self._bulk_dump = self.get_parameter_value('bulk_dump')
+        self._rollups = self.get_parameter_value('rollups')
+        self._series_cache_size = self.get_parameter_value('series_cache')
+        self._retention_chunk = self.get_parameter_value('retention_chunk')
+        self._writer_thread = self.get_parameter_value('writer_thread')
+        self._buffer_limit = self.get_parameter_value('buffer_limit')
+
+        self._replace = {table: table if self._prefix == "" else self._prefix + table for table in ["log", "item", "log_hour", "log_day"]}
         self._replace['item_columns'] = ", ".join(COL_ITEM)
         self._replace['log_columns'] = ", ".join(COL_LOG)
         self._buffer = {}
+        self._buffer_count = 0          # number of tuples in the buffer
         self._buffer_lock = threading.Lock()
+        self._buffer_merged = 0         # values merged into the preceding value because the buffer exceeded twice the buffer limit
+        self._buffer_merging = False    # values are being merged since the last dump
         self._dump_lock = threading.Lock()
+        self._writer = None             # writer thread (if parameter writer_thread is set)
+        self._writer_event = threading.Event()
 
         self._handled_items = []        # items that have a 'database' attribute set
         self._items_with_maxage = []    # items that have a 'database_maxage' attribute set
-        self._maxage_worklist = []      # work copy of self._items_with_maxage
+        self._maxage_stats = {'purged': 0, 'items': 0, 'duration': 0, 'last': None}
         self._item_logcount = {}        # dict to store the number of log records for an item
+        self._item_ids = {}             # cache of the database ids of the items (used by bulk dump)
+        self._dump_stats = {'rows': 0, 'items': 0, 'duration': 0, 'rows_per_second': 0, 'last': None}
+        self._rollup_ready = set()      # database ids of items with completely built rollup tables
+        self._rollup_worklist = None    # items to check/build rollups for (None = not yet filled)
+        self._series_cache = collections.OrderedDict()  # LRU cache for results of series queries
+        self._series_cache_lock = threading.Lock()
+        self._series_cache_stats = {'hits': 0, 'misses': 0}
 
         self.cleanup_active = False
 
@@ -141,6 +174,10 @@ class Database(SmartPlugin):
         self._initialize_db()
         self._start_schedulers()
         self.alive = True
+        if self._writer_thread:
+            self._writer = threading.Thread(target=self._write_buffer, name='plugins.' + self.get_fullname() + '.writer')
+            self._writer.daemon = True
+            self._writer.start()
 
 
     def stop(self):
@@ -150,6 +187,10 @@ class Database(SmartPlugin):
         self.logger.debug("Stop method called")
         self.alive = False
         self._stop_schedulers()
+        if self._writer is not None:
+            self._writer_event.set()
+            self._writer.join(timeout=60)
+            self._writer = None
         self._dump(True)
         self._db.close()
 
@@ -246,22 +287,32 @@ class Database(SmartPlugin):
             end = self._timestamp(item.last_change())
             if end - start < 0:
                 self.logger.warning("Negative duration: start: {0}, end {1}, prevChange: {2}, lastChange: {3}, item: {4}".format(start , end, item.prev_change(), item.last_change(), item ))
-            last = None if len(self._buffer[item]) == 0 or self._buffer[item][-1][1] is not None else \
-                self._buffer[item][-1]
-            if last:  # update current value with duration
-                if item.property.path.startswith('test.'):
-                    self.logger.debug("Setting value {} to item '{}' value because database_acl = {}".format(end-start, item, acl))
-                self._buffer[item][-1] = (last[0], end - start, last[2])
-            else:  # append new value with none duration
+            with self._buffer_lock:
+                last = None if len(self._buffer[item]) == 0 or self._buffer[item][-1][1] is not None else \
+                    self._buffer[item][-1]
+                if last:  # update current value with duration
+                    if item.property.path.startswith('test.'):
+                        self.logger.debug("Setting value {} to item '{}' value because database_acl = {}".format(end-start, item, acl))
+                    self._buffer[item][-1] = (last[0], end - start, last[2])
+                else:  # append new value with none duration
+                    if item.property.path.startswith('test.'):
+                        self.logger.debug("(last is None) Setting value {} to item '{}' value because database_acl = {}".format(end-start, item, acl))
+
+                    self._buffer[item].append((start, end - start, item.prev_value()))
+                    self._buffer_count += 1
+
+                # add current value with None duration
                 if item.property.path.startswith('test.'):
-                    self.logger.debug("(last is None) Setting value {} to item '{}' value because database_acl = {}".format(end-start, item, acl))
-
-                self._buffer[item].append((start, end - start, item.prev_value()))
-
-            # add current value with None duration
-            if item.property.path.startswith('test.'):
-                self.logger.debug("Appending value {} to item '{}' value because database_acl = {}".format(end, item, acl))
-            self._buffer[item].append((end, None, item()))
+                    self.logger.debug("Appending value {} to item '{}' value because database_acl = {}".format(end, item, acl))
+                self._buffer[item].append((end, None, item()))
+                self._buffer_count += 1
+
+                if self._writer is not None and self._buffer_count >= self._buffer_limit:
+                    # wake up the writer and, if the buffer keeps growing, merge the oldest values of the item
+                    # instead of blocking the thread updating the item
+                    self._writer_event.set()
+                    if self._buffer_count >= 2 * self._buffer_limit:
+                        self._buffer_merge_oldest(item)
         else:
             self.logger.debug("Not writing item '{}' value because database_acl = {}".format(item,  acl))
 
@@ -272,9 +323,12 @@ class Database(SmartPlugin):
         """
         if self.count_logentries:
             self.scheduler_add('Count logs', self._count_logentries, cycle=6*3600, prio=6)
-        self.scheduler_add('Buffer dump', self._dump, cycle=self._dump_cycle, prio=5)
+        if not self._writer_thread:
+            self.scheduler_add('Buffer dump', self._dump, cycle=self._dump_cycle, prio=5)
+        if self._rollups:
+            self.scheduler_add('Build rollups', self._build_rollups, cycle=60, prio=6)
         if len(self._items_with_maxage) > 0:
-            self.scheduler_add('Remove old', self.remove_older_than_maxage, cycle=91, prio=6)
+            self.scheduler_add('Remove old', self.remove_older_than_maxage, cycle=600, prio=6)
         return
 
 
@@ -284,7 +338,10 @@ class Database(SmartPlugin):
         """
         if len(self._items_with_maxage) > 0:
             self.scheduler_remove('Remove old')
-        self.scheduler_remove('Buffer dump')
+        if self._rollups:
+            self.scheduler_remove('Build rollups')
+        if not self._writer_thread:
+            self.scheduler_remove('Buffer dump')
         if self.count_logentries:
             self.scheduler_remove('Count logs')
         return
@@ -334,12 +391,16 @@ class Database(SmartPlugin):
 
 
     def dump(self, dumpfile, id=None, time=None, time_start=None, time_end=None, changed=None, changed_start=None,
-             changed_end=None, cur=None):
+             changed_end=None, cur=None, format='csv', chunk_size=10000, resume=False):
         """
         Creates a database dump for given criterias
 
         This is a public function of the plugin
 
+        The log records are read in chunks (keyset pagination on item id and time), so the memory
+        usage does not depend on the size of the log table. After each chunk a checkpoint is
+        written to <dumpfile>.checkpoint, which allows to resume an interrupted dump.
+
         :param dumpfile: Name of the file to dump to
         :param id: If given, item_id to restrict dump to (optional)
         :param time: If given, time to restrict dump to (optional)
@@ -349,39 +410,114 @@ class Database(SmartPlugin):
         :param changed_start: Restrict dump to given start time of changes (optional)
         :param changed_end: Restrict dump to given end time of changes (optional)
         :param cur: A database cursor object if available (optional)
+        :param format: 'csv' or 'columnar' (compact binary format, see columnar.py)
+        :param chunk_size: Number of log records read per query
+        :param resume: If True, an interrupted dump is continued from its checkpoint (optional)
         """
         self.logger.info("Starting file dump to {} ...".format(dumpfile))
 
+        checkpoint_file = dumpfile + '.checkpoint'
+        checkpoint = None
+        if resume and os.path.isfile(checkpoint_file) and os.path.isfile(dumpfile):
+            with open(checkpoint_file, 'r') as cf:
+                checkpoint = json.load(cf)
+            if checkpoint.get('format') != format:
+                self.logger.warning("Checkpoint of {} was written for format {}, starting a new dump".format(dumpfile, checkpoint.get('format')))
+                checkpoint = None
+
         item_ids = self.readItems(cur=cur) if id is None else [self.readItem(id, cur=cur)]
+        item_ids = sorted([item for item in item_ids if item is not None], key=lambda item: item[COL_ITEM_ID])
 
         s = ';'
-        h = ['item_id', 'item_name', 'time', 'duration', 'val_str', 'val_num', 'val_bool', 'changed', 'time_date',
-             'changed_date']
-        f = open(dumpfile, 'w')
-        f.write(s.join(h) + "\n")
-        for item in item_ids:
-            self.logger.debug("... dumping item {}/{}".format(item[1], item[0]))
-
-            rows = self.readLogs(item[0], time=time, time_start=time_start, time_end=time_end, changed=changed,
-                                 changed_start=changed_start, changed_end=changed_end, cur=cur)
+        if checkpoint is None:
+            f = open(dumpfile, 'wb')
+            if format == 'columnar':
+                columnar.write_header(f)
+            else:
+                h = ['item_id', 'item_name', 'time', 'duration', 'val_str', 'val_num', 'val_bool', 'changed', 'time_date',
+                     'changed_date']
+                f.write((s.join(h) + "\n").encode('utf-8'))
+        else:
+            self.logger.info("... resuming dump at item {} after time {}".format(checkpoint['item_id'], checkpoint['time']))
+            f = open(dumpfile, 'r+b')
+            f.truncate(checkpoint['offset'])
+            f.seek(checkpoint['offset'])
 
-            for row in rows:
-                cols = []
-                for key in [COL_ITEM_ID, COL_ITEM_NAME]:
-                    cols.append(item[key])
-                for key in [COL_LOG_TIME, COL_LOG_DURATION, COL_LOG_VAL_STR, COL_LOG_VAL_NUM, COL_LOG_VAL_BOOL,
-                            COL_LOG_CHANGED]:
-                    cols.append(row[key])
-                for key in [COL_ITEM_ID, COL_LOG_CHANGED]:
-                    cols.append('' if row[key] is None else datetime.datetime.fromtimestamp(row[key] / 1000.0))
-                cols = map(lambda col: '' if col is None else col, cols)
-                cols = map(lambda col: str(col) if not '"' in str(col) else col.replace('"', '\\"'), cols)
-                f.write(s.join(cols) + "\n")
-        f.close()
+        try:
+            for item in item_ids:
+                last_time = None
+                if checkpoint is not None:
+                    if item[COL_ITEM_ID] < checkpoint['item_id']:
+                        continue
+                    if item[COL_ITEM_ID] == checkpoint['item_id']:
+                        last_time = checkpoint['time']
+                self.logger.debug("... dumping item {}/{}".format(item[1], item[0]))
+
+                while True:
+                    rows = self._read_log_chunk(item[COL_ITEM_ID], last_time, chunk_size, time=time, time_start=time_start,
+                                                time_end=time_end, changed=changed, changed_start=changed_start,
+                                                changed_end=changed_end, cur=cur)
+                    if not rows:
+                        break
+                    if format == 'columnar':
+                        columnar.write_row_group(f, item[COL_ITEM_ID], item[COL_ITEM_NAME], rows)
+                    else:
+                        for row in rows:
+                            f.write((s.join(self._dump_csv_cols(item, row)) + "\n").encode('utf-8'))
+                    f.flush()
+                    last_time = rows[-1][COL_LOG_TIME]
+                    with open(checkpoint_file, 'w') as cf:
+                        json.dump({'format': format, 'item_id': item[COL_ITEM_ID], 'time': last_time, 'offset': f.tell()}, cf)
+                    if len(rows) < chunk_size:
+                        break
+        finally:
+            f.close()
+        if os.path.isfile(checkpoint_file):
+            os.remove(checkpoint_file)
         self.logger.info("File dump completed ({} items) ...".format(len(item_ids)))
         return
 
 
+    def _dump_csv_cols(self, item, row):
+        """
+        Return the columns of a log record for a csv dump
+
+        :param item: item record
+        :param row: log record
+        :return: list of column strings
+        """
+        cols = []
+        for key in [COL_ITEM_ID, COL_ITEM_NAME]:
+            cols.append(item[key])
+        for key in [COL_LOG_TIME, COL_LOG_DURATION, COL_LOG_VAL_STR, COL_LOG_VAL_NUM, COL_LOG_VAL_BOOL,
+                    COL_LOG_CHANGED]:
+            cols.append(row[key])
+        for key in [COL_ITEM_ID, COL_LOG_CHANGED]:
+            cols.append('' if row[key] is None else datetime.datetime.fromtimestamp(row[key] / 1000.0))
+        cols = map(lambda col: '' if col is None else col, cols)
+        return list(map(lambda col: str(col) if not '"' in str(col) else col.replace('"', '\\"'), cols))
+
+
+    def _read_log_chunk(self, id, last_time, chunk_size, time=None, time_start=None, time_end=None, changed=None,
+                        changed_start=None, changed_end=None, cur=None):
+        """
+        Read the next chunk of log records of an item (ordered by time)
+
+        :param id: Database ID of item to read the records for
+        :param last_time: time of the last record of the previous chunk (None for the first chunk)
+        :param chunk_size: max. number of records to read
+        :return: log records
+        """
+        condition, params = self._slice_condition(id, time=time, time_start=time_start, time_end=time_end,
+                                                  changed=changed, changed_start=changed_start, changed_end=changed_end)
+        condition = condition.strip().rstrip(';')
+        if last_time is not None:
+            condition += " AND time > :last_time"
+            params['last_time'] = last_time
+        return self._fetchall("SELECT {log_columns} FROM {log} WHERE " + condition + " ORDER BY time ASC LIMIT " +
+                              str(int(chunk_size)) + ";", params, cur=cur)
+
+
     def insertItem(self, name, cur=None):
         """
         Create database item record for given database ID
@@ -479,6 +615,7 @@ class Database(SmartPlugin):
         params = {'id': id}
         self.deleteLog(id, cur=cur)
         self._execute(self._prepare("DELETE FROM {item} WHERE id = :id;"), params, cur=cur)
+        self._item_ids = {}
 
 
     def insertLog(self, id, time, duration=0, val=None, it=None, changed=None, cur=None):
@@ -620,8 +757,14 @@ class Database(SmartPlugin):
         condition, params = self._slice_condition(id, time=time, time_start=time_start, time_end=time_end,
                                                   changed=changed, changed_start=changed_start, changed_end=changed_end)
         self._execute(self._prepare("DELETE FROM {log} WHERE " + condition), params, cur=cur)
+        if self._rollups:
+            if time is not None:
+                self._rollup_update(id, time, time, cur=cur)
+            else:
+                self._rollup_update(id, time_start, time_end, cur=cur)
         if with_commit:
             self._db.commit()
+        self._series_cache_invalidate(id)
         self._item_logcount[id] = self.readLogCount(id)
         return
 
@@ -722,12 +865,22 @@ class Database(SmartPlugin):
             'raw.order': 'ORDER BY time ASC',
             'raw.group': ''
         }
+        rollup_queries = {
+            'avg': 'MIN(time), ' + self._precision_query('SUM(val_wsum) / SUM(duration)'),
+            'integrate': 'MIN(time), SUM(val_wsum)',
+            'countall': 'MIN(time), SUM(val_count)',
+            'min': 'MIN(time), MIN(val_min)',
+            'max': 'MIN(time), MAX(val_max)',
+            'on': 'MIN(time), ' + self._precision_query('SUM(on_wsum) / SUM(duration)'),
+            'sum': 'MIN(time), SUM(val_sum)'
+        }
         if func not in queries:
             raise NotImplementedError
 
         order = '' if func + '.order' not in queries else queries[func + '.order']
         group = 'GROUP BY ROUND(time / :step)' if func + '.group' not in queries else queries[func + '.group']
-        logs = self._fetch_log(item, queries[func], start, end, step=step, count=count, group=group, order=order)
+        logs = self._fetch_log(item, queries[func], start, end, step=step, count=count, group=group, order=order,
+                               rollup=rollup_queries.get(func), func=func, expression=expression)
         tuples = logs['tuples']
         if tuples:
             if logs['istart'] > tuples[0][0]:
@@ -825,7 +978,8 @@ class Database(SmartPlugin):
         return query
 
 
-    def _fetch_log(self, item, columns, start, end, step=None, count=100, group='', order=''):
+    def _fetch_log(self, item, columns, start, end, step=None, count=100, group='', order='', rollup=None, func=None,
+                   expression=None):
         _item = self.items.return_item(item)
 
         istart = self._parse_ts(start)
@@ -842,10 +996,68 @@ class Database(SmartPlugin):
             else:
                 step = iend - istart
 
-        if self._buffer[_item] != []:
+        # With the writer thread, readers do not force a dump. Buffered values are merged in memory instead.
+        buffered = []
+        if self._writer is not None and func is not None:
+            buffered = [t for t in self._buffer_copy(_item) if t[0] <= iend]
+        elif self._buffer[_item] != []:
             self._dump(items=[_item])
+        db_end = iend if buffered == [] else min(iend, min([t[0] for t in buffered]) - 1)
+
+        # Identical requests within the same step are served from the cache (start and end are bucketed by step)
+        cache_key = None
+        logs = None
+        if self._series_cache_size > 0:
+            bucket = max(step, 1)
+            cache_key = (id, columns, group, order, rollup, istart // bucket, iend // bucket, db_end // bucket, step)
+            logs = self._series_cache_get(cache_key)
 
-        params = {'id': id, 'time_start': istart, 'time_end': iend, 'inow': inow, 'step': step}
+        if logs is None and db_end >= istart:
+            logs = self._fetch_log_db(id, columns, istart, db_end, inow, step, group, order, rollup)
+            if cache_key is not None and logs is not None:
+                self._series_cache_put(cache_key, logs)
+
+        if buffered:
+            logs = (logs or []) + self._aggregate_buffered(func, expression, buffered, max(istart, db_end + 1), iend, inow, step, group != '')
+
+        return {
+            'tuples': logs,
+            'item': _item,
+            'istart': istart,
+            'iend': iend,
+            'step': step,
+            'count': count
+        }
+
+
+    def _fetch_log_db(self, id, columns, istart, iend, inow, step, group, order, rollup):
+        """
+        Query the log (and rollup) tables for the given time range
+
+        :return: list of tuples
+        """
+        # Use the coarsest rollup tier, which is fine enough for the requested step, for the
+        # part of the time range which is completely covered by the rollup table. The rest
+        # (recent data) is read from the log table.
+        rollup_logs = []
+        time_start = istart
+        previous = "(SELECT COALESCE(MAX(time), 0) FROM {log} WHERE item_id = :id AND time < :time_start)"
+        tier = None if rollup is None else self._rollup_tier(id, step)
+        if tier is not None:
+            table, width = tier
+            last = self._fetchone("SELECT MAX(time) FROM {log} WHERE item_id = :id;", {'id': id})
+            split = min(iend, inow) if last is None or last[0] is None else min(iend, inow, last[0])
+            split -= split % width
+            if split > istart:
+                rollup_logs = self._fetchall(
+                    "SELECT " + rollup + " FROM {" + table + "} WHERE item_id = :id AND time >= :time_start AND time < :time_end "
+                    "GROUP BY ROUND(time / :step) ORDER BY MIN(time) ASC",
+                    {'id': id, 'time_start': istart - istart % width, 'time_end': split, 'step': step}) or []
+                # value active at split time is already accounted for in the rollup table
+                time_start = split
+                previous = ":time_start"
+
+        params = {'id': id, 'time_start': time_start, 'time_end': iend, 'inow': inow, 'step': step}
         duration_now = "COALESCE(duration, :inow - time)"
 
         # Duration calculation (S=Start, E=End):
@@ -872,9 +1084,9 @@ class Database(SmartPlugin):
         query = (
                 "SELECT " + columns + " FROM {log} WHERE "
                                       "item_id = :id AND "
-                                      "time >= (SELECT COALESCE(MAX(time), 0) FROM {log} WHERE item_id = :id AND time < :time_start) AND "
+                                      "time >= " + previous + " AND "
                                       "time <= :time_end AND "
-                                      "time + duration_now > (SELECT COALESCE(MAX(time), 0) FROM {log} WHERE item_id = :id AND time < :time_start) "
+                                      "time + duration_now > " + previous + " "
                                       "" + group + " " + order
         )
 
@@ -883,15 +1095,120 @@ class Database(SmartPlugin):
         query = query.replace('duration_now', duration_now)
 
         logs = self._fetchall(query, params)
+        if rollup_logs:
+            logs = rollup_logs + (logs or [])
+
+        return logs
+
+
+    def _aggregate_buffered(self, func, expression, tuples, istart, iend, inow, step, grouped):
+        """
+        Aggregate not yet written values of the buffer like the series queries do in the database
+
+        Values are grouped by step the same way the database does it (SQLite uses integer
+        division of the timestamps, other databases round).
+
+        :param func: aggregation function (see _series)
+        :param expression: expression parameters (see _expression)
+        :param tuples: buffered tuples (time, duration, value)
+        :param istart: start of time range
+        :param iend: end of time range
+        :param inow: current timestamp (limited to iend)
+        :param step: step for grouping
+        :param grouped: False for raw values
+        :return: list of tuples (time, value)
+        """
+        compare = {'<>': operator.ne, '!=': operator.ne, '<': operator.lt, '=': operator.eq, '>': operator.gt}
+        rows = []
+        for t in tuples:
+            try:
+                val = float(t[2])
+            except (TypeError, ValueError):
+                continue
+            duration = inow - t[0] if t[1] is None else t[1]
+            if t[0] + duration < istart:
+                continue
+            rows.append((t[0], max(min(t[0] + duration, iend) - max(t[0], istart), 0), val))
+
+        if not grouped:
+            return [(row[0], row[2]) for row in rows]
+
+        groups = collections.OrderedDict()
+        for row in rows:
+            # like GROUP BY ROUND(time / :step) in SQL, a step of 0 puts all values into one group
+            if step == 0:
+                key = None
+            else:
+                key = row[0] // step if self.driver.lower() == 'sqlite3' else round(row[0] / step)
+            groups.setdefault(key, []).append(row)
+
+        result = []
+        for rows in groups.values():
+            duration = sum([row[1] for row in rows])
+            if func == 'avg':
+                value = sum([row[2] * row[1] for row in rows]) / duration if duration else None
+            elif func == 'integrate':
+                value = sum([row[2] * row[1] for row in rows])
+            elif func == 'count':
+                value = len([row for row in rows if compare[expression['params']['op']](row[2], float(expression['params']['value']))])
+            elif func == 'countall':
+                value = len(rows)
+            elif func == 'min':
+                value = min([row[2] for row in rows])
+            elif func == 'max':
+                value = max([row[2] for row in rows])
+            elif func == 'on':
+                value = sum([int(bool(row[2])) * row[1] for row in rows]) / duration if duration else None
+            else:
+                value = sum([row[2] for row in rows])
+            if func in ['avg', 'on'] and value is not None and self._precision >= 0:
+                value = round(value, self._precision)
+            result.append((rows[0][0], value))
+        return result
 
-        return {
-            'tuples': logs,
-            'item': _item,
-            'istart': istart,
-            'iend': iend,
-            'step': step,
-            'count': count
-        }
+
+    def _series_cache_get(self, key):
+        """
+        Return a copy of the cached result for the given key and update the hit/miss counters
+
+        :param key: cache key
+        :return: list of tuples or None, if the key is not cached
+        """
+        with self._series_cache_lock:
+            logs = self._series_cache.get(key)
+            if logs is None:
+                self._series_cache_stats['misses'] += 1
+                return None
+            self._series_cache.move_to_end(key)
+            self._series_cache_stats['hits'] += 1
+            return list(logs)
+
+
+    def _series_cache_put(self, key, logs):
+        """
+        Store the result of a query in the cache and evict the least recently used entries
+
+        :param key: cache key
+        :param logs: list of tuples
+        """
+        with self._series_cache_lock:
+            self._series_cache[key] = tuple(logs)
+            self._series_cache.move_to_end(key)
+            while len(self._series_cache) > self._series_cache_size:
+                self._series_cache.popitem(last=False)
+
+
+    def _series_cache_invalidate(self, id):
+        """
+        Remove all cached results for the given item
+
+        :param id: Database ID of the item
+        """
+        if self._series_cache_size <= 0:
+            return
+        with self._series_cache_lock:
+            for key in [key for key in self._series_cache if key[0] == id]:
+                del self._series_cache[key]
 
 
     def _parse_ts(self, dts):
@@ -1026,6 +1343,15 @@ class Database(SmartPlugin):
             items = list(self._buffer.keys())
             self._buffer_lock.release()
 
+        dump_start = time.time()
+        if self._bulk_dump:
+            rows = self._dump_bulk(finalize, items)
+            self._update_dump_stats(rows, len(items), dump_start)
+            self.logger.debug('Dump completed')
+            self._dump_lock.release()
+            return
+
+        rows = 0
         for item in items:
             tuples = self._buffer_remove(item)
 
@@ -1087,11 +1413,15 @@ class Database(SmartPlugin):
                             self.insertLog(id, t[0], t[1], t[2], item.type(), changed, cur)
 
                     self.updateItem(id, _update[0], None, _update[1], item.type(), _update[2], cur)
+                    if self._rollups and len(tuples):
+                        self._rollup_update(id, min([t[0] for t in tuples]), max([t[0] for t in tuples]), cur=cur)
 
                     cur.close()
                     cur = None
 
                     self._db.commit()
+                    self._series_cache_invalidate(id)
+                    rows += len(tuples)
                 except Exception as e:
                     self.logger.warning("Problem dumping {}: {}".format(item.id(), e))
                     try:
@@ -1103,16 +1433,163 @@ class Database(SmartPlugin):
                     if cur is not None:
                         cur.close()
                 self._db.release()
+        self._update_dump_stats(rows, len(items), dump_start)
         self.logger.debug('Dump completed')
         self._dump_lock.release()
 
 
+    def _dump_bulk(self, finalize, items):
+        """
+        Dump the buffered data of the given items to the database within one transaction
+
+        The log and item records are written with multi-row upserts (if supported by the
+        database driver) and the transaction is commited once at the end of the dump.
+
+        :param finalize: If True, the current values of the items are written too (plugin shutdown)
+        :param items: list of items to dump
+        :return: number of log records written
+        """
+        work = []
+        for item in items:
+            tuples = self._buffer_remove(item)
+            if len(tuples) or finalize:
+                work.append((item, tuples))
+        if work == []:
+            return 0
+
+        # Test connectivity
+        if self._db.verify(5) == 0:
+            for item, tuples in work:
+                self._buffer_insert(item, tuples)
+            self.logger.error("Connection not recovered, skipping dump")
+            return 0
+
+        # Can't lock, restore data
+        if not self._db.lock(300):
+            for item, tuples in work:
+                self._buffer_insert(item, tuples)
+            if finalize:
+                self.logger.error("Can't dump {} items due to fail to acquire lock!".format(len(work)))
+            else:
+                self.logger.error("Can't dump {} items due to fail to acquire lock - will try on next dump".format(len(work)))
+            return 0
+
+        rows = 0
+        cur = None
+        try:
+            changed = self._timestamp(self.shtime.now())
+            cur = self._db.cursor()
+
+            log_rows = []
+            item_rows = []
+            for item, tuples in work:
+                try:
+                    # Get current values of item
+                    start = self._timestamp(item.last_change())
+                    val = item()
+
+                    # When finalizing (e.g. plugin shutdown) add current value to item and log
+                    if finalize:
+                        _update = (changed, val, changed)
+                        tuples = tuples + [(start, changed - start, val)]
+                    else:
+                        _update = (start, val, changed)
+
+                    id = self._item_ids.get(item)
+                    if id is None:
+                        id = self.id(item, cur=cur)
+                        self._item_ids[item] = id
+
+                    self.logger.debug('Dumping {}/{} with {} values'.format(item.id(), id, len(tuples)))
+                    for t in tuples:
+                        row = {'item_id': id, 'time': t[0], 'duration': t[1], 'changed': changed}
+                        row.update(self._item_value_tuple(item.type(), t[2]))
+                        log_rows.append(row)
+                    row = {'id': id, 'name': item.id(), 'time': _update[0], 'changed': _update[2]}
+                    row.update(self._item_value_tuple(item.type(), _update[1]))
+                    item_rows.append(row)
+                except Exception as e:
+                    self.logger.warning("Problem dumping {}: {}".format(item.id(), e))
+
+            self._upsert('log', ('item_id', 'time'), ('duration', 'val_str', 'val_num', 'val_bool', 'changed'), log_rows, cur)
+            self._upsert('item', ('id',), ('name', 'time', 'val_str', 'val_num', 'val_bool', 'changed'), item_rows, cur)
+            if self._rollups:
+                ranges = {}
+                for row in log_rows:
+                    time_start, time_end = ranges.get(row['item_id'], (row['time'], row['time']))
+                    ranges[row['item_id']] = (min(time_start, row['time']), max(time_end, row['time']))
+                for id, (time_start, time_end) in ranges.items():
+                    self._rollup_update(id, time_start, time_end, cur=cur)
+
+            cur.close()
+            cur = None
+
+            self._db.commit()
+            for row in item_rows:
+                self._series_cache_invalidate(row['id'])
+            rows = len(log_rows)
+        except Exception as e:
+            self.logger.warning("Problem dumping {} items: {}".format(len(work), e))
+            try:
+                self._db.rollback()
+            except Exception as er:
+                for item, tuples in work:
+                    self._buffer_insert(item, tuples)
+                self.logger.warning("Error rolling back: {}".format(er))
+        finally:
+            if cur is not None:
+                cur.close()
+        self._db.release()
+        return rows
+
+
+    def _update_dump_stats(self, rows, items, dump_start):
+        """
+        Store statistics of the last dump for the web interface
+
+        :param rows: number of log records written
+        :param items: number of items handled by the dump
+        :param dump_start: start time of the dump (time.time())
+        """
+        duration = time.time() - dump_start
+        self._dump_stats = {'rows': rows, 'items': items, 'duration': round(duration, 3),
+                            'rows_per_second': round(rows / duration) if duration > 0 else 0,
+                            'last': self.shtime.now()}
+
+
+    def _buffer_merge_oldest(self, item):
+        """
+        Merge the oldest buffered values of an item until the buffer is below twice the buffer limit.
+
+        The first buffered value is kept, as it may complete the duration of a record already written
+        to the database. The values following it are merged into it by extending its duration, so the
+        logged time range stays without gaps. The two newest values (last value with duration and
+        current value) are always kept. Has to be called with the buffer lock held.
+
+        :param item: item that has been updated
+        """
+        tuples = self._buffer[item]
+        merged = 0
+        while self._buffer_count >= 2 * self._buffer_limit and len(tuples) > 3 and \
+                tuples[0][1] is not None and tuples[1][1] is not None:
+            tuples[0] = (tuples[0][0], tuples[1][0] + tuples[1][1] - tuples[0][0], tuples[0][2])
+            del tuples[1]
+            self._buffer_count -= 1
+            merged += 1
+        if merged:
+            self._buffer_merged += merged
+            if not self._buffer_merging:
+                self._buffer_merging = True
+                self.logger.warning("Buffer limit exceeded ({} values), writer thread is not keeping up. Merging the oldest buffered values of items".format(self._buffer_count))
+
+
     def _buffer_insert(self, item, tuples):
         self._buffer_lock.acquire()
         if item in self._buffer:
             self._buffer[item] = tuples + self._buffer[item]
         else:
             self._buffer[item] = tuples
+        self._buffer_count += len(tuples)
         self._buffer_lock.release()
         return tuples
 
@@ -1121,45 +1598,287 @@ class Database(SmartPlugin):
         self._buffer_lock.acquire()
         tuples = self._buffer[item]
         self._buffer[item] = self._buffer[item][len(tuples):]
+        self._buffer_count -= len(tuples)
         self._buffer_lock.release()
         return tuples
 
 
+    def _buffer_copy(self, item):
+        self._buffer_lock.acquire()
+        tuples = list(self._buffer[item])
+        self._buffer_lock.release()
+        return tuples
+
+
+    def _write_buffer(self):
+        """
+        Writer thread
+
+        Dumps the buffer every dump cycle or earlier, if the buffer limit is reached. Values
+        dropped because of a full buffer are reported after each dump.
+        """
+        self.logger.info("Writer thread started")
+        while self.alive:
+            self._writer_event.wait(timeout=self._dump_cycle)
+            self._writer_event.clear()
+            if not self.alive:
+                break
+            try:
+                self._dump()
+            except Exception as e:
+                self.logger.error("Writer thread: Dump failed: {}".format(e))
+            with self._buffer_lock:
+                merging = self._buffer_merging
+                self._buffer_merging = False
+            if merging:
+                self.logger.warning("Buffer limit exceeded, {} buffered values merged so far".format(self._buffer_merged))
+        self.logger.info("Writer thread stopped")
+
+
+    # ------------------------------------------
+    #    Rollup tables (downsampled tiers)
+    # ------------------------------------------
+
+    def _rollup_tier(self, id, step):
+        """
+        Return the coarsest rollup tier which still satisfies the requested step
+
+        :param id: Database ID of the item
+        :param step: requested step of the series (in ms)
+        :return: tuple of table name and bucket width or None, if no tier can be used
+        """
+        if not self._rollups or id not in self._rollup_ready:
+            return None
+        for table, width in reversed(self._rollup_tiers):
+            if step >= width:
+                return (table, width)
+        return None
+
+
+    def _rollup_update(self, id, time_start, time_end, cur=None):
+        """
+        Recompute the rollup buckets of an item, which cover the given time range
+
+        The hourly tier is computed from the log table, each coarser tier from the tier before.
+
+        :param id: Database ID of the item
+        :param time_start: first changed timestamp (None = from the beginning)
+        :param time_end: last changed timestamp (None = up to the end)
+        :param cur: A database cursor object if available (optional)
+        """
+        source = 'log'
+        columns = "MIN(val_num), MAX(val_num), SUM(val_num), COUNT(*), SUM(val_num * duration), SUM(val_bool * duration), SUM(duration)"
+        # start of the bucket without the modulo operator, as '%' breaks the parameter substitution of pyformat drivers
+        if self.driver.lower() == 'sqlite3':
+            bucket = "(time / :width) * :width"
+        else:
+            bucket = "FLOOR(time / :width) * :width"
+        for table, width in self._rollup_tiers:
+            params = {'id': id, 'width': width}
+            condition = "item_id = :id"
+            if time_start is not None:
+                params['time_start'] = time_start - time_start % width
+                condition += " AND time >= :time_start"
+            if time_end is not None:
+                params['time_end'] = time_end - time_end % width + width
+                condition += " AND time < :time_end"
+            self._execute(self._prepare("DELETE FROM {" + table + "} WHERE " + condition + ";"), params, cur=cur)
+            self._execute(self._prepare(
+                "INSERT INTO {" + table + "}(time, item_id, val_min, val_max, val_sum, val_count, val_wsum, on_wsum, duration) "
+                "SELECT " + bucket + " AS bucket, item_id, " + columns + " FROM {" + source + "} "
+                "WHERE " + condition + " GROUP BY bucket, item_id;"), params, cur=cur)
+            source = table
+            columns = "MIN(val_min), MAX(val_max), SUM(val_sum), SUM(val_count), SUM(val_wsum), SUM(on_wsum), SUM(duration)"
+
+
+    def _build_rollups(self):
+        """
+        Build the rollup tables for log data which was written before rollups were enabled
+
+        Called by scheduler, handles one item per call. Items are used for series queries
+        from the rollup tables only after the tables have been built completely for them.
+        """
+        if self._rollup_worklist is None:
+            self._rollup_worklist = [i for i in self._handled_items]
+            self.logger.info("_build_rollups: Worklist filled with {} items".format(len(self._rollup_worklist)))
+        if self._rollup_worklist == []:
+            return
+
+        item = self._rollup_worklist.pop(0)
+        id = self.id(item, create=False)
+        if id is None:
+            return
+        oldest = self.readOldestLog(id)
+        table, width = self._rollup_tiers[0]
+        first = self._fetchone("SELECT MIN(time) FROM {" + table + "} WHERE item_id = :id;", {'id': id})
+        first = None if first is None else first[0]
+        if oldest is not None and (first is None or first > oldest - oldest % width):
+            # build missing buckets in chunks of 30 days to keep the database lock short
+            chunk = 30 * self._rollup_tiers[-1][1]
+            time_start = oldest - oldest % self._rollup_tiers[-1][1]
+            time_stop = self._timestamp(self.shtime.now()) if first is None else first
+            self.logger.info("_build_rollups: Building rollups for item {} ({} - {})".format(item, self._datetime(time_start), self._datetime(time_stop)))
+            while time_start < time_stop:
+                if not self._db.lock(60):
+                    self.logger.warning("_build_rollups: Can't acquire lock for item {} - will try again later".format(item))
+                    self._rollup_worklist.append(item)
+                    return
+                cur = self._db.cursor()
+                try:
+                    self._rollup_update(id, time_start, min(time_start + chunk, time_stop) - 1, cur=cur)
+                    self._db.commit()
+                except Exception as e:
+                    self.logger.error("_build_rollups: Building rollups for item {} failed: {}".format(item, e))
+                    self._db.rollback()
+                    return
+                finally:
+                    cur.close()
+                    self._db.release()
+                time_start += chunk
+        self._rollup_ready.add(id)
+        return
+
+
     # ------------------------------------------
     #    Database maintenance stuff
     # ------------------------------------------
 
     def remove_older_than_maxage(self):
         """
-        Remove log entries older than maxage of an item
+        Remove log entries older than maxage of the items
 
-        Calls by scheduler
+        Called by scheduler. All items with a maxage are handled in one run: Items with the same
+        maxage are handled together, the records to delete are counted per item with one query
+        and deleted in chunks of max. retention_chunk records. The database lock is released
+        between the chunks, so dumps are not blocked for the whole run.
         """
-        if self._maxage_worklist == []:
-            # Fill work list, if it is empty
-            self._maxage_worklist = [i for i in self._items_with_maxage]
-            self.logger.info("remove_older_than_maxage: Worklist filled with {} items".format(len(self._items_with_maxage)))
+        run_start = time.time()
+        purged = 0
 
-        item = self._maxage_worklist.pop(0)
+        maxages = {}
+        for item in self._items_with_maxage:
+            maxages.setdefault(float(self.get_iattr_value(item.conf, 'database_maxage')), []).append(item)
 
-        #item_id = self.id(item, create=False)
+        for maxage, items in maxages.items():
+            ids = []
+            for item in items:
+                item_id = self.id(item, create=False)
+                if item_id is None:
+                    self.logger.info("remove_older_than_maxage: no id for item {}".format(item))
+                else:
+                    ids.append(item_id)
+            if ids == []:
+                continue
+            timestamp_end = self._timestamp(self.shtime.now() - datetime.timedelta(maxage))
+            self.logger.debug("remove_older_than_maxage: {} items with maxage {}: remove older than {}".format(len(ids), maxage, self._datetime(timestamp_end)))
+
+            condition, params = self._id_list_condition(ids)
+            params['time_end'] = timestamp_end
+            counts = self._fetchall("SELECT item_id, COUNT(*) FROM {log} WHERE " + condition + " AND time < :time_end GROUP BY item_id;", params)
+
+            batch = []
+            batch_count = 0
+            for item_id, count in (counts or []):
+                if count > self._retention_chunk:
+                    # too many records for one chunk: delete the oldest records of the item chunk by chunk
+                    while True:
+                        bound = self._fetchone("SELECT time FROM {log} WHERE item_id = :id AND time < :time_end ORDER BY time ASC LIMIT 1 OFFSET " +
+                                               str(int(self._retention_chunk)) + ";", {'id': item_id, 'time_end': timestamp_end})
+                        deleted = self._purge_log([item_id], timestamp_end if bound is None else bound[0])
+                        if deleted is None:
+                            break
+                        self._logcount_decrement(item_id, deleted)
+                        purged += deleted
+                        if bound is None or deleted == 0:
+                            break
+                    continue
+                if batch_count + count > self._retention_chunk:
+                    purged += self._purge_batch(batch, timestamp_end)
+                    batch = []
+                    batch_count = 0
+                batch.append((item_id, count))
+                batch_count += count
+            if batch != []:
+                purged += self._purge_batch(batch, timestamp_end)
+
+        duration = time.time() - run_start
+        self._maxage_stats = {'purged': purged, 'items': len(self._items_with_maxage), 'duration': round(duration, 3),
+                              'last': self.shtime.now()}
+        self.logger.info("remove_older_than_maxage: {} records of {} items removed in {:.3f} s".format(purged, len(self._items_with_maxage), duration))
+        return
+
+
+    def _purge_batch(self, batch, time_end):
+        """
+        Delete the log records of several items, which are older than time_end, with one query
+
+        The log counts of the items are only decremented if the records have been deleted.
+
+        :param batch: list of (database ID, number of records older than time_end) of the items
+        :param time_end: records older than this timestamp are deleted
+        :return: number of deleted records
+        """
+        deleted = self._purge_log([id for id, _ in batch], time_end)
+        if deleted is None:
+            return 0
+        for id, count in batch:
+            self._logcount_decrement(id, count)
+        return deleted
+
+
+    def _purge_log(self, ids, time_end):
+        """
+        Delete the log records of the given items, which are older than time_end
+
+        No direct commit - Commmit is done by the next call to _dump (to preserve SD cards)
+
+        :param ids: list of database IDs of the items
+        :param time_end: records older than this timestamp are deleted
+        :return: number of deleted records or None, if the records could not be deleted
+        """
+        if not self._db.lock(60):
+            self.logger.warning("_purge_log: Can't acquire lock - will try on next run")
+            return None
+        deleted = None
+        cur = self._db.cursor()
         try:
-            item_id = self.id(item, create=False)
-        except:
-            if item_id is None:
-                self.logger.info("remove_older_than_maxage: no id for item {}".format(item))
-            else:
-                self.logger.critical("remove_older_than_maxage: no id for item {}".format(item))
-            return
-        time_end = self.get_maxage_ts(item)
-        timestamp_end = self._timestamp(time_end)
-        self.logger.debug("remove_older_than_maxage: item = {} remove older than {}".format(item, time_end))
+            condition, params = self._id_list_condition(ids)
+            params['time_end'] = time_end
+            self._execute(self._prepare("DELETE FROM {log} WHERE " + condition + " AND time < :time_end;"), params, cur=cur)
+            deleted = cur.rowcount if cur.rowcount >= 0 else None
+            if self._rollups:
+                for id in ids:
+                    self._rollup_update(id, None, time_end - 1, cur=cur)
+        except Exception as e:
+            self.logger.error("_purge_log: Deleting records of items {} failed: {}".format(ids, e))
+        finally:
+            cur.close()
+            self._db.release()
+        for id in ids:
+            self._series_cache_invalidate(id)
+        return deleted
 
-        # delete Log entries, no direct commit - Commmit is done by the next call to _dump (to preserve SD cards)
-        self.deleteLog(item_id, time_end=timestamp_end, with_commit=False)
 
-        self._item_logcount[item_id] = self.readLogCount(item_id)
-        return
+    def _id_list_condition(self, ids):
+        """
+        Build a condition (and its parameters) to select the log records of a list of items
+
+        :param ids: list of database IDs of the items
+        :return: tuple of condition and parameters
+        """
+        params = {}
+        for index, id in enumerate(ids):
+            params['id_' + self._row_tag(index)] = id
+        return ("item_id IN (" + ", ".join([":" + name for name in params]) + ")", params)
+
+
+    def _logcount_decrement(self, id, count):
+        """
+        Update the number of log records of an item after a deletion (if it has been counted)
+        """
+        if id in self._item_logcount and self._item_logcount[id] is not None:
+            self._item_logcount[id] = max(self._item_logcount[id] - count, 0)
+
 
     def get_maxage_ts(self, item):
         """
@@ -1260,6 +1979,81 @@ class Database(SmartPlugin):
         return tuples
 
 
+    def _upsert_clause(self, keys, columns):
+        """
+        Return the driver specific clause to turn an INSERT into an upsert
+
+        :param keys: columns of the unique index
+        :param columns: columns to update, if a record with the same keys exists
+        :return: clause to append to the INSERT statement or None, if the driver is not supported
+        """
+        driver = self.driver.lower()
+        if driver == 'sqlite3':
+            return " ON CONFLICT(" + ", ".join(keys) + ") DO UPDATE SET " + \
+                   ", ".join(["{0} = excluded.{0}".format(col) for col in columns])
+        if driver in ['pymysql', 'mysqldb', 'mysql.connector']:
+            return " ON DUPLICATE KEY UPDATE " + ", ".join(["{0} = VALUES({0})".format(col) for col in columns])
+        return None
+
+
+    def _upsert(self, table, keys, columns, rows, cur):
+        """
+        Insert or update records in bulk
+
+        Writes the rows with multi-row INSERT statements of up to _bulk_chunk_size records. For
+        drivers without upsert support, every row is checked and updated or inserted separately.
+
+        :param table: name of the table ('log' or 'item')
+        :param keys: columns of the unique index of the table
+        :param columns: other columns to write
+        :param rows: list of dicts with the values for keys and columns
+        :param cur: A database cursor object
+        """
+        clause = self._upsert_clause(keys, columns)
+        all_columns = list(keys) + list(columns)
+        if clause is None:
+            for row in rows:
+                condition = " AND ".join(["{0} = :{0}".format(key) for key in keys])
+                if self._fetchone("SELECT COUNT(*) FROM {" + table + "} WHERE " + condition + ";", row, cur=cur)[0]:
+                    self._execute(self._prepare(
+                        "UPDATE {" + table + "} SET " + ", ".join(["{0} = :{0}".format(col) for col in columns]) +
+                        " WHERE " + condition + ";"), row, cur=cur)
+                else:
+                    self._execute(self._prepare(
+                        "INSERT INTO {" + table + "}(" + ", ".join(all_columns) + ") VALUES (" +
+                        ", ".join([":" + col for col in all_columns]) + ");"), row, cur=cur)
+            return
+
+        for offset in range(0, len(rows), self._bulk_chunk_size):
+            values = []
+            params = {}
+            for index, row in enumerate(rows[offset:offset + self._bulk_chunk_size]):
+                tag = self._row_tag(index)
+                values.append("(" + ", ".join([":{}_{}".format(col, tag) for col in all_columns]) + ")")
+                for col in all_columns:
+                    params['{}_{}'.format(col, tag)] = row[col]
+            self._execute(self._prepare(
+                "INSERT INTO {" + table + "}(" + ", ".join(all_columns) + ") VALUES " + ", ".join(values) + clause + ";"),
+                params, cur=cur)
+
+
+    def _row_tag(self, index):
+        """
+        Return a suffix for the parameter names of a row within a multi-row statement
+
+        Only letters are used, since parameter names have to match ':[a-z_]+'
+
+        :param index: index of the row
+        :return: suffix ('a', 'b', ..., 'z', 'ba', ...)
+        """
+        tag = ''
+        while True:
+            tag = chr(ord('a') + index % 26) + tag
+            index = index // 26
+            if index == 0:
+                return tag
+
+
     # ------------------------------------------
     #    conversion routines
     # ------------------------------------------
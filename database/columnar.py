@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# vim: set encoding=utf-8 tabstop=4 softtabstop=4 shiftwidth=4 expandtab
+#########################################################################
+#  Copyright 2016-     Oliver Hinckel                  github@ollisnet.de
+#  Based on ideas of sqlite plugin by Marcus Popp marcus@popp.mx
+#########################################################################
+#  This file is part of SmartHomeNG.
+#
+#  database plugin to run with SmartHomeNG version 1.7 and upwards.
+#
+#  SmartHomeNG is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  SmartHomeNG is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with SmartHomeNG. If not, see <http://www.gnu.org/licenses/>.
+#
+#########################################################################
+
+# Compact binary columnar format for database dumps
+#
+# The file starts with MAGIC and contains a sequence of row groups. Each row group
+# holds the log records of one item (one chunk of the dump):
+#
+#   'RGRP' | item_id (int64) | number of rows n (uint32) | item name (uint16 length + utf-8)
+#   followed by the columns time, duration, val_str, val_num, val_bool, changed
+#
+# Each column starts with n validity bytes (0 = NULL). Numeric columns follow with n values
+# (int64 for time/duration/changed, float64 for val_num, int8 for val_bool), val_str follows
+# with a uint32 length and the utf-8 bytes for every valid value. All values are little-endian.
+
+import array
+import struct
+import sys
+
+from .constants import *
+
+MAGIC = b'SHNGDB1\n'
+ROW_GROUP = b'RGRP'
+
+# column index, array typecode, NULL replacement
+_NUMERIC_COLUMNS = {
+    COL_LOG_TIME: ('q', 0),
+    COL_LOG_DURATION: ('q', 0),
+    COL_LOG_VAL_NUM: ('d', 0.0),
+    COL_LOG_VAL_BOOL: ('b', 0),
+    COL_LOG_CHANGED: ('q', 0),
+}
+_COLUMNS = [COL_LOG_TIME, COL_LOG_DURATION, COL_LOG_VAL_STR, COL_LOG_VAL_NUM, COL_LOG_VAL_BOOL, COL_LOG_CHANGED]
+
+
+def _to_le(values):
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values.tobytes()
+
+
+def _from_le(typecode, data):
+    values = array.array(typecode)
+    values.frombytes(data)
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
+
+
+def write_header(f):
+    """
+    Write the file header to a (binary) file
+    """
+    f.write(MAGIC)
+
+
+def write_row_group(f, item_id, item_name, rows):
+    """
+    Write the log records of one item as a row group
+
+    :param f: file opened in binary mode
+    :param item_id: database ID of the item
+    :param item_name: name of the item
+    :param rows: log records (columns as in COL_LOG)
+    """
+    name = str(item_name).encode('utf-8')
+    f.write(ROW_GROUP + struct.pack('<qIH', int(item_id), len(rows), len(name)) + name)
+    for col in _COLUMNS:
+        f.write(bytes([0 if row[col] is None else 1 for row in rows]))
+        if col == COL_LOG_VAL_STR:
+            for row in rows:
+                if row[col] is not None:
+                    value = str(row[col]).encode('utf-8')
+                    f.write(struct.pack('<I', len(value)) + value)
+        else:
+            typecode, null = _NUMERIC_COLUMNS[col]
+            convert = float if typecode == 'd' else int
+            f.write(_to_le(array.array(typecode, [null if row[col] is None else convert(row[col]) for row in rows])))
+
+
+def read_row_groups(f):
+    """
+    Read a dump file written in the columnar format
+
+    :param f: file opened in binary mode
+    :return: generator of (item_id, item_name, rows), rows with columns as in COL_LOG
+    """
+    if f.read(len(MAGIC)) != MAGIC:
+        raise ValueError("Not a columnar database dump")
+    while True:
+        head = f.read(len(ROW_GROUP) + struct.calcsize('<qIH'))
+        if len(head) == 0:
+            return
+        if head[:len(ROW_GROUP)] != ROW_GROUP:
+            raise ValueError("Corrupt row group in columnar database dump")
+        item_id, count, name_len = struct.unpack('<qIH', head[len(ROW_GROUP):])
+        item_name = f.read(name_len).decode('utf-8')
+        columns = {}
+        for col in _COLUMNS:
+            valid = f.read(count)
+            if col == COL_LOG_VAL_STR:
+                values = []
+                for flag in valid:
+                    if flag:
+                        length = struct.unpack('<I', f.read(4))[0]
+                        values.append(f.read(length).decode('utf-8'))
+                    else:
+                        values.append(None)
+            else:
+                typecode = _NUMERIC_COLUMNS[col][0]
+                data = _from_le(typecode, f.read(count * array.array(typecode).itemsize))
+                values = [value if flag else None for value, flag in zip(data, valid)]
+            columns[col] = values
+        rows = []
+        for index in range(count):
+            row = [None] * len(COL_LOG)
+            row[COL_LOG_ITEM_ID] = item_id
+            for col in _COLUMNS:
+                row[col] = columns[col][index]
+            rows.append(tuple(row))
+        yield (item_id, item_name, rows)
@@ -0,0 +1,169 @@
+import io
+import logging
+import os
+import tempfile
+import unittest
+
+from plugins.database import Database
+from plugins.database import columnar
+from plugins.database.constants import *
+
+
+def log_row(item_id, time, duration=None, val_str=None, val_num=None, val_bool=None, changed=None):
+    row = [None] * len(COL_LOG)
+    row[COL_LOG_TIME] = time
+    row[COL_LOG_ITEM_ID] = item_id
+    row[COL_LOG_DURATION] = duration
+    row[COL_LOG_VAL_STR] = val_str
+    row[COL_LOG_VAL_NUM] = val_num
+    row[COL_LOG_VAL_BOOL] = val_bool
+    row[COL_LOG_CHANGED] = changed
+    return tuple(row)
+
+
+class DumpDatabase(Database):
+    """
+    Database plugin with the log table in memory, only the methods used by dump() are provided
+    """
+
+    def __init__(self, items, logs, fail_after=None):
+        self.logger = logging.getLogger(__name__)
+        self._items = items
+        self._logs = logs
+        self.fail_after = fail_after        # number of chunks read before an error is raised
+        self.chunks = 0
+
+    def readItems(self, cur=None):
+        return list(self._items)
+
+    def readItem(self, id, cur=None):
+        return next((item for item in self._items if item[COL_ITEM_ID] == id), None)
+
+    def _read_log_chunk(self, id, last_time, chunk_size, time=None, time_start=None, time_end=None, changed=None,
+                        changed_start=None, changed_end=None, cur=None):
+        if self.fail_after is not None and self.chunks >= self.fail_after:
+            raise IOError("connection lost")
+        self.chunks += 1
+        rows = [row for row in self._logs if row[COL_LOG_ITEM_ID] == id and (last_time is None or row[COL_LOG_TIME] > last_time)]
+        return sorted(rows, key=lambda row: row[COL_LOG_TIME])[:chunk_size]
+
+
+class TestColumnar(unittest.TestCase):
+
+    def item(self, id, name):
+        item = [None] * len(COL_ITEM)
+        item[COL_ITEM_ID] = id
+        item[COL_ITEM_NAME] = name
+        return tuple(item)
+
+    def logs(self):
+        logs = []
+        for time in range(1, 8):
+            logs.append(log_row(1, time * 1000, 1000, None, time * 1.5, None, time * 1000 + 1))
+        logs.append(log_row(1, 9000, None, None, -0.25, None, None))
+        for time in range(1, 4):
+            logs.append(log_row(2, time * 1000, 1000, 'wert ä {}'.format(time), None, None, time * 1000))
+        logs.append(log_row(2, 5000, None, '', None, None, 5000))
+        for time in range(1, 6):
+            logs.append(log_row(3, time * 1000, 500, None, None, time % 2, time * 1000))
+        return logs
+
+    def items(self):
+        return [self.item(1, 'test.num'), self.item(2, 'test.str'), self.item(3, 'test.bool')]
+
+    def read(self, data):
+        return [(item_id, name, rows) for item_id, name, rows in columnar.read_row_groups(io.BytesIO(data))]
+
+    def rows(self, data):
+        return [row for _, _, rows in self.read(data) for row in rows]
+
+    def dumpfile(self):
+        (fd, name) = tempfile.mkstemp()
+        os.close(fd)
+        self.addCleanup(lambda: os.path.exists(name) and os.unlink(name))
+        self.addCleanup(lambda: os.path.exists(name + '.checkpoint') and os.unlink(name + '.checkpoint'))
+        return name
+
+    def test_round_trip(self):
+        rows = [log_row(7, 1000, 10, None, 1.25, None, 1001),
+                log_row(7, 2000, None, 'abc', None, None, None),
+                log_row(7, 3000, 0, None, None, 1, 3000),
+                log_row(7, 2 ** 40, -5, '€', -3.5, 0, 2 ** 41)]
+        f = io.BytesIO()
+        columnar.write_header(f)
+        columnar.write_row_group(f, 7, 'test.item', rows)
+        self.assertEqual([(7, 'test.item', rows)], self.read(f.getvalue()))
+
+    def test_empty_row_group(self):
+        f = io.BytesIO()
+        columnar.write_header(f)
+        columnar.write_row_group(f, 1, 'test.empty', [])
+        columnar.write_row_group(f, 2, 'test.item', [log_row(2, 1000, None, None, 1.0, None, None)])
+        self.assertEqual([(1, 'test.empty', []), (2, 'test.item', [log_row(2, 1000, None, None, 1.0, None, None)])],
+                         self.read(f.getvalue()))
+
+    def test_invalid_header(self):
+        with self.assertRaises(ValueError):
+            self.read(b'item_id;item_name\n')
+
+    def test_corrupt_row_group(self):
+        f = io.BytesIO()
+        columnar.write_header(f)
+        f.write(b'XXXX' + bytes(14))
+        with self.assertRaises(ValueError):
+            self.read(f.getvalue())
+
+    def test_dump_chunk_boundaries(self):
+        logs = self.logs()
+        expected = sorted(logs, key=lambda row: (row[COL_LOG_ITEM_ID], row[COL_LOG_TIME]))
+        # chunk sizes below, at and above the number of records of an item (8, 4, 5)
+        for chunk_size in [1, 3, 4, 5, 8, 100]:
+            name = self.dumpfile()
+            DumpDatabase(self.items(), logs).dump(name, format='columnar', chunk_size=chunk_size)
+            with open(name, 'rb') as f:
+                data = f.read()
+            self.assertEqual(expected, self.rows(data), "chunk_size {}".format(chunk_size))
+            groups = self.read(data)
+            self.assertTrue(all(len(rows) <= chunk_size for _, _, rows in groups))
+            self.assertEqual(['test.num', 'test.str', 'test.bool'], list(dict.fromkeys(name for _, name, _ in groups)))
+            self.assertFalse(os.path.exists(name + '.checkpoint'))
+
+    def test_dump_single_item(self):
+        name = self.dumpfile()
+        DumpDatabase(self.items(), self.logs()).dump(name, id=2, format='columnar', chunk_size=2)
+        with open(name, 'rb') as f:
+            rows = self.rows(f.read())
+        self.assertEqual([row for row in self.logs() if row[COL_LOG_ITEM_ID] == 2], rows)
+
+    def test_dump_resume(self):
+        logs = self.logs()
+        name = self.dumpfile()
+        DumpDatabase(self.items(), logs).dump(name, format='columnar', chunk_size=3)
+        with open(name, 'rb') as f:
+            expected = f.read()
+        # interrupt the dump after every possible number of chunks and resume it
+        for fail_after in range(1, 7):
+            name = self.dumpfile()
+            with self.assertRaises(IOError):
+                DumpDatabase(self.items(), logs, fail_after).dump(name, format='columnar', chunk_size=3)
+            self.assertTrue(os.path.exists(name + '.checkpoint'))
+            with open(name, 'ab') as f:
+                # a partly written row group after the checkpoint is discarded on resume
+                f.write(columnar.ROW_GROUP + b'\x01')
+            DumpDatabase(self.items(), logs).dump(name, format='columnar', chunk_size=3, resume=True)
+            with open(name, 'rb') as f:
+                self.assertEqual(expected, f.read(), "interrupted after {} chunks".format(fail_after))
+            self.assertFalse(os.path.exists(name + '.checkpoint'))
+
+    def test_resume_other_format(self):
+        logs = self.logs()
+        name = self.dumpfile()
+        with self.assertRaises(IOError):
+            DumpDatabase(self.items(), logs, 2).dump(name, format='csv', chunk_size=3)
+        DumpDatabase(self.items(), logs).dump(name, format='columnar', chunk_size=3, resume=True)
+        with open(name, 'rb') as f:
+            self.assertEqual(sorted(logs, key=lambda row: (row[COL_LOG_ITEM_ID], row[COL_LOG_TIME])), self.rows(f.read()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -24,10 +24,12 @@
 #  along with SmartHomeNG.py. If not, see <http://www.gnu.org/licenses/>.
 #########################################################################
 
+import collections
 import logging
 import struct
 import binascii
 import random
+import threading
 import time
 from datetime import timedelta
 import pathlib
@@ -41,6 +43,7 @@ from lib.shtime import Shtime
 
 from . import dpts
 from . import knxproj
+from .timingwheel import TimingWheel
 
 # types from knxd\src\include\eibtypes.h
 KNXD_OPEN_GROUPCON  = 38     # 0x26
@@ -56,6 +59,9 @@ KNXREAD = 0x00
 KNXRESP = 0x40
 KNXWRITE = 0x80
 
+# flags of a telegram as used in the statistics
+FLAGS = {KNXWRITE: 'write', KNXREAD: 'read', KNXRESP: 'response'}
+
 # attribute keywords
 KNX_DPT      = 'knx_dpt'          # data point type
 KNX_STATUS   = 'knx_status'       # status
@@ -113,7 +119,26 @@ class KNX(SmartPlugin):
         self.gar = {}                   # group addresses to reply if requested from knx, {DPT: dpt, ITEM: item, LOGIC: None}
         self._init_ga = []
         self._cache_ga = []             # group addresses which should be initalized by the knxd cache
-        self._cache_ga_response_pending = []
+        self._cache_ga_response_pending = set()  # cache reads without response, also changed by the read worker
+        self._cache_ga_response_lock = threading.Lock()
+        self._send_rate = self.get_parameter_value('send_rate')
+        self._send_writes = collections.OrderedDict()  # queued writes and reads by (flag, ga), {(flag, ga): (packet, time queued)}
+        self._send_responses = collections.deque()    # queued responses, sent before writes and reads
+        self._send_condition = threading.Condition()
+        self._send_thread = None
+        self._send_stats = {'sent': 0, 'coalesced': 0, 'latency_sum': 0.0, 'latency_max': 0.0}
+        self._read_rate = self.get_parameter_value('read_rate')
+        self._cache_timeout = self.get_parameter_value('cache_timeout')
+        self._read_wheel = None         # polls and cache read timeouts, only used if read_rate is set
+        self._read_ready = collections.deque()  # group addresses to read from the bus, one per tick of the read wheel
+        self._read_ready_ga = set()
+        self._read_thread = None
+        self._read_stats = {'reads': 0, 'fallback': 0}
+        if self._read_rate:
+            self._read_wheel = TimingWheel(1.0 / self._read_rate)
+        self._dispatch = None           # group addresses by raw 16 bit address for parse_telegram, built from gal and gar
+        self._ga_names = {}             # group addresses as string by raw 16 bit address
+        self._pa_names = {}             # physical address and source prefix by raw 16 bit address
         self.time_ga = self.get_parameter_value('time_ga')
         self.date_ga = self.get_parameter_value('date_ga')
         send_time = self.get_parameter_value('send_time')
@@ -221,7 +246,7 @@ class KNX(SmartPlugin):
         else:
             if self.logger.isEnabledFor(logging.DEBUG):
                 self.logger.debug(self.translate("groupwrite telegram for: {} - Value: {} sent.").format(ga,payload))
-            self._send(pkt)
+            self._queue_send(pkt, ga, flag)
 
     def _cacheread(self, ga):
         pkt = bytearray([0, KNXD_CACHE_READ])
@@ -243,7 +268,81 @@ class KNX(SmartPlugin):
             self.logger.warning(self.translate('problem encoding ga: {}').format(ga))
             return
         pkt.extend([0, KNXREAD])
-        self._send(pkt)
+        self._queue_send(pkt, ga, KNXREAD)
+
+    def _queue_send(self, pkt, ga, flag):
+        """
+        Sends a group packet or queues it if the send rate is limited
+
+        Queued writes and reads to the same group address are coalesced (the last value wins),
+        responses to read requests are sent before queued writes and reads.
+
+        :param pkt: group packet
+        :param ga: group address as string
+        :param flag: KNXWRITE, KNXRESP or KNXREAD
+        """
+        if not self._send_rate:
+            self._send(pkt)
+            return
+        with self._send_condition:
+            if flag == KNXRESP:
+                self._send_responses.append((pkt, time.time()))
+            else:
+                key = (flag, ga)
+                if key in self._send_writes:
+                    self._send_writes[key] = (pkt, self._send_writes[key][1])
+                    self._send_stats['coalesced'] += 1
+                else:
+                    self._send_writes[key] = (pkt, time.time())
+            self._send_condition.notify()
+
+    def _send_worker(self):
+        """
+        Sends the queued group packets with at most send_rate telegrams per second
+        """
+        interval = 1.0 / self._send_rate
+        next_send = 0
+        while self.alive:
+            with self._send_condition:
+                while self.alive and not self._send_responses and not self._send_writes:
+                    self._send_condition.wait()
+            if not self.alive:
+                break
+            delay = next_send - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            with self._send_condition:
+                if self._send_responses:
+                    pkt, queued = self._send_responses.popleft()
+                else:
+                    pkt, queued = self._send_writes.popitem(last=False)[1]
+            now = time.time()
+            self._send(pkt)
+            next_send = now + interval
+            latency = now - queued
+            self._send_stats['sent'] += 1
+            self._send_stats['latency_sum'] += latency
+            if latency > self._send_stats['latency_max']:
+                self._send_stats['latency_max'] = latency
+
+    def get_send_queue_stats(self):
+        """
+        returns the statistics of the send queue (only used if send_rate is configured)
+        ```
+        { 'depth': n,               # number of queued telegrams
+          'sent': n,                # telegrams sent through the queue
+          'coalesced': n,           # writes replaced by a newer value for the same ga before sending
+          'latency_avg': ms,        # average time in the queue
+          'latency_max': ms }       # maximum time in the queue
+        ```
+        :return: dict
+        """
+        stats = self._send_stats
+        return {'depth': len(self._send_responses) + len(self._send_writes),
+                'sent': stats['sent'],
+                'coalesced': stats['coalesced'],
+                'latency_avg': round(stats['latency_sum'] / stats['sent'] * 1000, 1) if stats['sent'] else 0,
+                'latency_max': round(stats['latency_max'] * 1000, 1)}
 
     def _poll(self, **kwargs):
         if ITEM in kwargs:
@@ -264,6 +363,69 @@ class KNX(SmartPlugin):
                                    value={'instance': self.get_instance_name(), ITEM: item, 'ga': ga, 'interval': interval},
                                    next=next)
 
+    def _queue_read(self, ga):
+        """
+        Queues a read from the bus for the read worker, a group address already queued is not added again
+        """
+        if ga not in self._read_ready_ga:
+            self._read_ready_ga.add(ga)
+            self._read_ready.append(ga)
+
+    def _read_worker(self):
+        """
+        Paces the reads from the bus for knx_init, knx_poll and unanswered knxd cache reads
+
+        With every tick of the read wheel (1/read_rate seconds) due polls are queued, cache reads without
+        response within cache_timeout fall back to a read from the bus and at most one read is sent.
+        """
+        tick = self._read_wheel.tick
+        next_tick = time.time()
+        while self.alive:
+            try:
+                for entry in self._read_wheel.advance():
+                    if entry[0] == KNX_POLL:
+                        item, ga, interval = entry[1:]
+                        self._queue_read(ga)
+                        self._read_wheel.add(entry, interval)
+                    else:
+                        ga = entry[1]
+                        with self._cache_ga_response_lock:
+                            if ga not in self._cache_ga_response_pending:
+                                continue
+                            self._cache_ga_response_pending.discard(ga)
+                        self._read_stats['fallback'] += 1
+                        self.logger.info(self.translate("No response from knxd cache for ga {} within {} seconds, reading from bus").format(ga, self._cache_timeout))
+                        self._queue_read(ga)
+                if self._read_ready and self._client.connected:
+                    ga = self._read_ready.popleft()
+                    self._read_ready_ga.discard(ga)
+                    self.groupread(ga)
+                    self._read_stats['reads'] += 1
+            except Exception as e:
+                self.logger.error("Error in read worker: {}".format(e))
+            next_tick += tick
+            delay = next_tick - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_tick = time.time()
+
+    def get_read_queue_stats(self):
+        """
+        returns the statistics of the read worker (only used if read_rate is configured)
+        ```
+        { 'queued': n,              # group addresses waiting to be read from the bus
+          'scheduled': n,           # polls and cache read timeouts in the read wheel
+          'reads': n,               # reads sent to the bus
+          'fallback': n }           # cache reads without response which were read from the bus
+        ```
+        :return: dict
+        """
+        return {'queued': len(self._read_ready),
+                'scheduled': len(self._read_wheel) if self._read_wheel is not None else 0,
+                'reads': self._read_stats['reads'],
+                'fallback': self._read_stats['fallback']}
+
     def _send_time(self):
         self.send_time(self.time_ga, self.date_ga)
 
@@ -287,10 +449,12 @@ class KNX(SmartPlugin):
         if self._cache_ga != []:
             if self.logger.isEnabledFor(logging.DEBUG):
                 self.logger.debug(self.translate('reading knxd cache'))
-            for ga in self._cache_ga:
-                self._cache_ga_response_pending.append(ga)
+            with self._cache_ga_response_lock:
+                self._cache_ga_response_pending.update(self._cache_ga)
             for ga in self._cache_ga:
                 self._cacheread(ga)
+                if self._read_wheel is not None:
+                    self._read_wheel.add(('cache', ga), self._cache_timeout)
                 # wait a little to not overdrive the knxd unless there is a fix
                 time.sleep(KNXD_CACHEREAD_DELAY)
             self._cache_ga = []
@@ -308,7 +472,10 @@ class KNX(SmartPlugin):
                 if self.logger.isEnabledFor(logging.DEBUG):
                     self.logger.debug(self.translate('knxd init read for {} ga').format(len(self._init_ga)))
                 for ga in self._init_ga:
-                    self.groupread(ga)
+                    if self._read_wheel is not None:
+                        self._queue_read(ga)
+                    else:
+                        self.groupread(ga)
                 self._init_ga = []
                 if self.logger.isEnabledFor(logging.DEBUG):
                     self.logger.debug(self.translate('finished knxd init read'))
@@ -368,8 +535,10 @@ class KNX(SmartPlugin):
             self._isLength = True
             client.terminator = 2
 
-        typ = struct.unpack(">H", data[0:2])[0]
-        if (typ != KNXD_GROUP_PACKET and typ != KNXD_CACHE_READ) or len(data) < 8:
+        if len(data) < 8:
+            return
+        typ = data[0] << 8 | data[1]
+        if typ != KNXD_GROUP_PACKET and typ != KNXD_CACHE_READ:
             #if self.logger.isEnabledFor(logging.DEBUG):
             #    self.logger.debug("Ignore telegram.")
             return
@@ -377,17 +546,28 @@ class KNX(SmartPlugin):
             if self.logger.isEnabledFor(logging.DEBUG):
                 self.logger.debug("Unknown APDU")
             return
-        src = self.decode(data[2:4], 'pa')
-        dst = self.decode(data[4:6], 'ga')
-        flg = data[7] & 0xC0
-        if flg == KNXWRITE:
-            flg = 'write'
-        elif flg == KNXREAD:
-            flg = 'read'
-        elif flg == KNXRESP:
-            flg = 'response'
+
+        dispatch = self._dispatch
+        if dispatch is None:
+            dispatch = self._compile_dispatch()
+        src_raw = data[2] << 8 | data[3]
+        dst_raw = data[4] << 8 | data[5]
+        try:
+            src, src_prefix = self._pa_names[src_raw]
+        except KeyError:
+            src, src_prefix = self._pa_name(src_raw)
+        entry = dispatch.get(dst_raw)
+        if entry is None:
+            dst = self._ga_names.get(dst_raw)
+            if dst is None:
+                dst = self._ga_names[dst_raw] = self.decode(data[4:6], 'ga')
+            listen = reply = None
         else:
-            self.logger.warning("Unknown flag: {:02x} src: {} dest: {}".format(flg, src, dst))
+            dst, dpt, decoder, listen, reply, dst_suffix = entry
+
+        flg = FLAGS.get(data[7] & 0xC0)
+        if flg is None:
+            self.logger.warning("Unknown flag: {:02x} src: {} dest: {}".format(data[7] & 0xC0, src, dst))
             return
         if len(data) == 8:
             payload = bytearray([data[7] & 0x3f])
@@ -396,33 +576,27 @@ class KNX(SmartPlugin):
 
         if self.enable_stats:
             # update statistics on used group addresses
-            if not dst in self.stats_ga:
-                self.stats_ga[dst] = {}
-
-            if not flg in self.stats_ga[dst]:
-                self.stats_ga[dst][flg] = 1
-            else:
-                self.stats_ga[dst][flg] = self.stats_ga[dst][flg] + 1
-            self.stats_ga[dst]['last_'+flg] = self.shtime.now()
+            now = self.shtime.now()
+            stats = self.stats_ga.get(dst)
+            if stats is None:
+                stats = self.stats_ga[dst] = {}
+            stats[flg] = stats.get(flg, 0) + 1
+            stats['last_' + flg] = now
 
             # update statistics on used physical addresses
-            if not src in self.stats_pa:
-                self.stats_pa[src] = {}
-
-            if not flg in self.stats_pa[src]:
-                self.stats_pa[src][flg] = 1
-            else:
-                self.stats_pa[src][flg] = self.stats_pa[src][flg] + 1
-            self.stats_pa[src]['last_'+flg] = self.shtime.now()
+            stats = self.stats_pa.get(src)
+            if stats is None:
+                stats = self.stats_pa[src] = {}
+            stats[flg] = stats.get(flg, 0) + 1
+            stats['last_' + flg] = now
 
         # further inspect what to do next
         if flg == 'write' or flg == 'response':
-            if dst not in self.gal:  # update item/logic
+            if listen is None:  # update item/logic
                 self._busmonitor(self._bm_format.format(self.get_instance_name(), src, dst, binascii.hexlify(payload).decode()))
                 return
-            dpt = self.gal[dst][DPT]
             try:
-                val = self.decode(payload, dpt)
+                val = decoder(payload)
             except Exception as e:
                 self.logger.exception("Problem decoding frame from {} to {} with '{}' and DPT {}. Exception: {}".format(src, dst, binascii.hexlify(payload).decode(), dpt, e))
                 return
@@ -436,23 +610,22 @@ class KNX(SmartPlugin):
 
                 # remove all ga that came from a cache read request
                 if typ == KNXD_CACHE_READ:
-                    if dst in self._cache_ga_response_pending:
-                        self._cache_ga_response_pending.remove(dst)
-                way = "" if typ != KNXD_CACHE_READ else " (from knxd Cache)"
-                if self.logger.isEnabledFor(logging.DEBUG):
+                    with self._cache_ga_response_lock:
+                        self._cache_ga_response_pending.discard(dst)
+                debug = self.logger.isEnabledFor(logging.DEBUG)
+                if debug:
+                    way = "" if typ != KNXD_CACHE_READ else " (from knxd Cache)"
                     self.logger.debug("{} request from {} to {} with '{}' and DPT {}{}".format(flg, src, dst, binascii.hexlify(payload).decode(), dpt, way))
-                src_wrk = self.get_instance_name()
-                if src_wrk != '':
-                    src_wrk += ':'
-                src_wrk += src + ':ga=' + dst
-                for item in self.gal[dst][ITEMS]:
-                    if self.logger.isEnabledFor(logging.DEBUG):
-                        self.logger.debug("Set Item '{}' to value '{}' caller='{}', source='{}', dest='{}'".format(item, val, self.get_shortname(), src, dst))
-                    item(val, self.get_shortname(), src_wrk, dst)
-                for logic in self.gal[dst][LOGICS]:
-                    if self.logger.isEnabledFor(logging.DEBUG):
-                        self.logger.debug("Trigger Logic '{}' from caller='{}', source='{}', value '{}', dest='{}'".format(logic, self.get_shortname(), src_wrk, val, dst))
-                    logic.trigger(self.get_shortname(), src_wrk, val, dst)
+                src_wrk = src_prefix + dst_suffix
+                caller = self.get_shortname()
+                for item in listen[ITEMS]:
+                    if debug:
+                        self.logger.debug("Set Item '{}' to value '{}' caller='{}', source='{}', dest='{}'".format(item, val, caller, src, dst))
+                    item(val, caller, src_wrk, dst)
+                for logic in listen[LOGICS]:
+                    if debug:
+                        self.logger.debug("Trigger Logic '{}' from caller='{}', source='{}', value '{}', dest='{}'".format(logic, caller, src_wrk, val, dst))
+                    logic.trigger(caller, src_wrk, val, dst)
             else:
                 self.logger.warning("Wrong payload '{2}' for ga '{1}' with dpt '{0}'.".format(dpt, dst, binascii.hexlify(payload).decode()))
             if self.enable_stats:
@@ -465,21 +638,59 @@ class KNX(SmartPlugin):
                 self.logger.debug("Device with physical address '{}' requests read for ga '{}'".format(src, dst))
             if self.enable_stats:
                 self.stats_last_read = self.shtime.now()
-            if dst in self.gar:  # read item
-                if self.gar[dst][ITEM] is not None:
-                    item = self.gar[dst][ITEM]
+            if reply is not None:  # read item
+                if reply[ITEM] is not None:
+                    item = reply[ITEM]
                     if self.logger.isEnabledFor(logging.DEBUG):
                         self.logger.debug("groupwrite value '{}' to ga '{}' as DPT '{}' as response".format(dst, item(), self.get_iattr_value(item.conf,KNX_DPT)))
                     self.groupwrite(dst, item(), self.get_iattr_value(item.conf,KNX_DPT), 'response')
-                if self.gar[dst][LOGIC] is not None:
-                    src_wrk = self.get_instance_name()
-                    if src_wrk != '':
-                        src_wrk += ':'
-                    src_wrk += src + ':ga=' + dst
+                if reply[LOGIC] is not None:
+                    src_wrk = src_prefix + dst_suffix
                     if self.logger.isEnabledFor(logging.DEBUG):
-                        self.logger.debug("Trigger Logic '{}' from caller='{}', source='{}', dest='{}'".format(self.gar[dst][LOGIC], self.get_shortname(), src_wrk, dst))
-                    self.gar[dst][LOGIC].trigger(self.get_shortname(), src_wrk, None, dst)
+                        self.logger.debug("Trigger Logic '{}' from caller='{}', source='{}', dest='{}'".format(reply[LOGIC], self.get_shortname(), src_wrk, dst))
+                    reply[LOGIC].trigger(self.get_shortname(), src_wrk, None, dst)
+
+    def _compile_dispatch(self):
+        """
+        Builds the dispatch table used by parse_telegram from the group addresses in gal and gar
+
+        The table is keyed by the raw 16 bit group address as found in the telegram. Each entry holds
+        the group address as string, the dpt with its decoder function from dpts, the gal entry with
+        the items and logics to update, the gar entry to answer read requests and the suffix for the
+        source string given to items and logics. parse_item and parse_logic reset the table, it is
+        rebuilt with the next telegram.
 
+        :return: dispatch table
+        """
+        dispatch = {}
+        for ga in set(self.gal) | set(self.gar):
+            try:
+                raw = struct.unpack(">H", bytes(self.encode(ga, 'ga')))[0]
+            except Exception:
+                self.logger.warning(self.translate('problem encoding ga: {}').format(ga))
+                continue
+            listen = self.gal.get(ga)
+            reply = self.gar.get(ga)
+            dpt = listen[DPT] if listen is not None else reply[DPT]
+            dst = self._ga_names[raw] = self.decode(struct.pack(">H", raw), 'ga')
+            dispatch[raw] = (dst, dpt, dpts.decode[str(dpt)], listen, reply, ':ga=' + dst)
+        self._dispatch = dispatch
+        return dispatch
+
+    def _pa_name(self, raw):
+        """
+        Decodes a raw physical address and caches it together with the prefix of the source
+        string given to items and logics
+
+        :param raw: physical address as 16 bit integer
+        :return: tuple of physical address as string and source prefix
+        """
+        pa = self.decode(struct.pack(">H", raw), 'pa')
+        prefix = self.get_instance_name()
+        if prefix != '':
+            prefix += ':'
+        self._pa_names[raw] = (pa, prefix + pa)
+        return self._pa_names[raw]
 
     def run(self):
         """
@@ -488,6 +699,14 @@ class KNX(SmartPlugin):
         if self.logger.isEnabledFor(logging.DEBUG):
             self.logger.debug("Plugin '{}': run method called".format(self.get_fullname()))
         self.alive = True
+        if self._send_rate:
+            self._send_thread = threading.Thread(target=self._send_worker, name='plugins.' + self.get_fullname() + '.send')
+            self._send_thread.daemon = True
+            self._send_thread.start()
+        if self._read_wheel is not None:
+            self._read_thread = threading.Thread(target=self._read_worker, name='plugins.' + self.get_fullname() + '.read')
+            self._read_thread.daemon = True
+            self._read_thread.start()
         self._client.connect()
 
 
@@ -498,6 +717,14 @@ class KNX(SmartPlugin):
         if self.logger.isEnabledFor(logging.DEBUG):
             self.logger.debug("Plugin '{}': stop method called".format(self.get_fullname()))
         self.alive = False
+        if self._send_thread is not None:
+            with self._send_condition:
+                self._send_condition.notify_all()
+            self._send_thread.join(2)
+            self._send_thread = None
+        if self._read_thread is not None:
+            self._read_thread.join(2)
+            self._read_thread = None
         self._client.close()
 
 
@@ -585,6 +812,9 @@ class KNX(SmartPlugin):
                     self.logger.warning(
                         "{} knx_reply ({}) already defined for {}".format( item.id(), ga, self.gar[ga][ITEM]))
 
+        # gal and gar changed: the dispatch table is rebuilt by the next parse_telegram
+        self._dispatch = None
+
         if self.has_iattr(item.conf, KNX_SEND):
             if isinstance(self.get_iattr_value(item.conf, KNX_SEND), str):
                 self.set_attr_value(item.conf, KNX_SEND, [self.get_iattr_value(item.conf, KNX_SEND), ])
@@ -604,9 +834,12 @@ class KNX(SmartPlugin):
                 self.logger.info(
                     "Item {} is polled on GA {} every {} seconds".format(item, poll_ga, poll_interval))
                 randomwait = random.randrange(15)
-                next = self.shtime.now() + timedelta(seconds=poll_interval + randomwait)
-                self._sh.scheduler.add('KNX poll {}'.format(item), self._poll,
-                                       value={ITEM: item, 'ga': poll_ga, 'interval': poll_interval}, next=next)
+                if self._read_wheel is not None:
+                    self._read_wheel.add((KNX_POLL, item, poll_ga, int(poll_interval)), int(poll_interval) + randomwait)
+                else:
+                    next = self.shtime.now() + timedelta(seconds=poll_interval + randomwait)
+                    self._sh.scheduler.add('KNX poll {}'.format(item), self._poll,
+                                           value={ITEM: item, 'ga': poll_ga, 'interval': poll_interval}, next=next)
             else:
                 self.logger.warning(
                     "Ignoring knx_poll for item {}: We need two parameters, one for the GA and one for the polling interval.".format(
@@ -662,6 +895,9 @@ class KNX(SmartPlugin):
                 else:
                     self.gar[ga] = {DPT: dpt, ITEM: None, LOGIC: logic}
 
+        # gal and gar changed: the dispatch table is rebuilt by the next parse_telegram
+        self._dispatch = None
+
 
     def update_item(self, item, caller=None, source=None, dest=None):
         """
@@ -857,7 +1093,8 @@ class KNX(SmartPlugin):
         So ideally no reminding ga should be left after a delay time of startup
         :return: list of group addresses that did not receive a cache read response
         """
-        return self._cache_ga_response_pending
+        with self._cache_ga_response_lock:
+            return sorted(self._cache_ga_response_pending)
 
 
 # ------------------------------------------
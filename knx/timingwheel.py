@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# vim: set encoding=utf-8 tabstop=4 softtabstop=4 shiftwidth=4 expandtab
+#########################################################################
+#  This file is part of SmartHomeNG.py.
+#  Visit:  https://github.com/smarthomeNG/
+#          https://knx-user-forum.de/forum/supportforen/smarthome-py
+#
+#  SmartHomeNG.py is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  SmartHomeNG.py is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with SmartHomeNG.py. If not, see <http://www.gnu.org/licenses/>.
+#########################################################################
+
+import math
+import threading
+
+
+class TimingWheel:
+    """
+    Hashed timing wheel
+
+    Time is divided into ticks of a fixed length. An entry is stored in the slot of the tick it is due
+    and is returned by advance() when that tick is reached. Entries further away than one turn of the
+    wheel stay in their slot for the next turns. Adding and advancing are O(1) (per slot entry), no
+    matter how many entries are waiting.
+    """
+
+    def __init__(self, tick, slots=1024):
+        """
+        :param tick: length of a tick in seconds
+        :param slots: number of slots of the wheel
+        """
+        self.tick = tick
+        self._slots = [[] for _ in range(slots)]
+        self._current = 0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._count
+
+    def add(self, entry, delay):
+        """
+        Add an entry which is due after the given delay (at least one tick)
+
+        :param entry: any object
+        :param delay: delay in seconds
+        """
+        with self._lock:
+            due = self._current + max(1, int(math.ceil(delay / self.tick)))
+            self._slots[due % len(self._slots)].append((due, entry))
+            self._count += 1
+
+    def advance(self):
+        """
+        Move the wheel one tick forward
+
+        :return: list of the entries due at the new tick
+        """
+        with self._lock:
+            self._current += 1
+            slot = self._slots[self._current % len(self._slots)]
+            if not slot:
+                return []
+            due = [entry for tick, entry in slot if tick <= self._current]
+            if due:
+                slot[:] = [(tick, entry) for tick, entry in slot if tick > self._current]
+                self._count -= len(due)
+            return due
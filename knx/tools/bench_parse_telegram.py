@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+# vim: set encoding=utf-8 tabstop=4 softtabstop=4 shiftwidth=4 expandtab
+#########################################################################
+#  This file is part of SmartHomeNG.py.
+#  Visit:  https://github.com/smarthomeNG/
+#          https://knx-user-forum.de/forum/supportforen/smarthome-py
+#
+#  SmartHomeNG.py is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  SmartHomeNG.py is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with SmartHomeNG.py. If not, see <http://www.gnu.org/licenses/>.
+#########################################################################
+
+"""
+Micro benchmark for KNX.parse_telegram
+
+Replays a recorded telegram stream through parse_telegram of the knx plugin without
+a connection to knxd and prints the time needed per telegram. The stream file contains
+one eibd/knxd telegram per line as hex string without the length prefix (type, source,
+destination, command/data), lines starting with # are ignored, e.g.
+
+    0027110a0a010081
+    00271103080300800c1a
+
+Every group address of the stream is registered with a dummy item, the dpt is guessed from
+the payload length. Without a stream file a random stream is generated.
+
+Has to be started from the base directory of SmartHomeNG:
+
+    python3 plugins/knx/tools/bench_parse_telegram.py -f telegrams.txt -r 20
+"""
+
+import argparse
+import logging
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..')))
+
+from plugins.knx import KNX, KNXD_GROUP_PACKET, KNXREAD, KNXWRITE, KNXRESP, ITEMS, LOGICS, DPT
+from plugins.knx import dpts
+
+
+class DummyItem:
+
+    def __init__(self, name):
+        self.name = name
+        self.updates = 0
+
+    def __call__(self, value=None, caller=None, source=None, dest=None):
+        self.updates += 1
+
+    def __str__(self):
+        return self.name
+
+
+class DummyClient:
+    terminator = 2
+
+
+class DummyTime:
+
+    def now(self):
+        return time.time()
+
+
+class BenchKNX(KNX):
+    """
+    KNX plugin without connection, only the attributes needed by parse_telegram are set
+    """
+
+    def __init__(self, enable_stats):
+        self.logger = logging.getLogger('knx_bench')
+        self.shtime = DummyTime()
+        self.gal = {}
+        self.gar = {}
+        self._dispatch = None
+        self._ga_names = {}
+        self._pa_names = {}
+        self._cache_ga_response_pending = set()
+        self._cache_ga_response_lock = threading.Lock()
+        self._isLength = True
+        self._bm_format = "BM': {1} set {2} to {3}"
+        self._busmonitor = self.logger.debug
+        self.enable_stats = enable_stats
+        self.stats_ga = {}
+        self.stats_pa = {}
+        self.stats_last_read = None
+        self.stats_last_write = None
+        self.stats_last_response = None
+
+    def get_instance_name(self):
+        return ''
+
+    def get_shortname(self):
+        return 'knx'
+
+    def groupwrite(self, ga, payload, dpt, flag='write'):
+        pass
+
+
+def guess_dpt(payload_len):
+    """
+    Guess a dpt from the length of the telegram (including the command byte)
+    """
+    return {2: '1', 3: '5', 4: '9', 5: '10', 6: '14'}.get(payload_len, '16')
+
+
+def read_stream(filename):
+    telegrams = []
+    with open(filename, 'r') as f:
+        for line in f:
+            line = line.strip().replace(' ', '')
+            if line == '' or line.startswith('#'):
+                continue
+            telegrams.append(bytes.fromhex(line))
+    return telegrams
+
+
+def random_stream(count, ga_count, seed=0):
+    rnd = random.Random(seed)
+    gas = [rnd.randrange(0x0800, 0x7fff) for _ in range(ga_count)]
+    payloads = [b'', b'\x80', b'\x0c\x1a', b'\x10\x20\x30', b'\x41\x20\x00\x00']
+    telegrams = []
+    for _ in range(count):
+        ga = rnd.choice(gas)
+        payload = payloads[ga % len(payloads)]
+        flag = rnd.choice([KNXWRITE, KNXWRITE, KNXWRITE, KNXRESP, KNXREAD])
+        if payload == b'' or flag == KNXREAD:
+            apci = bytes([0, flag | (rnd.randrange(2) if flag != KNXREAD else 0)])
+            payload = b''
+        else:
+            apci = bytes([0, flag])
+        telegrams.append(KNXD_GROUP_PACKET.to_bytes(2, 'big') + rnd.randrange(0x1100, 0x11ff).to_bytes(2, 'big') + ga.to_bytes(2, 'big') + apci + payload)
+    return telegrams
+
+
+def register(plugin, telegrams, unknown):
+    """
+    Register a dummy item for every group address of the stream (but a share of unknown ones)
+    """
+    items = []
+    for telegram in telegrams:
+        ga = dpts.dega(telegram[4:6])
+        if ga in plugin.gal or telegram[7] & 0xC0 == KNXREAD or int.from_bytes(telegram[4:6], 'big') % 100 < unknown:
+            continue
+        item = DummyItem('bench.' + ga.replace('/', '_'))
+        plugin.gal[ga] = {DPT: guess_dpt(len(telegram) - 6), ITEMS: [item], LOGICS: []}
+        items.append(item)
+    return items
+
+
+def replay(plugin, telegrams, rounds):
+    client = DummyClient()
+    parse = plugin.parse_telegram
+    frames = []
+    for telegram in telegrams:
+        frames.append(len(telegram).to_bytes(2, 'big'))
+        frames.append(telegram)
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for frame in frames:
+            parse(client, frame)
+    return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Replays a telegram stream through KNX.parse_telegram')
+    parser.add_argument('-f', '--file', dest='file', help='file with recorded telegrams (hex, one per line)')
+    parser.add_argument('-n', '--count', dest='count', type=int, default=10000, help='number of random telegrams if no file is given')
+    parser.add_argument('-g', '--gas', dest='gas', type=int, default=3000, help='number of random group addresses if no file is given')
+    parser.add_argument('-r', '--rounds', dest='rounds', type=int, default=10, help='number of times the stream is replayed')
+    parser.add_argument('-u', '--unknown', dest='unknown', type=int, default=10, help='percentage of group addresses without item')
+    parser.add_argument('--no-stats', dest='stats', action='store_false', help='disable the statistics of the plugin')
+    args = parser.parse_args()
+
+    if args.file:
+        telegrams = read_stream(args.file)
+    else:
+        telegrams = random_stream(args.count, args.gas)
+    if len(telegrams) == 0:
+        print('No telegrams to replay')
+        sys.exit(1)
+
+    plugin = BenchKNX(args.stats)
+    items = register(plugin, telegrams, args.unknown)
+    replay(plugin, telegrams[:100], 1)  # warm up, builds the dispatch table
+
+    duration = replay(plugin, telegrams, args.rounds)
+    total = len(telegrams) * args.rounds
+    print("{} telegrams ({} group addresses, {} with item) replayed {} times".format(len(telegrams), len({telegram[4:6] for telegram in telegrams}), len(items), args.rounds))
+    print("{:.3f} s, {:.2f} µs per telegram, {:.0f} telegrams/s".format(duration, duration / total * 1000000, total / duration))
+    print("{} item updates".format(sum(item.updates for item in items)))
@@ -0,0 +1,461 @@
+#!/usr/bin/env python3
+# vim: set encoding=utf-8 tabstop=4 softtabstop=4 shiftwidth=4 expandtab
+#########################################################################
+#  This file is part of SmartHomeNG.py.
+#  Visit:  https://github.com/smarthomeNG/
+#          https://knx-user-forum.de/forum/supportforen/smarthome-py
+#
+#  SmartHomeNG.py is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  SmartHomeNG.py is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with SmartHomeNG.py. If not, see <http://www.gnu.org/licenses/>.
+#########################################################################
+
+"""
+Fake knxd to replay busmonitor logs
+
+A TCP server which speaks the eibd/knxd protocol as far as the knx plugin uses it (2 byte length,
+2 byte type, group packets, group connection, cache enable/read). It replays a log written by the
+'knx_busmonitor' logger (plugin parameter busmonitor: logger, format instance;source;destination;value)
+with a fixed rate or with the timing of the log and reports the telegrams per second and the frames
+which had to be dropped because the client did not read fast enough.
+
+The busmonitor log contains decoded values for group addresses the plugin knows and the hex payload
+for all others. To encode the values the dpt of the group addresses can be given in a file with one
+'ga;dpt' per line, otherwise the dpt is guessed from the value.
+
+Standalone, SmartHomeNG is configured to use the fake knxd as host/port of the knx plugin:
+
+    python3 fake_knxd.py -l var/log/knx_busmonitor.log -p 6720 -r 200
+
+With --measure the fake knxd is connected to the knx plugin (parse_telegram with a dummy item for every
+group address) within the same process and the item update latency is reported as well. This has to be
+started from the base directory of SmartHomeNG:
+
+    python3 plugins/knx/tools/fake_knxd.py -l var/log/knx_busmonitor.log -d dpts.txt -r 0 --measure
+"""
+
+import argparse
+import ast
+import binascii
+import datetime
+import os
+import queue
+import re
+import socket
+import struct
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import dpts
+
+# types from knxd\src\include\eibtypes.h
+KNXD_OPEN_GROUPCON  = 38     # 0x26
+KNXD_GROUP_PACKET   = 39     # 0x27
+KNXD_CACHE_ENABLE   = 112    # 0x70
+KNXD_CACHE_DISABLE  = 113    # 0x71
+KNXD_CACHE_READ     = 116    # 0x74
+
+KNXWRITE = 0x80
+
+BM_LINE = re.compile(r'(\d+\.\d+\.\d+);(\d+/\d+/\d+);(.*)$')
+BM_TIME = re.compile(r'^(\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}:\d{2})(?:[.,](\d+))?')
+
+
+def read_dpts(filename):
+    """
+    Read the dpt of the group addresses, one 'ga;dpt' per line
+    """
+    result = {}
+    with open(filename, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if line == '' or line.startswith('#'):
+                continue
+            ga, dpt = re.split(r'[;,= \t]+', line, maxsplit=1)
+            result[ga] = dpt.strip()
+    return result
+
+
+def guess_dpt(value):
+    if isinstance(value, bool):
+        return '1'
+    if isinstance(value, int):
+        return '5' if 0 <= value <= 255 else '13'
+    if isinstance(value, float):
+        return '9'
+    if isinstance(value, str):
+        return '16'
+    return None
+
+
+def encode_value(ga, value, ga_dpts):
+    """
+    Encode a value from the busmonitor log to the data of a group packet (command byte and payload)
+
+    :return: tuple of bytes (None if the value could not be encoded) and dpt (None for a hex payload)
+    """
+    dpt = ga_dpts.get(ga)
+    if dpt is None and re.fullmatch(r'([0-9a-f]{2})+', value):
+        # hex payload of a group address unknown to the plugin
+        payload = binascii.unhexlify(value)
+        if len(payload) == 1 and payload[0] <= 0x3f:
+            return bytes([0, KNXWRITE | payload[0]]), None
+        return bytes([0, KNXWRITE]) + payload, None
+    if dpt is not None and dpt in ('10', '11'):
+        fmt = '%H:%M:%S' if dpt == '10' else '%Y-%m-%d'
+        try:
+            value = datetime.datetime.strptime(value, fmt)
+            value = value.time() if dpt == '10' else value.date()
+        except ValueError:
+            return None, dpt
+    else:
+        try:
+            value = ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            pass
+        if dpt is None:
+            dpt = guess_dpt(value)
+    if dpt is None or dpt not in dpts.encode:
+        return None, dpt
+    try:
+        data = bytearray(dpts.encode[dpt](value))
+    except Exception:
+        return None, dpt
+    data[0] |= KNXWRITE
+    return bytes([0]) + bytes(data), dpt
+
+
+def read_busmonitor(filename, ga_dpts):
+    """
+    Read a busmonitor log
+
+    :return: list of (timestamp or None, telegram without length), the number of skipped lines and
+             the dpt of the group addresses with decoded values (known to the plugin)
+    """
+    telegrams = []
+    skipped = 0
+    known = {}
+    with open(filename, 'r', encoding='utf-8') as f:
+        for line in f:
+            match = BM_LINE.search(line.rstrip('\r\n'))
+            if match is None:
+                continue
+            src, ga, value = match.groups()
+            data, dpt = encode_value(ga, value, ga_dpts)
+            if dpt is not None:
+                known.setdefault(ga, dpt)
+            if data is None:
+                skipped += 1
+                continue
+            ts = None
+            tmatch = BM_TIME.match(line)
+            if tmatch:
+                ts = datetime.datetime.strptime(tmatch.group(1).replace('T', ' '), '%Y-%m-%d %H:%M:%S').timestamp()
+                if tmatch.group(2):
+                    ts += float('0.' + tmatch.group(2))
+            pa = [int(x) for x in src.split('.')]
+            telegram = struct.pack('>HHH', KNXD_GROUP_PACKET, pa[0] << 12 | pa[1] << 8 | pa[2], struct.unpack('>H', bytes(dpts.enga(ga)))[0]) + data
+            telegrams.append((ts, telegram))
+    return telegrams, skipped, known
+
+
+class Connection:
+    """
+    Connection of a client to the fake knxd
+
+    Telegrams to send are put into a bounded queue which is written to the socket by a sender thread,
+    if the queue is full the telegram is dropped (as knxd does for slow clients).
+    """
+
+    def __init__(self, server, sock, queue_size):
+        self.server = server
+        self.sock = sock
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.groupcon = threading.Event()
+        self.sent = 0
+        self.dropped = 0
+        self.sent_times = []
+        self.received = []
+        self.alive = True
+        threading.Thread(target=self._read, daemon=True).start()
+        threading.Thread(target=self._write, daemon=True).start()
+
+    def _recv(self, size):
+        data = b''
+        while len(data) < size:
+            chunk = self.sock.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError('connection closed')
+            data += chunk
+        return data
+
+    def _read(self):
+        try:
+            while self.alive:
+                length = struct.unpack('>H', self._recv(2))[0]
+                data = self._recv(length)
+                typ = struct.unpack('>H', data[0:2])[0]
+                if typ == KNXD_OPEN_GROUPCON:
+                    self.send_frame(struct.pack('>H', KNXD_OPEN_GROUPCON))
+                    self.groupcon.set()
+                elif typ in (KNXD_CACHE_ENABLE, KNXD_CACHE_DISABLE):
+                    self.send_frame(struct.pack('>H', typ))
+                elif typ == KNXD_CACHE_READ:
+                    telegram = self.server.cache.get(data[2:4])
+                    if telegram is not None:
+                        self.send_frame(struct.pack('>H', KNXD_CACHE_READ) + telegram[2:])
+                elif typ == KNXD_GROUP_PACKET:
+                    self.received.append(data)
+        except (ConnectionError, OSError):
+            pass
+        self.close()
+
+    def _write(self):
+        try:
+            while self.alive:
+                frame = self.queue.get()
+                if frame is None:
+                    break
+                self.sock.sendall(frame)
+        except OSError:
+            pass
+        self.close()
+
+    def send_frame(self, data):
+        """
+        Queue a frame for the client, returns False if the frame was dropped
+        """
+        try:
+            self.queue.put_nowait(struct.pack('>H', len(data)) + data)
+        except queue.Full:
+            self.dropped += 1
+            return False
+        self.sent += 1
+        return True
+
+    def send_telegram(self, telegram):
+        now = time.perf_counter()
+        if self.send_frame(telegram):
+            self.sent_times.append(now)
+
+    def close(self):
+        if self.alive:
+            self.alive = False
+            try:
+                self.queue.put_nowait(None)
+            except queue.Full:
+                pass
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+
+
+class FakeKnxd:
+    """
+    TCP server replaying telegrams to all clients with an open group connection
+    """
+
+    def __init__(self, host='127.0.0.1', port=6720, queue_size=1000):
+        self.queue_size = queue_size
+        self.connections = []
+        self.cache = {}
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._sock.bind((host, port))
+        self._sock.listen(5)
+        self.port = self._sock.getsockname()[1]
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try:
+                sock, addr = self._sock.accept()
+            except OSError:
+                return
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.connections.append(Connection(self, sock, self.queue_size))
+
+    def wait_for_client(self, timeout=None):
+        start = time.time()
+        while timeout is None or time.time() - start < timeout:
+            if any(conn.groupcon.is_set() for conn in self.connections if conn.alive):
+                return True
+            time.sleep(0.05)
+        return False
+
+    def replay(self, telegrams, rate=0, speed=None, loops=1):
+        """
+        Send the telegrams to all clients with an open group connection
+
+        :param telegrams: list of (timestamp or None, telegram)
+        :param rate: telegrams per second, 0 for as fast as possible
+        :param speed: replay with the timing of the log, 2.0 is twice as fast (needs timestamps)
+        :param loops: number of times the telegrams are replayed
+        :return: duration in seconds
+        """
+        start = time.perf_counter()
+        count = 0
+        for _ in range(loops):
+            first = None
+            loop_start = time.perf_counter()
+            for ts, telegram in telegrams:
+                if speed and ts is not None:
+                    if first is None:
+                        first = ts
+                    due = loop_start + (ts - first) / speed
+                elif rate:
+                    due = start + count / rate
+                else:
+                    due = None
+                if due is not None:
+                    delay = due - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                self.cache[telegram[4:6]] = telegram
+                for conn in self.connections:
+                    if conn.alive and conn.groupcon.is_set():
+                        conn.send_telegram(telegram)
+                count += 1
+        return time.perf_counter() - start
+
+    def close(self):
+        self._sock.close()
+        for conn in self.connections:
+            conn.close()
+
+
+def measure(server, telegrams, ga_dpts, args):
+    """
+    Connect the knx plugin to the fake knxd within this process and measure the item update latency
+    """
+    from bench_parse_telegram import BenchKNX, DummyItem
+    from plugins.knx import ITEMS, LOGICS, DPT
+
+    class LatencyItem(DummyItem):
+        last = None
+
+        def __call__(self, value=None, caller=None, source=None, dest=None):
+            self.updates += 1
+            self.last = time.perf_counter()
+
+    class Client:
+        terminator = 2
+
+    plugin = BenchKNX(True)
+    for ga, dpt in ga_dpts.items():
+        plugin.gal[ga] = {DPT: dpt, ITEMS: [LatencyItem('bench.' + ga.replace('/', '_'))], LOGICS: []}
+
+    client = Client()
+    sock = socket.create_connection(('127.0.0.1', server.port))
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    sock.sendall(bytes([0, 5, 0, KNXD_OPEN_GROUPCON, 0, 0, 0]))
+    result = {'received': 0, 'updated': 0, 'missed': 0, 'latency': [], 'end': None}
+
+    def receive():
+        f = sock.makefile('rb')
+        index = -1
+        try:
+            while True:
+                data = f.read(client.terminator)
+                if len(data) < client.terminator:
+                    return
+                body = not plugin._isLength
+                item = None
+                if body and len(data) >= 8 and struct.unpack('>H', data[0:2])[0] == KNXD_GROUP_PACKET:
+                    index += 1
+                    result['received'] += 1
+                    listen = plugin.gal.get(dpts.dega(data[4:6]))
+                    if listen is not None:
+                        item = listen[ITEMS][0]
+                        before = item.updates
+                plugin.parse_telegram(client, data)
+                if body:
+                    result['end'] = time.perf_counter()
+                if item is not None:
+                    if item.updates > before:
+                        result['updated'] += 1
+                        result['latency'].append(item.last - conn.sent_times[index])
+                    else:
+                        result['missed'] += 1
+        except (OSError, ValueError):
+            return
+
+    if not server.wait_for_client(5):
+        print('Measuring client did not connect')
+        return
+    conn = [c for c in server.connections if c.groupcon.is_set()][0]
+    receiver = threading.Thread(target=receive, daemon=True)
+    receiver.start()
+
+    server.replay(telegrams, args.rate, args.speed, args.loops)
+    deadline = time.time() + 10
+    while result['received'] < len(conn.sent_times) and time.time() < deadline:
+        time.sleep(0.05)
+    sock.close()
+    receiver.join(1)
+
+    start = conn.sent_times[0] if conn.sent_times else time.perf_counter()
+    duration = (result['end'] or time.perf_counter()) - start
+    print("{} telegrams sent, {} dropped by fake knxd, {} received by plugin".format(len(conn.sent_times), conn.dropped, result['received']))
+    if duration > 0:
+        print("{:.0f} telegrams/s processed by plugin".format(result['received'] / duration))
+    print("{} item updates, {} telegrams for known group addresses without item update".format(result['updated'], result['missed']))
+    latency = sorted(result['latency'])
+    if latency:
+        print("item update latency: avg {:.3f} ms, median {:.3f} ms, 95% {:.3f} ms, max {:.3f} ms".format(
+            sum(latency) / len(latency) * 1000, latency[len(latency) // 2] * 1000,
+            latency[int(len(latency) * 0.95)] * 1000, latency[-1] * 1000))
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Fake knxd replaying a knx busmonitor log')
+    parser.add_argument('-l', '--log', dest='log', required=True, help='busmonitor log written by the knx_busmonitor logger')
+    parser.add_argument('-d', '--dpts', dest='dpts', help="file with 'ga;dpt' per line to encode the values of the log")
+    parser.add_argument('-H', '--host', dest='host', default='127.0.0.1', help='address to listen on')
+    parser.add_argument('-p', '--port', dest='port', type=int, default=6720, help='port to listen on (0 for any free port)')
+    parser.add_argument('-r', '--rate', dest='rate', type=float, default=50, help='telegrams per second, 0 for as fast as possible')
+    parser.add_argument('-s', '--speed', dest='speed', type=float, help='replay with the timing of the log, multiplied by this factor (overrides --rate)')
+    parser.add_argument('-n', '--loops', dest='loops', type=int, default=1, help='number of times the log is replayed')
+    parser.add_argument('-q', '--queue', dest='queue', type=int, default=1000, help='frames queued per client before dropping')
+    parser.add_argument('-w', '--wait', dest='wait', type=float, default=60, help='seconds to wait for a client to connect')
+    parser.add_argument('--measure', dest='measure', action='store_true', help='connect the knx plugin within this process and measure latency')
+    args = parser.parse_args()
+
+    ga_dpts = read_dpts(args.dpts) if args.dpts else {}
+    telegrams, skipped, known = read_busmonitor(args.log, ga_dpts)
+    print("{} telegrams read from {}, {} lines skipped (value could not be encoded)".format(len(telegrams), args.log, skipped))
+    if not telegrams:
+        sys.exit(1)
+
+    server = FakeKnxd(args.host, 0 if args.measure else args.port, args.queue)
+    try:
+        if args.measure:
+            sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..')))
+            measure(server, telegrams, known, args)
+        else:
+            print("fake knxd listening on {}:{}".format(args.host, server.port))
+            if not server.wait_for_client(args.wait):
+                print('No client opened a group connection')
+                sys.exit(1)
+            duration = server.replay(telegrams, args.rate, args.speed, args.loops)
+            total = len(telegrams) * args.loops
+            time.sleep(1)
+            print("{} telegrams replayed in {:.3f} s ({:.0f} telegrams/s)".format(total, duration, total / duration if duration else 0))
+            for conn in server.connections:
+                print("client: {} sent, {} dropped, {} group packets received".format(len(conn.sent_times), conn.dropped, len(conn.received)))
+    finally:
+        server.close()
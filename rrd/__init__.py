@@ -30,9 +30,12 @@ from lib.module import Modules
 from lib.model.smartplugin import *
 from lib.item import Items
 
+import concurrent.futures
 import datetime
 import functools
 import os
+import threading
+import time
 
 try:
     import rrdtool
@@ -79,6 +82,23 @@ class RRD(SmartPlugin):
 
         self._rrds = {}
         self.step = self.get_parameter_value('step')
+        self.flush_interval = self.get_parameter_value('flush_interval')
+        self.rrdcached = self.get_parameter_value('rrdcached')
+
+        # values sampled by _update_cycle, written by the writer thread: rrdb -> list of (timestamp, value)
+        self._buffer = {}
+        self._buffer_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._flush_event = threading.Event()
+        self._writer = None
+        self._last_flush = time.time()
+        self.flush_stats = {'count': 0, 'last': None, 'duration': 0.0, 'max_duration': 0.0, 'files': 0, 'values': 0, 'errors': 0}
+
+        # the results of fetches are cached until the next step:
+        # query -> (valid until, future of rrdtool.fetch)
+        self._fetch_cache = {}
+        self._fetch_lock = threading.Lock()
+        self.fetch_stats = {'fetches': 0, 'hits': 0}
 
         # Initialization code goes here
         if not REQUIRED_PACKAGE_IMPORTED:
@@ -100,6 +120,9 @@ class RRD(SmartPlugin):
             rrd = self._rrds[itempath]
             if not os.path.isfile(rrd['rrdb']):
                 self._create(rrd)
+        self._writer = threading.Thread(target=self._write_loop, name='plugins.' + self.get_fullname() + '.writer')
+        self._writer.daemon = True
+        self._writer.start()
         offset = 100  # wait 100 seconds for 1-Wire to update values
         self.scheduler_add('RRDtool', self._update_cycle, cycle=self.step, offset=offset, prio=5)
 
@@ -111,6 +134,14 @@ class RRD(SmartPlugin):
         self.logger.debug("Stop method called")
         self.scheduler_remove('RRDtool')
         self.alive = False
+        self._flush_event.set()
+        if self._writer is not None:
+            self._writer.join(30)
+            self._writer = None
+        # write values sampled after the writer thread has finished
+        self._flush()
+        with self._fetch_lock:
+            self._fetch_cache = {}
 
     def parse_item(self, item):
         """
@@ -163,21 +194,127 @@ class RRD(SmartPlugin):
                 item.set(last, 'RRDtool')
 
     def _update_cycle(self):
-        for itempath in self._rrds:
-            rrd = self._rrds[itempath]
-            if rrd['type'] == 'GAUGE':
-                value = 'N:' + str(float(rrd['item']()))
-            else:  # 'COUNTER'
-                value = 'N:' + str(int(rrd['step'] * rrd['item']()))
+        """
+        Samples the values of all items into the buffer (called by the scheduler every step).
+        The values are written by the writer thread, every flush_interval seconds
+        """
+        now = int(time.time())
+        with self._buffer_lock:
+            for itempath in self._rrds:
+                rrd = self._rrds[itempath]
+                try:
+                    if rrd['type'] == 'GAUGE':
+                        value = str(float(rrd['item']()))
+                    else:  # 'COUNTER'
+                        value = str(int(rrd['step'] * rrd['item']()))
+                except Exception as e:
+                    self.logger.warning("RRD: error reading value of {}: {}".format(itempath, e))
+                    continue
+                values = self._buffer.setdefault(rrd['rrdb'], [])
+                # rrdtool needs increasing timestamps per file, e.g. several items with the same rrd_ds_name
+                if values and values[-1][0] >= now:
+                    values[-1] = (now, value)
+                else:
+                    values.append((now, value))
+        if time.time() - self._last_flush >= self.flush_interval:
+            self._flush_event.set()
+
+    def _write_loop(self):
+        """
+        Writer thread: flushes the buffer when _update_cycle signals that the flush interval is over
+        """
+        while self.alive:
+            self._flush_event.wait()
+            self._flush_event.clear()
+            if not self.alive:
+                break
+            self._flush()
+
+    def _flush(self, rrdb=None):
+        """
+        Writes the buffered values with one rrdtool.update call per rrd file. The duration of writing
+        all files is recorded in flush_stats
+
+        :param rrdb: only write the values of this rrd file (e.g. before reading it), all files if None
+        """
+        with self._flush_lock:
+            with self._buffer_lock:
+                if rrdb is None:
+                    pending = self._buffer
+                    self._buffer = {}
+                    self._last_flush = time.time()
+                else:
+                    pending = {rrdb: self._buffer.pop(rrdb)} if rrdb in self._buffer else {}
+            if not pending:
+                return
+            start = time.perf_counter()
+            values = 0
+            errors = 0
+            for file, updates in pending.items():
+                try:
+                    rrdtool.update(file, *self._daemon_args(), *['{}:{}'.format(ts, value) for ts, value in updates])
+                    values += len(updates)
+                except Exception as e:
+                    errors += 1
+                    self.logger.warning("RRD: error updating {}: {}".format(file, e))
+            duration = time.perf_counter() - start
+            with self._fetch_lock:
+                for query in [query for query in self._fetch_cache if query[0] in pending]:
+                    del self._fetch_cache[query]
+            if rrdb is None:
+                stats = self.flush_stats
+                stats['count'] += 1
+                stats['last'] = self.get_sh().now()
+                stats['duration'] = duration
+                stats['max_duration'] = max(stats['max_duration'], duration)
+                stats['files'] = len(pending)
+                stats['values'] = values
+            self.flush_stats['errors'] += errors
+        self.logger.debug("RRD: wrote {} values to {} files in {:.3f} s".format(values, len(pending), duration))
+
+    def _fetch(self, rrd, query):
+        """
+        Runs rrdtool.fetch in the calling thread. The result is cached until the next step of the rrd (or until new
+        values are written to the file), identical queries running at the same time wait for the first one.
+
+        :param rrd: dict of the rrd to read
+        :param query: list of arguments for rrdtool.fetch, starting with the file and the consolidation function
+        :return: tuple of meta data, data source names and rows as returned by rrdtool.fetch
+        """
+        self._flush(rrd['rrdb'])
+        key = tuple(query)
+        now = time.time()
+        with self._fetch_lock:
+            cached = self._fetch_cache.get(key)
+            if cached is not None and cached[0] > now:
+                self.fetch_stats['hits'] += 1
+                future = cached[1]
+                owner = False
+            else:
+                for expired in [query for query, value in self._fetch_cache.items() if value[0] <= now]:
+                    del self._fetch_cache[expired]
+                future = concurrent.futures.Future()
+                owner = True
+                self._fetch_cache[key] = ((now // rrd['step'] + 1) * rrd['step'], future)
+                self.fetch_stats['fetches'] += 1
+        if owner:
             try:
-                rrdtool.update(
-                    rrd['rrdb'],
-                    value
-                )
+                future.set_result(rrdtool.fetch(*query))
             except Exception as e:
-                self.logger.warning("RRD: error updating {}: {}".format(itempath, e))
-                continue
-
+                future.set_exception(e)
+        try:
+            return future.result(60)
+        except Exception:
+            with self._fetch_lock:
+                if key in self._fetch_cache and self._fetch_cache[key][1] is future:
+                    del self._fetch_cache[key]
+            raise
+
+    def _daemon_args(self):
+        """
+        Returns the arguments to use a rrdcached daemon for updates and reads, if one is configured
+        """
+        return ['--daemon', self.rrdcached] if self.rrdcached else []
 
     def parse_logic(self, logic):
         # no logics are supported
@@ -229,8 +366,9 @@ class RRD(SmartPlugin):
         if step is not None:
             query.extend(['--resolution', step])
         # run query
+        query.extend(self._daemon_args())
         try:
-            meta, name, data = rrdtool.fetch(*query)
+            meta, name, data = self._fetch(rrd, query)
         except Exception as e:
             self.logger.warning("error reading {0} data: {1}".format(item, e))
             return None
@@ -242,16 +380,14 @@ class RRD(SmartPlugin):
         istart, iend, istep = meta
         mstart = istart * 1000
         mstep = istep * 1000
-        # old way could have null values which need to be suppressed as visu could not handle null properly
-        # tuples = [(mstart + i * mstep, v) for i, v in enumerate(data)]
-        tuples = []
-        for i, v in enumerate(data):
-            if v[0] is not None:
-                tuples.append((mstart + i * mstep, v[0]))
-        reply['series'] = sorted(tuples)
+        # rows are in time order, null values need to be suppressed as visu could not handle null properly
+        values = next(zip(*data), ())
+        timestamps = range(mstart, mstart + len(values) * mstep, mstep)
+        tuples = [(timestamp, v) for timestamp, v in zip(timestamps, values) if v is not None]
+        reply['series'] = tuples
         reply['params'] = {'update': True, 'item': item, 'func': func, 'start': str(iend), 'end': str(iend + istep), 'step': str(istep), 'sid': sid}
         reply['update'] = self.get_sh().now() + datetime.timedelta(seconds=istep)
-        self.logger.warning("Returning series for {} from {} to {} with {} values".format(sid, iend, iend+istep, len(tuples) ))
+        self.logger.debug("Returning series for {} from {} to {} with {} values".format(sid, iend, iend+istep, len(tuples) ))
         return reply
 
     def _single(self, func, start='1d', end='now', item=None):
@@ -303,14 +439,15 @@ class RRD(SmartPlugin):
                 query.extend(['--end', "now-{}".format(end)])
 
         # execute query
+        query.extend(self._daemon_args())
         try:
-            meta, name, data = rrdtool.fetch(*query)
+            meta, name, data = self._fetch(rrd, query)
         except Exception as e:
             self.logger.warning("error reading {0} data: {1}".format(item, e))
             return None
 
         # unpack returned values
-        values = [v[0] for v in data if v[0] is not None]
+        values = [v for v in next(zip(*data), ()) if v is not None]
 
         # postprocess for consolidation
         if func == 'avg':
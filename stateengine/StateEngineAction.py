@@ -267,9 +267,8 @@ class SeActionBase(StateEngineTools.SeItemChild):
     def _delayed_execute(self, actionname: str, namevar: str = "", repeat_text: str = "", value=None, current_condition=None):
         self._log_debug("Putting delayed action '{}' into queue.", namevar)
         self.__queue.put(["delayedaction", self, actionname, namevar, repeat_text, value, current_condition])
-        if not self._abitem.update_lock.locked():
-            self._log_debug("Running queue")
-            self._abitem.run_queue()
+        self._log_debug("Processing queue")
+        self._abitem.process_queue()
 
     # Really execute the action (needs to be implemented in derived classes)
     def real_execute(self, actionname: str, namevar: str = "", repeat_text: str = "", value=None, returnvalue=False, current_condition=None):
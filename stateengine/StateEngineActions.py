@@ -21,6 +21,7 @@
 from . import StateEngineAction
 from . import StateEngineTools
 import ast
+import functools
 import threading
 import queue
 
@@ -36,6 +37,23 @@ class SeActions(StateEngineTools.SeItemChild):
             self._abitem._initactionname = None
         return result
 
+    # Actions for the web interface: the details of an action are only determined when the web
+    # interface requests them, not on every run. They are resolved by SeItem.get_webif_infos while holding
+    # the update lock of the item, so no run of the item can change _initactionname in the meantime and the
+    # details are those of the state after the last run
+    @property
+    def dict_actions_webif(self):
+        return {name: StateEngineTools.SeWebifLazyDict(functools.partial(self.__get_action, name))
+                for name in self.__actions}
+
+    # name: name of the action to determine the details of, has to be called with the update lock of the item
+    def __get_action(self, name):
+        self._abitem._initactionname = name
+        try:
+            return self.__actions[name].get()
+        finally:
+            self._abitem._initactionname = None
+
     # Initialize the set of actions
     # abitem: parent SeItem instance
     def __init__(self, abitem):
@@ -33,6 +33,14 @@ class SeCondition(StateEngineTools.SeItemChild):
     def name(self):
         return self.__name
 
+    # Items the result of the condition depends on (item, items of value/min/max/changedby/updatedby)
+    # None if the condition has to be checked every time (eval, age, variables, structs)
+    @property
+    def dependencies(self):
+        if self.__dependencies is False:
+            self.__dependencies = self.__get_dependencies()
+        return self.__dependencies
+
     # Initialize the condition
     # abitem: parent SeItem instance
     # name: Name of condition
@@ -53,6 +61,8 @@ class SeCondition(StateEngineTools.SeItemChild):
         self.__updatedbynegate = None
         self.__agenegate = None
         self.__error = None
+        self.__dependencies = False
+        self.__memo = None
 
     def __repr__(self):
         return "SeCondition 'item': {}, 'eval': {}, 'value': {}".format(self.__item, self.__eval, self.__value)
@@ -62,6 +72,8 @@ class SeCondition(StateEngineTools.SeItemChild):
     # 'changedbynegate', 'updatedbynegate', 'agemin', 'agemax' or 'agenegate')
     # value: Value for function
     def set(self, func, value):
+        self.__dependencies = False
+        self.__memo = None
         if func == "se_item":
             if ":" in value:
                 self._log_warning("Your item configuration '{0}' is wrong! Define a plain (relative) "
@@ -119,6 +131,8 @@ class SeCondition(StateEngineTools.SeItemChild):
     # item_state: item to read from
     # abitem_object: Related SeItem instance for later determination of current age and current delay
     def complete(self, item_state):
+        self.__dependencies = False
+        self.__memo = None
         # check if it is possible to complete this condition
         if self.__min.is_empty() and self.__max.is_empty() and self.__value.is_empty() \
                 and self.__agemin.is_empty() and self.__agemax.is_empty() \
@@ -214,7 +228,21 @@ class SeCondition(StateEngineTools.SeItemChild):
         return True
 
     # Check if condition is matching
+    # The result is reused as long as none of the items the condition depends on has been updated
     def check(self):
+        dependencies = self.dependencies
+        if dependencies is None:
+            return self.__check()
+        fingerprint = tuple(item.property.last_update for item in dependencies)
+        if self.__memo is not None and self.__memo[0] == fingerprint:
+            self._log_debug("Condition '{0}': Items not updated since last check, result is {1}",
+                            self.__name, self.__memo[1])
+            return self.__memo[1]
+        result = self.__check()
+        self.__memo = (fingerprint, result)
+        return result
+
+    def __check(self):
         # Ignore if no current value can be determined (should not happen as we check this earlier, but to be sure ...)
         if self.__item is None and self.__eval is None:
             self._log_info("Condition '{0}': No item or eval found! Considering condition as matching!", self.__name)
@@ -268,6 +296,19 @@ class SeCondition(StateEngineTools.SeItemChild):
         if self.__updatedbynegate is not None and not self.__updatedby.is_empty():
             self._log_debug("updatedby negate: {0}", self.__updatedbynegate)
 
+    def __get_dependencies(self):
+        if self.__eval is not None or self.__item is None or isinstance(self.__item, list):
+            return None
+        if not self.__agemin.is_empty() or not self.__agemax.is_empty():
+            return None
+        dependencies = [self.__item]
+        for value in (self.__value, self.__min, self.__max, self.__changedby, self.__updatedby):
+            items = value.get_dependencies()
+            if items is None:
+                return None
+            dependencies.extend(items)
+        return dependencies
+
     # Cast 'value', 'min' and 'max' using given cast function
     # cast_func: cast function to use
     def __cast_all(self, cast_func):
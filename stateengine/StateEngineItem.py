@@ -101,6 +101,11 @@ class SeItem:
     def lastconditionset_name(self):
         return None if self.__lastconditionset_item_name is None else self.__lastconditionset_item_name.property.value
 
+    # return number and total duration (seconds) of the evaluations of eval expressions
+    @property
+    def eval_stats(self):
+        return self.__eval_stats
+
     @property
     def ab_alive(self):
         return self.__ab_alive
@@ -124,6 +129,7 @@ class SeItem:
         self.__sh = smarthome
         self.__se_plugin = se_plugin
         self.__active_schedulers = []
+        self.__eval_stats = {'count': 0, 'time': 0.0}
         try:
             self.__id = self.__item.property.path
         except Exception:
@@ -234,6 +240,12 @@ class SeItem:
         if name not in self.__active_schedulers:
             self.__active_schedulers.append(name)
 
+    # count the evaluation of an eval expression
+    # duration: duration of the evaluation in seconds
+    def add_eval_time(self, duration):
+        self.__eval_stats['count'] += 1
+        self.__eval_stats['time'] += duration
+
     def remove_scheduler_entry(self, name):
         self.__active_schedulers.remove(name)
 
@@ -242,14 +254,35 @@ class SeItem:
             self.__se_plugin.scheduler_remove('{}'.format(entry))
 
     # region Updatestate ***********************************************************************************************
+    # process queue: hand the item over to the worker pool of the plugin or, without worker pool, run the queue
+    # in the calling thread if it is not running already
+    def process_queue(self):
+        worker_pool = self.__se_plugin.worker_pool
+        if worker_pool is not None and worker_pool.alive:
+            worker_pool.schedule(self)
+        elif not self.update_lock.locked():
+            self.run_queue()
+
     # run queue
-    def run_queue(self):
+    # max_jobs: maximum number of jobs to process, 0 = until the queue is empty
+    def run_queue(self, max_jobs=0):
         if not self.__ab_alive:
             self.__logger.debug("StateEngine Plugin not running (anymore). Queue not activated.")
             return
-        self.update_lock.acquire(True, 10)
-        while not self.__queue.empty() and self.__ab_alive:
+        locked = self.update_lock.acquire(True, 10)
+        try:
+            self.__run_jobs(max_jobs)
+        finally:
+            if locked:
+                self.update_lock.release()
+
+    # process the jobs of the queue, called by run_queue
+    # max_jobs: maximum number of jobs to process, 0 = until the queue is empty
+    def __run_jobs(self, max_jobs):
+        jobs = 0
+        while not self.__queue.empty() and self.__ab_alive and (max_jobs == 0 or jobs < max_jobs):
             job = self.__queue.get()
+            jobs += 1
             if job is None or self.__ab_alive is False:
                 self.__logger.debug("No jobs in queue left or plugin not active anymore")
                 break
@@ -337,8 +370,6 @@ class SeItem:
                             text = "No matching state found, staying at {0} ('{1}') based on conditionset {2} ('{3}')"
                             self.__logger.info(text, last_state.id, last_state.name, _last_conditionset_id, _last_conditionset_name)
                         last_state.run_stay(self.__repeat_actions.get())
-                    if self.update_lock.locked():
-                        self.update_lock.release()
                     return
                 _last_conditionset_id = self.__lastconditionset_get_id()
                 _last_conditionset_name = self.__lastconditionset_get_name()
@@ -388,9 +419,31 @@ class SeItem:
                     self.update_webif(_key_enter, False)
 
                 self.__logger.debug("State evaluation finished")
-        self.__logger.info("State evaluation queue empty.")
-        if self.update_lock.locked():
+        if self.__queue.empty():
+            self.__logger.info("State evaluation queue empty.")
+
+    # Return the web interface information with the details determined that are only computed on request
+    # (see StateEngineTools.SeWebifLazyDict). The details are determined while holding the update lock, so they
+    # are not mixed up with a run of the item in a worker thread. If the lock can't be acquired, the infos are
+    # returned without the details
+    def get_webif_infos(self):
+        def _resolve(dic):
+            if isinstance(dic, StateEngineTools.SeWebifLazyDict):
+                dic.resolve()
+            for value in list(dic.values()):
+                if isinstance(value, dict):
+                    _resolve(value)
+
+        if not self.update_lock.acquire(True, 10):
+            self.__logger.warning("Web interface infos requested while the state is evaluated, details not determined")
+            return self.__webif_infos
+        try:
+            _resolve(self.__webif_infos)
+        except Exception as ex:
+            self.__logger.warning("Problem determining web interface infos: {0}", ex)
+        finally:
             self.update_lock.release()
+        return self.__webif_infos
 
     def update_webif(self, key, value):
         def _nested_set(dic, keys, val):
@@ -422,9 +475,8 @@ class SeItem:
             self.__logger.debug("Startup delay not over yet. Skipping state evaluation")
             return
         self.__queue.put(["stateevaluation", item, caller, source, dest])
-        if not self.update_lock.locked():
-            self.__logger.debug("Run queue to update state. Item: {}, caller: {}, source: {}".format(item, caller, source))
-            self.run_queue()
+        self.__logger.debug("Process queue to update state. Item: {}, caller: {}, source: {}".format(item, caller, source))
+        self.process_queue()
 
     # check if state can be entered after setting state-specific variables
     # state: state to check
@@ -108,11 +108,14 @@ class SeLogger:
         self.__loglevel = SeLogger.__loglevel
         self.__date = None
         self.__filename = ""
+        self.__info_enabled = True
+        self.__debug_enabled = True
         self.update_logfile()
 
     # override log level for specific items by using se_log_level attribute
     def override_loglevel(self, loglevel, item=None):
         self.__loglevel = loglevel.get()
+        self.update_levels()
         if self.__loglevel != StateEngineDefaults.log_level:
             self.logger.info("Loglevel for item {0} got individually set to {1}.".format(item.property.path, self.__loglevel))
 
@@ -120,13 +123,21 @@ class SeLogger:
     def get_loglevel(self):
         return self.__loglevel
 
-    # Update name logfile if required
+    # Update name logfile if required (called once per run of the item)
     def update_logfile(self):
-        if self.__date == datetime.datetime.today() and self.__filename is not None:
+        self.update_levels()
+        today = str(datetime.date.today())
+        if self.__date == today and self.__filename:
             return
-        self.__date = str(datetime.date.today())
+        self.__date = today
         self.__filename = str(SeLogger.__logdirectory + self.__date + '-' + self.__section + ".log")
 
+    # Determine if info and debug messages are written to the log file or to the logger at all.
+    # Evaluated once per run, so disabled messages return immediately without being formatted
+    def update_levels(self):
+        self.__info_enabled = self.__loglevel >= 1 or self.logger.isEnabledFor(logging.INFO)
+        self.__debug_enabled = self.__loglevel >= 2 or self.logger.isEnabledFor(logging.DEBUG)
+
     # Increase indentation level
     # by: number of levels to increase
     def increase_indent(self, by=1):
@@ -156,6 +167,8 @@ class SeLogger:
     # text: header text
     def header(self, text):
         self.__indentlevel = 0
+        if not self.__info_enabled:
+            return
         text += " "
         self.log(1, text.ljust(80, "="))
         self.logger.info(text.ljust(80, "="))
@@ -164,19 +177,25 @@ class SeLogger:
     # @param text text to log
     # @param *args parameters for text
     def info(self, text, *args):
+        if not self.__info_enabled:
+            return
         self.log(1, text, *args)
-        indent = "\t" * self.__indentlevel
-        text = '{}{}'.format(indent, text)
-        self.logger.info(text.format(*args))
+        if self.logger.isEnabledFor(logging.INFO):
+            indent = "\t" * self.__indentlevel
+            text = '{}{}'.format(indent, text)
+            self.logger.info(text.format(*args))
 
     # log with lebel=debug
     # text: text to log
     # *args: parameters for text
     def debug(self, text, *args):
+        if not self.__debug_enabled:
+            return
         self.log(2, text, *args)
-        indent = "\t" * self.__indentlevel
-        text = '{}{}'.format(indent, text)
-        self.logger.debug(text.format(*args))
+        if self.logger.isEnabledFor(logging.DEBUG):
+            indent = "\t" * self.__indentlevel
+            text = '{}{}'.format(indent, text)
+            self.logger.debug(text.format(*args))
 
     # log warning (always to main smarthome.py log)
     # text: text to log
@@ -219,6 +238,9 @@ class SeLoggerDummy:
     def update_logfile(self):
         pass
 
+    def update_levels(self):
+        pass
+
     # Increase indentation level
     # by: number of levels to increase
     def increase_indent(self, by=1):
@@ -136,28 +136,28 @@ class SeState(StateEngineTools.SeItemChild):
             self._log_increase_indent()
             self.__actions_enter.write_to_logger()
             self._log_decrease_indent()
-            self._abitem.update_webif([self.id, 'actions_enter'], self.__actions_enter.dict_actions)
+            self._abitem.update_webif([self.id, 'actions_enter'], self.__actions_enter.dict_actions_webif)
 
         if self.__actions_stay.count() > 0:
             self._log_info("Actions to perform on stay:")
             self._log_increase_indent()
             self.__actions_stay.write_to_logger()
             self._log_decrease_indent()
-            self._abitem.update_webif([self.id, 'actions_stay'], self.__actions_stay.dict_actions)
+            self._abitem.update_webif([self.id, 'actions_stay'], self.__actions_stay.dict_actions_webif)
 
         if self.__actions_enter_or_stay.count() > 0:
             self._log_info("Actions to perform on enter or stay:")
             self._log_increase_indent()
             self.__actions_enter_or_stay.write_to_logger()
             self._log_decrease_indent()
-            self._abitem.update_webif([self.id, 'actions_enter_or_stay'], self.__actions_enter_or_stay.dict_actions)
+            self._abitem.update_webif([self.id, 'actions_enter_or_stay'], self.__actions_enter_or_stay.dict_actions_webif)
 
         if self.__actions_leave.count() > 0:
             self._log_info("Actions to perform on leave (instant leave: {})", self._abitem.instant_leaveaction)
             self._log_increase_indent()
             self.__actions_leave.write_to_logger()
             self._log_decrease_indent()
-            self._abitem.update_webif([self.id, 'actions_leave'], self.__actions_leave.dict_actions)
+            self._abitem.update_webif([self.id, 'actions_leave'], self.__actions_leave.dict_actions_webif)
 
         self._log_decrease_indent()
 
@@ -174,8 +174,8 @@ class SeState(StateEngineTools.SeItemChild):
         self.__actions_enter.execute(False, allow_item_repeat, self, self.__actions_enter_or_stay)
         self._log_debug("Update web interface enter {}", self.id)
         self._log_increase_indent()
-        self._abitem.update_webif([self.id, 'actions_enter_or_stay'], self.__actions_enter_or_stay.dict_actions)
-        self._abitem.update_webif([self.id, 'actions_enter'], self.__actions_enter.dict_actions)
+        self._abitem.update_webif([self.id, 'actions_enter_or_stay'], self.__actions_enter_or_stay.dict_actions_webif)
+        self._abitem.update_webif([self.id, 'actions_enter'], self.__actions_enter.dict_actions_webif)
         self._log_decrease_indent()
         self._log_decrease_indent()
 
@@ -192,8 +192,8 @@ class SeState(StateEngineTools.SeItemChild):
         self.__actions_stay.execute(True, allow_item_repeat, self, self.__actions_enter_or_stay)
         self._log_debug("Update web interface stay {}", self.id)
         self._log_increase_indent()
-        self._abitem.update_webif([self.id, 'actions_enter_or_stay'], self.__actions_enter_or_stay.dict_actions)
-        self._abitem.update_webif([self.id, 'actions_stay'], self.__actions_stay.dict_actions)
+        self._abitem.update_webif([self.id, 'actions_enter_or_stay'], self.__actions_enter_or_stay.dict_actions_webif)
+        self._abitem.update_webif([self.id, 'actions_stay'], self.__actions_stay.dict_actions_webif)
         self._log_decrease_indent()
         self._log_decrease_indent()
 
@@ -208,7 +208,7 @@ class SeState(StateEngineTools.SeItemChild):
         self.__actions_leave.execute(False, allow_item_repeat, self)
         self._log_debug("Update web interface leave {}", self.id)
         self._log_increase_indent()
-        self._abitem.update_webif([self.id, 'actions_leave'], self.__actions_leave.dict_actions)
+        self._abitem.update_webif([self.id, 'actions_leave'], self.__actions_leave.dict_actions_webif)
         self._log_decrease_indent()
         self._log_decrease_indent()
 
@@ -28,6 +28,9 @@ import re
 itemsApi = Items.get_instance()
 __itemClass = Item
 
+# Compiled eval expressions: expression -> (code object, flag whether the expression uses se_eval)
+_eval_cache = {}
+
 # General class for everything that is below the SeItem Class
 # This class provides some general stuff:
 # - Protected wrapper-methods for logging
@@ -70,6 +73,24 @@ class SeItemChild:
         self._abitem.logger.decrease_indent(by)
 
 
+# Dict for the web interface whose content is only determined when the web interface requests it
+# (see SeItem.get_webif_infos). Entries written directly (e.g. delay, repeat) take precedence.
+class SeWebifLazyDict(dict):
+    # Constructor
+    # resolver: function returning the content of the dict
+    def __init__(self, resolver):
+        super().__init__()
+        self.resolver = resolver
+
+    # Determine the content of the dict (once)
+    def resolve(self):
+        if self.resolver is None:
+            return
+        resolver, self.resolver = self.resolver, None
+        for key, value in resolver().items():
+            self.setdefault(key, value)
+
+
 # Find a certain item below a given item.
 # item: Item to search below
 # child_id: Id of child item to search (without prefixed id of "item")
@@ -122,6 +143,20 @@ def parse_relative(evalstr, begintag, endtags):
     return pref
 
 
+# Compile an eval expression once, relative item references (e.g. sh..item()) are resolved before compiling
+# evalstr: expression to compile
+# returns: tuple of code object and flag whether se_eval/stateengine_eval has to be provided for evaluation
+def compile_eval(evalstr):
+    try:
+        return _eval_cache[evalstr]
+    except KeyError:
+        pass
+    parsed = parse_relative(evalstr, 'sh.', ['()', '.property.'])
+    compiled = (compile(parsed, '<stateengine eval>', 'eval'), "stateengine_eval" in parsed or "se_eval" in parsed)
+    _eval_cache[evalstr] = compiled
+    return compiled
+
+
 # Flatten list of values
 # changelist: list to make flat
 def flatten_list(changelist):
@@ -29,6 +29,7 @@ import re
 import ast
 import collections.abc
 import copy
+import time
 
 
 # Class representing a value for a condition (either value or via item/eval)
@@ -53,6 +54,7 @@ class SeValue(StateEngineTools.SeItemChild):
         self.itemsApi = Items.get_instance()
         self.__itemClass = Item
         self.__listorder = []
+        self.__listorder_index = None
         self.__type_listorder = []
         self.__valid_valuetypes = ["value", "regex", "eval", "var", "item", "template", "struct"]
         if value_type == "str":
@@ -118,6 +120,7 @@ class SeValue(StateEngineTools.SeItemChild):
         self.__template = None
         self._additional_sources = []
         self.__listorder = []
+        self.__listorder_index = None
         self.__type_listorder = []
 
     # Set value
@@ -295,6 +298,7 @@ class SeValue(StateEngineTools.SeItemChild):
             else:
                 self.__value = None
         self.__listorder = StateEngineTools.flatten_list(self.__listorder)
+        self.__listorder_index = None
         self.__type_listorder = StateEngineTools.flatten_list(self.__type_listorder)
         '''
         if self.__struct is not None:
@@ -325,6 +329,7 @@ class SeValue(StateEngineTools.SeItemChild):
         returnvalues = []
         try:
             _original_listorder = copy.copy(self.__listorder)
+            self.__get_listorder_index()
         except Exception as ex:
             self._log_error("Can not read listorder. Error: {}", ex)
             originalorder = False
@@ -352,6 +357,17 @@ class SeValue(StateEngineTools.SeItemChild):
         else:
             return returnvalues
 
+    # Items the value is read from
+    # returns: list of items or None if the value is not only based on fixed values and items (eval, variable, struct)
+    def get_dependencies(self):
+        if self.__eval is not None or self.__varname is not None or self.__struct is not None:
+            return None
+        if self.__item is None:
+            return []
+        if isinstance(self.__item, list):
+            return [item for item in self.__item if item is not None]
+        return [self.__item]
+
     def get_for_webif(self):
         returnvalues = self.get()
         returnvalues = self.__varname if returnvalues == '' else returnvalues
@@ -470,12 +486,10 @@ class SeValue(StateEngineTools.SeItemChild):
                             self.__listorder[self.__listorder.index(element)] = _newvalue
                         if isinstance(element, self.__itemClass):
                             _item_value = "item:{}".format(element.property.path)
-                            if _item_value in self.__listorder:
-                                self.__listorder[self.__listorder.index(_item_value)] = _newvalue
+                            self.__replace_in_listorder(_item_value, _newvalue)
                         if isinstance(element, StateEngineStruct.SeStruct):
                             _item_value = "struct:{}".format(element.property.path)
-                            if _item_value in self.__listorder:
-                                self.__listorder[self.__listorder.index(_item_value)] = _newvalue
+                            self.__replace_in_listorder(_item_value, _newvalue)
                     value = valuelist
                 else:
                     #value = ":".join([i.strip() for i in value.split(":")])
@@ -485,12 +499,10 @@ class SeValue(StateEngineTools.SeItemChild):
                             self.__listorder[self.__listorder.index(value)] = _newvalue
                         if isinstance(value, self.__itemClass):
                             _item_value = "item:{}".format(value.property.path)
-                            if _item_value in self.__listorder:
-                                self.__listorder[self.__listorder.index(_item_value)] = _newvalue
+                            self.__replace_in_listorder(_item_value, _newvalue)
                         if isinstance(value, StateEngineStruct.SeStruct):
                             _item_value = "struct:{}".format(value.property.path)
-                            if _item_value in self.__listorder:
-                                self.__listorder[self.__listorder.index(_item_value)] = _newvalue
+                            self.__replace_in_listorder(_item_value, _newvalue)
                     except Exception as ex:
                         if any(x in value for x in ['sh.', '_eval', '(']):
                             raise ValueError("You most likely forgot to prefix your expression with 'eval:'")
@@ -524,8 +536,7 @@ class SeValue(StateEngineTools.SeItemChild):
                 if val is not None:
                     _newvalue = self.__do_cast(val)
                     values.append(_newvalue)
-                    if 'struct:{}'.format(val.property.path) in self.__listorder:
-                        self.__listorder[self.__listorder.index('struct:{}'.format(val.property.path))] = _newvalue
+                    self.__replace_in_listorder('struct:{}'.format(val.property.path), _newvalue)
         else:
             if self.__struct is not None:
                 _newvalue = self.__do_cast(self.__struct)
@@ -537,8 +548,7 @@ class SeValue(StateEngineTools.SeItemChild):
 
         try:
             _newvalue = self.__do_cast(self.__struct)
-            if 'struct:{}'.format(self.__struct) in self.__listorder:
-                self.__listorder[self.__listorder.index('struct:{}'.format(self.__struct))] = _newvalue
+            self.__replace_in_listorder('struct:{}'.format(self.__struct), _newvalue)
             values = _newvalue
         except Exception as ex2:
             values = self.__struct
@@ -553,42 +563,71 @@ class SeValue(StateEngineTools.SeItemChild):
             for val in self.__regex:
                 _newvalue = re.compile(val, re.IGNORECASE)
                 values.append(_newvalue)
-                if 'regex:{}'.format(val) in self.__listorder:
-                    self.__listorder[self.__listorder.index('regex:{}'.format(val))] = _newvalue
+                self.__replace_in_listorder('regex:{}'.format(val), _newvalue)
         else:
             _newvalue = re.compile(self.__regex, re.IGNORECASE)
-            if 'regex:{}'.format(self.__regex) in self.__listorder:
-                self.__listorder[self.__listorder.index('regex:{}'.format(self.__regex))] = _newvalue
+            self.__replace_in_listorder('regex:{}'.format(self.__regex), _newvalue)
             values = _newvalue
         if values is not None:
             return values
 
         try:
             _newvalue = re.compile(self.__regex, re.IGNORECASE)
-            if 'regex:{}'.format(self.__regex) in self.__listorder:
-                self.__listorder[self.__listorder.index('regex:{}'.format(self.__regex))] = _newvalue
+            self.__replace_in_listorder('regex:{}'.format(self.__regex), _newvalue)
             values = _newvalue
         except Exception as ex2:
             values = self.__regex
             self._log_info("Problem while creating regex '{0}': {1}.", values, ex2)
         return values
 
+    # Position index of the value sources in listorder (entry -> positions), built on first use after set()
+    def __get_listorder_index(self):
+        if self.__listorder_index is None:
+            index = {}
+            for position, entry in enumerate(self.__listorder):
+                if isinstance(entry, str):
+                    index.setdefault(entry, []).append(position)
+            self.__listorder_index = index
+        return self.__listorder_index
+
+    # Replace the first remaining occurrence of a value source in listorder by its current value
+    # key: value source, e.g. 'eval:...' or 'item:...'
+    # value: current value
+    # returns: True if the key was found in listorder
+    def __replace_in_listorder(self, key, value):
+        for position in self.__get_listorder_index().get(key, ()):
+            entry = self.__listorder[position]
+            if isinstance(entry, str) and entry == key:
+                self.__listorder[position] = value
+                return True
+        return False
+
     # Determine value by executing eval-function
+    # The duration of the evaluation is added to the eval statistics of the item
     def __get_eval(self):
-        # noinspection PyUnusedLocal
-        sh = self._sh
-        shtime = self._shtime
+        start = time.perf_counter()
+        try:
+            return self.__evaluate()
+        finally:
+            self._abitem.add_eval_time(time.perf_counter() - start)
+
+    # Evaluate a string expression, the expression is compiled only once (see StateEngineTools.compile_eval)
+    # and evaluated with a fresh namespace
+    # expression: expression to evaluate
+    def __eval_expression(self, expression):
+        code, uses_se_eval = StateEngineTools.compile_eval(expression)
+        namespace = {'sh': self._sh, 'shtime': self._shtime, 'self': self}
+        if uses_se_eval:
+            namespace['stateengine_eval'] = namespace['se_eval'] = StateEngineEval.SeEval(self._abitem)
+        return eval(code, globals(), namespace)
+
+    def __evaluate(self):
         if isinstance(self.__eval, str):
-            self.__eval = StateEngineTools.parse_relative(self.__eval, 'sh.', ['()', '.property.'])
-            if "stateengine_eval" in self.__eval or "se_eval" in self.__eval:
-                # noinspection PyUnusedLocal
-                stateengine_eval = se_eval = StateEngineEval.SeEval(self._abitem)
             self._log_debug("Checking eval: {0} from list {1}", self.__eval, self.__listorder)
             self._log_increase_indent()
             try:
-                _newvalue = self.__do_cast(eval(self.__eval))
-                if 'eval:{}'.format(self.__eval) in self.__listorder:
-                    self.__listorder[self.__listorder.index('eval:{}'.format(self.__eval))] = _newvalue
+                _newvalue = self.__do_cast(self.__eval_expression(self.__eval))
+                self.__replace_in_listorder('eval:{}'.format(self.__eval), _newvalue)
                 values = _newvalue
                 self._log_decrease_indent()
                 self._log_debug("Eval result: {0}.", values)
@@ -611,13 +650,9 @@ class SeValue(StateEngineTools.SeItemChild):
                     self._log_debug("Checking eval from list: {0}.", val)
                     self._log_increase_indent()
                     if isinstance(val, str):
-                        if "stateengine_eval" in val or "se_eval" in val:
-                            # noinspection PyUnusedLocal
-                            stateengine_eval = se_eval = StateEngineEval.SeEval(self._abitem)
                         try:
-                            _newvalue = self.__do_cast(eval(val))
-                            if 'eval:{}'.format(val) in self.__listorder:
-                                self.__listorder[self.__listorder.index('eval:{}'.format(val))] = _newvalue
+                            _newvalue = self.__do_cast(self.__eval_expression(val))
+                            self.__replace_in_listorder('eval:{}'.format(val), _newvalue)
                             value = _newvalue
                             self._log_decrease_indent()
                             self._log_debug("Eval result from list: {0}.", value)
@@ -631,8 +666,7 @@ class SeValue(StateEngineTools.SeItemChild):
                     else:
                         try:
                             _newvalue = self.__do_cast(val())
-                            if 'eval:{}'.format(val) in self.__listorder:
-                                self.__listorder[self.__listorder.index('eval:{}'.format(val))] = _newvalue
+                            self.__replace_in_listorder('eval:{}'.format(val), _newvalue)
                             value = _newvalue
                         except Exception as ex:
                             self._log_decrease_indent()
@@ -646,8 +680,7 @@ class SeValue(StateEngineTools.SeItemChild):
                 try:
                     self._log_increase_indent()
                     _newvalue = self.__do_cast(self.__eval())
-                    if 'eval:{}'.format(self.__eval) in self.__listorder:
-                        self.__listorder[self.__listorder.index('eval:{}'.format(self.__eval))] = _newvalue
+                    self.__replace_in_listorder('eval:{}'.format(self.__eval), _newvalue)
                     values = _newvalue
                     self._log_decrease_indent()
                     self._log_debug("Eval result (no str, no list): {0}.", values)
@@ -670,14 +703,12 @@ class SeValue(StateEngineTools.SeItemChild):
                 else:
                     _newvalue = self.__do_cast(val.property.value)
                 values.append(_newvalue)
-                if 'item:{}'.format(val) in self.__listorder:
-                    self.__listorder[self.__listorder.index('item:{}'.format(val))] = _newvalue
+                self.__replace_in_listorder('item:{}'.format(val), _newvalue)
         else:
             if self.__item is None:
                 return None
             _newvalue = self.__do_cast(self.__item.property.value)
-            if 'item:{}'.format(self.__item) in self.__listorder:
-                self.__listorder[self.__listorder.index('item:{}'.format(self.__item))] = _newvalue
+            self.__replace_in_listorder('item:{}'.format(self.__item), _newvalue)
             values = _newvalue
         if values is not None:
             self._log_debug("Item '{0}' result: {1}", self.__item, values)
@@ -685,8 +716,7 @@ class SeValue(StateEngineTools.SeItemChild):
 
         try:
             _newvalue = self.__item.property.path
-            if 'item:{}'.format(self.__item) in self.__listorder:
-                self.__listorder[self.__listorder.index('item:{}'.format(self.__item))] = _newvalue
+            self.__replace_in_listorder('item:{}'.format(self.__item), _newvalue)
             values = _newvalue
         except Exception as ex2:
             values = self.__item
@@ -705,10 +735,9 @@ class SeValue(StateEngineTools.SeItemChild):
                     self._log_warning("There is a problem with your variable: {}", _newvalue)
                     _newvalue = ''
                 values.append(_newvalue)
-                if 'var:{}'.format(var) in self.__listorder:
+                if self.__replace_in_listorder('var:{}'.format(var), _newvalue):
                     self._log_debug("Checking variable in loop '{0}', value {1} from list {2}",
                                     self.__varname, _newvalue, self.__listorder)
-                    self.__listorder[self.__listorder.index('var:{}'.format(var))] = _newvalue
         else:
             _newvalue = self._abitem.get_variable(self.__varname)
             _newvalue = 'var:{}'.format(self.__varname) if _newvalue == '' else _newvalue
@@ -717,8 +746,7 @@ class SeValue(StateEngineTools.SeItemChild):
                 _newvalue = ''
             self._log_debug("Checking variable '{0}', value {1} from list {2}",
                             self.__varname, _newvalue, self.__listorder)
-            if 'var:{}'.format(self.__varname) in self.__listorder:
-                self.__listorder[self.__listorder.index('var:{}'.format(self.__varname))] = _newvalue
+            self.__replace_in_listorder('var:{}'.format(self.__varname), _newvalue)
             values = _newvalue
             self._log_debug("Variable result: {0}", values)
 
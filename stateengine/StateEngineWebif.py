@@ -39,7 +39,7 @@ class WebInterface(StateEngineTools.SeItemChild):
         if not REQUIRED_PACKAGE_IMPORTED:
             self._log_warning("Unable to import Python package 'pydotplus'. Visualizing SE items will not work.")
 
-        self.__states = abitem.webif_infos
+        self.__states = abitem.get_webif_infos()
         self.__name = abitem.id
         self.__active_conditionset = abitem.lastconditionset_name
         self.__active_state = abitem.laststate
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# vim: set encoding=utf-8 tabstop=4 softtabstop=4 shiftwidth=4 expandtab
+#########################################################################
+#  Finite state machine plugin for SmartHomeNG
+#
+#  This plugin is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This plugin is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this plugin. If not, see <http://www.gnu.org/licenses/>.
+#########################################################################
+import collections
+import threading
+import time
+
+# Number of jobs of an item's queue that are processed before the next waiting item gets its turn
+JOBS_PER_TURN = 5
+
+# Number of turns the latency and runtime statistics are calculated of
+STATS_WINDOW = 200
+
+
+# Class representing a bounded pool of worker threads processing the queues of the stateengine items
+#
+# An item that has jobs in its queue is waiting for a worker. A worker takes the item that waits the longest,
+# processes up to JOBS_PER_TURN jobs of its queue and puts the item to the end of the waiting items if there are
+# jobs left. An item is never waiting twice or processed by two workers at the same time, so the jobs of an item
+# are processed in the order they were queued.
+class SeWorkerPool:
+    # Constructor
+    # threads: number of worker threads
+    # logger: logger of the plugin
+    def __init__(self, threads, logger):
+        self.__threads = threads
+        self.__logger = logger
+        self.__workers = []
+        self.__alive = False
+        self.__condition = threading.Condition()
+        # items waiting for a worker: (item, time the item started waiting)
+        self.__waiting = collections.deque()
+        # ids of the items waiting or processed by a worker
+        self.__scheduled = set()
+        self.__busy = 0
+        self.__turns = 0
+        self.__max_waiting = 0
+        self.__latencies = collections.deque(maxlen=STATS_WINDOW)
+        self.__runtimes = collections.deque(maxlen=STATS_WINDOW)
+
+    @property
+    def alive(self):
+        return self.__alive
+
+    @property
+    def threads(self):
+        return self.__threads
+
+    # Start the worker threads
+    def start(self):
+        if self.__alive:
+            return
+        self.__alive = True
+        for index in range(self.__threads):
+            worker = threading.Thread(target=self.__work, name='stateengine.worker{}'.format(index + 1))
+            worker.daemon = True
+            worker.start()
+            self.__workers.append(worker)
+        self.__logger.info("Started {} worker threads for state evaluation".format(self.__threads))
+
+    # Stop the worker threads. Items still waiting are dropped, the stateengine items are not alive anymore anyway
+    # timeout: seconds to wait for each worker to finish its current turn
+    def stop(self, timeout=5):
+        with self.__condition:
+            self.__alive = False
+            self.__waiting.clear()
+            self.__scheduled.clear()
+            self.__condition.notify_all()
+        for worker in self.__workers:
+            worker.join(timeout)
+        self.__workers = []
+
+    # Hand an item with jobs in its queue over to the workers
+    # abitem: SeItem instance whose queue should be processed
+    def schedule(self, abitem):
+        with self.__condition:
+            if not self.__alive or abitem.id in self.__scheduled:
+                return
+            self.__scheduled.add(abitem.id)
+            self.__waiting.append((abitem, time.perf_counter()))
+            self.__max_waiting = max(self.__max_waiting, len(self.__waiting))
+            self.__condition.notify()
+
+    # Return statistics of the pool: number of threads, busy workers, waiting items and jobs, processed turns and
+    # average/maximum latency (time waiting for a worker) and runtime of the last turns in milliseconds
+    def get_stats(self):
+        with self.__condition:
+            latencies = list(self.__latencies)
+            runtimes = list(self.__runtimes)
+            stats = {'threads': self.__threads, 'busy': self.__busy, 'waiting': len(self.__waiting),
+                     'max_waiting': self.__max_waiting, 'turns': self.__turns,
+                     'jobs': sum(abitem.queue.qsize() for abitem, _ in self.__waiting)}
+        stats['latency_avg'] = sum(latencies) / len(latencies) * 1000 if latencies else 0.0
+        stats['latency_max'] = max(latencies) * 1000 if latencies else 0.0
+        stats['runtime_avg'] = sum(runtimes) / len(runtimes) * 1000 if runtimes else 0.0
+        stats['runtime_max'] = max(runtimes) * 1000 if runtimes else 0.0
+        return stats
+
+    def __work(self):
+        while True:
+            with self.__condition:
+                while self.__alive and not self.__waiting:
+                    self.__condition.wait()
+                if not self.__alive:
+                    return
+                abitem, since = self.__waiting.popleft()
+                self.__busy += 1
+            start = time.perf_counter()
+            try:
+                abitem.run_queue(JOBS_PER_TURN)
+            except Exception as ex:
+                self.__logger.error("Problem evaluating state of item {}: {}".format(abitem.id, ex))
+            end = time.perf_counter()
+            with self.__condition:
+                self.__busy -= 1
+                self.__turns += 1
+                self.__latencies.append(start - since)
+                self.__runtimes.append(end - start)
+                if not self.__alive:
+                    return
+                if not abitem.queue.empty() and abitem.ab_alive:
+                    self.__waiting.append((abitem, end))
+                    self.__max_waiting = max(self.__max_waiting, len(self.__waiting))
+                    self.__condition.notify()
+                else:
+                    self.__scheduled.discard(abitem.id)
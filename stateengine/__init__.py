@@ -27,6 +27,7 @@ from . import StateEngineTools
 from . import StateEngineCliCommands
 from . import StateEngineFunctions
 from . import StateEngineWebif
+from . import StateEngineWorkers
 import logging
 import os
 from lib.model.smartplugin import *
@@ -47,6 +48,7 @@ class StateEngine(SmartPlugin):
         self.__sh = sh
         self.alive = False
         self.__cli = None
+        self.worker_pool = None
         self.init_webinterface()
         self.__log_directory = self.get_parameter_value("log_directory")
         try:
@@ -58,6 +60,9 @@ class StateEngine(SmartPlugin):
             StateEngineDefaults.startup_delay = self.get_parameter_value("startup_delay_default")
             StateEngineDefaults.suspend_time = self.get_parameter_value("suspend_time_default")
             StateEngineDefaults.instant_leaveaction = self.get_parameter_value("instant_leaveaction")
+            worker_threads = self.get_parameter_value("worker_threads")
+            if worker_threads > 0:
+                self.worker_pool = StateEngineWorkers.SeWorkerPool(worker_threads, self.logger)
             StateEngineDefaults.write_to_log(self.logger)
             self.get_sh().stateengine_plugin_functions = StateEngineFunctions.SeFunctions(self.get_sh(), self.logger)
             StateEngineCurrent.init(self.get_sh())
@@ -102,6 +107,8 @@ class StateEngine(SmartPlugin):
     def run(self):
         # Initialize
         self.logger.info("Init StateEngine items")
+        if self.worker_pool is not None:
+            self.worker_pool.start()
         for item in self.itemsApi.find_items("se_plugin"):
             if item.conf["se_plugin"] == "active":
                 try:
@@ -130,6 +137,8 @@ class StateEngine(SmartPlugin):
             self.scheduler_remove('{}-Startup Delay'.format(item))
             self.__items[item].remove_all_schedulers()
 
+        if self.worker_pool is not None:
+            self.worker_pool.stop()
         self.alive = False
         self.get_sh().stateengine_plugin_functions.ab_alive = False
         self.logger.debug("stop method finished")
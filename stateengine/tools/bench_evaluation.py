@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+# vim: set encoding=utf-8 tabstop=4 softtabstop=4 shiftwidth=4 expandtab
+#########################################################################
+#  Finite state machine plugin for SmartHomeNG
+#
+#  This plugin is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This plugin is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this plugin. If not, see <http://www.gnu.org/licenses/>.
+#########################################################################
+
+"""
+Benchmark for the state evaluation of the stateengine plugin
+
+Builds a synthetic tree of stateengine items (each with several states, condition sets
+and actions based on shared items like brightness and wind) without a running SmartHomeNG
+and measures the time needed to evaluate the conditions of all states and to update the
+web interface information, like a run of SeItem.run_queue does.
+
+    --unguarded     log as before, every message is formatted even if it is not logged
+    --eager-webif   determine the action details for the web interface on every run
+
+Has to be started from the base directory of SmartHomeNG:
+
+    python3 plugins/stateengine/tools/bench_evaluation.py -i 100 -r 20
+    python3 plugins/stateengine/tools/bench_evaluation.py -i 100 -r 20 --unguarded --eager-webif
+"""
+
+import argparse
+import datetime
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..')))
+
+from plugins.stateengine import StateEngineActions, StateEngineConditionSets
+from plugins.stateengine.StateEngineLogger import SeLogger
+
+
+class DummyProperty:
+
+    def __init__(self, path, value):
+        self.path = path
+        self.value = value
+        self.last_update = datetime.datetime.now()
+        self.last_change_by = 'bench'
+        self.last_update_by = 'bench'
+
+
+class DummyItem:
+
+    def __init__(self, path, value=None, conf=None, parent=None):
+        self.property = DummyProperty(path, value)
+        self.conf = conf or {}
+        self._parent = parent
+
+    def __call__(self, value=None, caller=None):
+        if value is None:
+            return self.property.value
+        self.property.value = value
+        self.property.last_update = datetime.datetime.now()
+
+    def __str__(self):
+        return self.property.path
+
+    def cast(self, value):
+        return float(value)
+
+    def return_parent(self):
+        return self._parent
+
+
+class BenchSeItem:
+    """
+    Minimal replacement of SeItem, only what conditions and actions need
+    """
+
+    def __init__(self, path, items):
+        self.items = items
+        self.sh = self
+        self.shtime = self
+        self.se_plugin = None
+        self.templates = {}
+        self.ab_alive = True
+        self.queue = None
+        self._initactionname = None
+        self.id = path
+        self.logger = SeLogger.create(DummyItem(path))
+        self.webif_infos = {}
+
+    def now(self):
+        return datetime.datetime.now()
+
+    def return_item(self, item_id):
+        return self.items.get(item_id)
+
+    def add_eval_time(self, duration):
+        pass
+
+    def set_variable(self, name, value):
+        pass
+
+    def get_variable(self, name):
+        return ''
+
+    def lastconditionset_set(self, conditionset_id, name):
+        pass
+
+
+# Logging as done before the log levels were checked once per run: the message is always
+# formatted for the logger, no matter if the logger is enabled for the level
+def legacy_info(self, text, *args):
+    self.log(1, text, *args)
+    indent = "\t" * self._SeLogger__indentlevel
+    text = '{}{}'.format(indent, text)
+    self.logger.info(text.format(*args))
+
+
+def legacy_debug(self, text, *args):
+    self.log(2, text, *args)
+    indent = "\t" * self._SeLogger__indentlevel
+    text = '{}{}'.format(indent, text)
+    self.logger.debug(text.format(*args))
+
+
+def build_tree(count, states, conditionsets, actions):
+    shared = {
+        'bench.brightness': DummyItem('bench.brightness', 500),
+        'bench.wind': DummyItem('bench.wind', 5),
+        'bench.temperature': DummyItem('bench.temperature', 20),
+    }
+    se_items = []
+    for index in range(count):
+        path = 'bench.blind{}'.format(index)
+        abitem = BenchSeItem(path, shared)
+        rules = DummyItem(path + '.rules', conf={'se_item_brightness': 'bench.brightness', 'se_item_wind': 'bench.wind',
+                                                 'se_item_temperature': 'bench.temperature'})
+        se_states = []
+        for state_index in range(states):
+            state_item = DummyItem('{}.rules.state{}'.format(path, state_index), parent=rules)
+            conditions = StateEngineConditionSets.SeConditionSets(abitem)
+            for set_index in range(conditionsets):
+                conf = {'se_min_brightness': str(100 * (state_index + set_index)),
+                        'se_max_wind': str(10 + state_index),
+                        'se_value_temperature': 'eval:{} + 0'.format(15 + set_index)}
+                conditions.update('enter{}'.format(set_index), DummyItem(state_item.property.path + '.enter{}'.format(set_index), conf=conf), rules)
+            conditions.complete(state_item)
+            state_actions = StateEngineActions.SeActions(abitem)
+            for action_index in range(actions):
+                state_actions.update('se_set_action{}'.format(action_index), 'eval:{} * 2'.format(action_index))
+            se_states.append((state_item.property.path, conditions, state_actions))
+            abitem.webif_infos[state_item.property.path] = {'actions_stay': {}}
+        se_items.append((abitem, se_states))
+    return shared, se_items
+
+
+def run(shared, se_items, rounds, eager_webif):
+    rnd = random.Random(0)
+    start = time.perf_counter()
+    for _ in range(rounds):
+        shared['bench.brightness'](rnd.randrange(0, 1000))
+        shared['bench.wind'](rnd.randrange(0, 20))
+        for abitem, se_states in se_items:
+            abitem.logger.update_logfile()
+            abitem.logger.header("Update state of item {0}".format(abitem.id))
+            for state_id, conditions, state_actions in se_states:
+                matching = conditions.one_conditionset_matching()
+                abitem.webif_infos[state_id]['actions_stay'] = \
+                    state_actions.dict_actions if eager_webif else state_actions.dict_actions_webif
+                if matching:
+                    break
+    return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Benchmark for the state evaluation of the stateengine plugin')
+    parser.add_argument('-i', '--items', dest='items', type=int, default=50, help='number of stateengine items')
+    parser.add_argument('-s', '--states', dest='states', type=int, default=15, help='number of states per item')
+    parser.add_argument('-c', '--conditionsets', dest='conditionsets', type=int, default=2, help='number of condition sets per state')
+    parser.add_argument('-a', '--actions', dest='actions', type=int, default=3, help='number of actions per state')
+    parser.add_argument('-r', '--rounds', dest='rounds', type=int, default=10, help='number of runs per item')
+    parser.add_argument('-l', '--log-level', dest='log_level', type=int, default=0, help='log level of the stateengine log files (0-2)')
+    parser.add_argument('--unguarded', dest='unguarded', action='store_true', help='log as before, without the log level guards')
+    parser.add_argument('--eager-webif', dest='eager_webif', action='store_true', help='determine the web interface details on every run')
+    args = parser.parse_args()
+
+    log_directory = tempfile.mkdtemp(prefix='se_bench_')
+    SeLogger.set_loglevel(args.log_level)
+    SeLogger.set_logdirectory(log_directory + '/')
+    if args.unguarded:
+        SeLogger.info = legacy_info
+        SeLogger.debug = legacy_debug
+
+    shared, se_items = build_tree(args.items, args.states, args.conditionsets, args.actions)
+    run(shared, se_items, 1, args.eager_webif)  # warm up
+
+    duration = run(shared, se_items, args.rounds, args.eager_webif)
+    total = args.items * args.rounds
+    print("{} items, {} states, {} condition sets and {} actions per state, {} rounds".format(
+        args.items, args.states, args.conditionsets, args.actions, args.rounds))
+    print("log level {}{}{}".format(args.log_level, ", unguarded logging" if args.unguarded else "",
+                                     ", eager web interface" if args.eager_webif else ""))
+    print("{:.3f} s, {:.3f} ms per item run".format(duration, duration / total * 1000))
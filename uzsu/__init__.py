@@ -54,6 +54,7 @@
 
 import logging
 import functools
+import heapq
 from lib.model.smartplugin import *
 from lib.item import Items
 from lib.shtime import Shtime
@@ -68,12 +69,8 @@ from unittest import mock
 from collections import OrderedDict
 from bin.smarthome import VERSION
 import copy
-
-try:
-    from scipy import interpolate
-    REQUIRED_PACKAGE_IMPORTED = True
-except Exception:
-    REQUIRED_PACKAGE_IMPORTED = False
+from .ephemeris import SunEphemeris
+from .interpolation import InterpolationEngine, SCIPY_IMPORTED
 
 ITEM_TAG = ['uzsu_item']
 
@@ -112,11 +109,13 @@ class UZSU(SmartPlugin):
         self._planned = {}
         self._update_count = {'todo': 0, 'done': 0}
         self._itpl = {}
+        self._timeline = {}
+        self._interpolation = InterpolationEngine()
         self.init_webinterface()
         self.logger.info("Init with timezone {}".format(self._timezone))
-        if not REQUIRED_PACKAGE_IMPORTED:
-            self.logger.warning("Unable to import Python package 'scipy' which is necessary for interpolation.")
-            self._init_complete = False
+        if not SCIPY_IMPORTED:
+            self.logger.warning("Unable to import Python package 'scipy' which is necessary for cubic interpolation."
+                                " Using linear interpolation instead.")
 
     def run(self):
         """
@@ -170,12 +169,27 @@ class UZSU(SmartPlugin):
         :param caller:  if given it represents the callers name
         :type caller:   str
         """
+        self._update_ephemeris()
         for item in self._items:
             success = self._update_sun(item)
             if success:
                 self.logger.debug('Updating sun info for item {}'.format(item))
                 item(self._items[item], 'UZSU Plugin', 'update_all_suns')
 
+    def _update_ephemeris(self):
+        """
+        Remove the sun times of days that are not needed anymore from the ephemeris table and precompute the
+        times from a week ago (start of the rrules) until tomorrow
+        """
+        self._uzsu_sun = self._create_sun()
+        if not self._uzsu_sun:
+            return
+        today = datetime.combine(datetime.today(), datetime.min.time())
+        days = [(today + timedelta(days=offset)).replace(tzinfo=self._timezone) for offset in range(-7, 2)]
+        self._uzsu_sun.expire(days[0])
+        self._uzsu_sun.precompute(days)
+        self.logger.debug("Updated sun ephemeris from {} to {}".format(days[0].date(), days[-1].date()))
+
     def _update_sun(self, item, caller=None):
         """
         Update general sunrise and sunset information for visu
@@ -218,7 +232,6 @@ class UZSU(SmartPlugin):
             self.logger.debug("Updated calculated time for item {} entry {} with value {}.".format(
                 item, self._items[item]['list'][entryindex], entryvalue))
             self._items[item]['list'][entryindex]['calculated'] = entryvalue
-            item(self._items[item], 'UZSU Plugin', 'update_sun')
         else:
             self.logger.debug("Sun calculation {} entry not updated for item {} with value {}".format(
                 entryvalue, item, entry.get('calculated')))
@@ -501,30 +514,10 @@ class UZSU(SmartPlugin):
             self.logger.warning("item '{}' is active but has no entries.".format(item))
             self._planned.update({item: None})
         elif self._items[item].get('active') is True:
-            self._itpl[item] = OrderedDict()
-            for i, entry in enumerate(self._items[item]['list']):
-                next, value = self._get_time(entry, 'next', item, i)
-                previous, previousvalue = self._get_time(entry, 'previous', item, i)
-                item(self._items[item], 'UZSU Plugin', 'schedule')
-                cond1 = next is None and previous is not None
-                cond2 = previous is not None and next is not None and previous < next
-                if cond1 or cond2:
-                    next = previous
-                    value = previousvalue
-                if next is not None:
-                    self.logger.debug("uzsu active entry for item {} with datetime {}, value {}"
-                                      " and tzinfo {}".format(item, next, value, next.tzinfo))
-                if _next is None:
-                    _next = next
-                    _value = value
-                elif next and next < _next:
-                    self.logger.debug("uzsu active entry for item {} using now {}, value {}"
-                                      " and tzinfo {}".format(item, next, value, next.tzinfo))
-                    _next = next
-                    _value = value
-                else:
-                    self.logger.debug("uzsu active entry for item {} keep {}, value {} and tzinfo {}".format(
-                        item, _next, _value, _next.tzinfo))
+            _next, _value = self._update_timeline(item)
+            if _next is not None:
+                self.logger.debug("uzsu active entry for item {} using {}, value {} and tzinfo {}".format(
+                    item, _next, _value, _next.tzinfo))
         if _next and _value is not None and self._items[item].get('active') is True:
             _reset_interpolation = False
             _interval = self._items[item]['interpolation'].get('interval')
@@ -532,7 +525,6 @@ class UZSU(SmartPlugin):
             if _interval < 0:
                 _interval = abs(int(_interval))
                 self._items[item]['interpolation']['interval'] = _interval
-                item(self._items[item], 'UZSU Plugin', 'intervalchange')
             _interpolation = self._items[item]['interpolation'].get('type')
             _interpolation = self._interpolation_type if not _interpolation else _interpolation
             _initage = self._items[item]['interpolation'].get('initage')
@@ -548,7 +540,6 @@ class UZSU(SmartPlugin):
             itpl_list = itpl_list[entry_index - min(2, entry_index):entry_index + min(3, len(itpl_list))]
             itpl_list.remove((entry_now, 'NOW'))
             self._items[item]['lastvalue'] = _initvalue
-            item(self._items[item], 'UZSU Plugin', 'lastvalue')
             _timediff = datetime.now(self._timezone) - timedelta(minutes=_initage)
             try:
                 _value = float(_value)
@@ -564,16 +555,12 @@ class UZSU(SmartPlugin):
                 self.logger.info("Looking if there was a value set after {} for item {}".format(
                     _timediff, item))
                 self._items[item]['interpolation']['initialized'] = True
-                item(self._items[item], 'UZSU Plugin', 'init')
             if cond1 and not cond2 and cond3:
                 self._set(item=item, value=_initvalue, caller='scheduler')
                 self.logger.info("Updated item {} on startup with value {} from time {}".format(
                     item, _initvalue, datetime.fromtimestamp(_inittime/1000.0)))
             _itemtype = self._items[item]['interpolation'].get('itemtype')
-            if cond2 and not REQUIRED_PACKAGE_IMPORTED:
-                self.logger.warning("Interpolation is set to {} but scipy not installed. Ignoring interpolation".format(
-                    _interpolation))
-            elif cond2 and _interval < 1:
+            if cond2 and _interval < 1:
                 self.logger.warning("Interpolation is set to {} but interval is {}. Ignoring interpolation".format(
                     _interpolation, _interval))
             elif cond2 and _itemtype not in ['num']:
@@ -581,40 +568,34 @@ class UZSU(SmartPlugin):
                                     " Ignoring interpolation and setting UZSU interpolation to none.".format(
                                         _interpolation, _itemtype))
                 _reset_interpolation = True
-            elif _interpolation.lower() == 'cubic' and _interval > 0:
+            elif _interpolation.lower() in ['cubic', 'linear'] and _interval > 0:
                 try:
-                    tck = interpolate.PchipInterpolator(list(self._itpl[item].keys()), list(self._itpl[item].values()))
                     _nextinterpolation = datetime.now(self._timezone) + timedelta(minutes=_interval)
-                    _next = _nextinterpolation if _next > _nextinterpolation else _next
-                    _value = round(float(tck(_next.timestamp() * 1000.0)), self._interpolation_precision)
-                    _value_now = round(float(tck(entry_now)), self._interpolation_precision)
+                    _nextinterpolation = _nextinterpolation if _next > _nextinterpolation else _next
+                    _value_next, _value_now = self._interpolation.evaluate(
+                        item, _interpolation.lower(), list(self._itpl[item].items()),
+                        [_nextinterpolation.timestamp() * 1000.0, entry_now])
+                    _next = _nextinterpolation
+                    _value = round(_value_next, self._interpolation_precision)
+                    _value_now = round(_value_now, self._interpolation_precision)
                     self._set(item=item, value=_value_now, caller='scheduler')
-                    self.logger.info("Updated: {}, cubic interpolation value: {}, based on dict: {}."
-                                     " Next: {}, value: {}".format(item, _value_now, self._itpl[item], _next, _value))
+                    self.logger.info("Updated: {}, {} interpolation value: {}, based on dict: {}."
+                                     " Next: {}, value: {}".format(item, _interpolation.lower(), _value_now,
+                                                                   self._itpl[item], _next, _value))
                 except Exception as e:
-                    self.logger.error("Error cubic interpolation for item {} "
-                                      "with interpolation list {}: {}".format(item, self._itpl[item], e))
-            elif _interpolation.lower() == 'linear' and _interval > 0:
-                try:
-                    tck = interpolate.interp1d(list(self._itpl[item].keys()), list(self._itpl[item].values()))
-                    _nextinterpolation = datetime.now(self._timezone) + timedelta(minutes=_interval)
-                    _next = _nextinterpolation if _next > _nextinterpolation else _next
-                    _value = round(float(tck(_next.timestamp() * 1000.0)), self._interpolation_precision)
-                    _value_now = round(float(tck(entry_now)), self._interpolation_precision)
-                    self._set(item=item, value=_value_now, caller='scheduler')
-                    self.logger.info("Updated: {}, linear interpolation value: {}, based on dict: {}."
-                                     " Next: {}, value: {}".format(item, _value_now, self._itpl[item], _next, _value))
-                except Exception as e:
-                    self.logger.error("Error linear interpolation: {}".format(e))
+                    self.logger.error("Error {} interpolation for item {} with interpolation list {}: {}".format(
+                        _interpolation.lower(), item, self._itpl[item], e))
             if cond5 and _value < 0:
                 self.logger.warning("value {} for item '{}' is negative. This might be due"
                                     " to not enough values set in the UZSU.".format(_value, item))
             if _reset_interpolation is True:
                 self._items[item]['interpolation']['type'] = 'none'
-                item(self._items[item], 'UZSU Plugin', 'reset_interpolation')
+            if _reset_interpolation is True or not cond2 or _interval < 1:
+                self._interpolation.remove(item)
 
             self.logger.debug("will add scheduler named uzsu_{} with datetime {} and tzinfo {}"
                               " and value {}".format(item.property.path, _next, _next.tzinfo, _value))
+            item(self._items[item], 'UZSU Plugin', 'schedule')
             self._planned.update({item: {'value': _value, 'next': _next.strftime('%Y-%m-%d %H:%M')}})
             self._update_count['done'] = self._update_count.get('done') + 1
             self.scheduler_add('uzsu_{}'.format(item.property.path), self._set, value={'item': item, 'value': _value}, next=_next)
@@ -622,9 +603,80 @@ class UZSU(SmartPlugin):
                 self.scheduler_trigger('uzsu_sunupdate', by='UZSU Plugin')
                 self._update_count = {'done': 0, 'todo': 0}
         elif self._items[item].get('active') is True and self._items[item].get('list'):
+            item(self._items[item], 'UZSU Plugin', 'schedule')
             self.logger.warning("item '{}' is active but has no active entries.".format(item))
             self._planned.update({item: None})
 
+    def _update_timeline(self, item):
+        """
+        Updates the timeline of upcoming switch points of an item and returns the nearest one.
+
+        The next switch point of every entry (and the points used for interpolation) is cached. An entry is only
+        evaluated again by _get_time if it changed, if its switch point has been reached or if the day changed
+        (sun based times), for all other entries the cached values are used. The switch points are kept in a
+        heap, entries evaluated again are pushed with a new generation and outdated heap entries are dropped
+        when they come to the top.
+
+        :param item:    uzsu item
+        :type item:     item
+        :return:        datetime and value of the next switch point, None, None if there is none
+        """
+        now = datetime.now(self._timezone)
+        timeline = self._timeline.get(item)
+        if timeline is None or timeline['date'] != now.date():
+            timeline = {'date': now.date(), 'entries': [], 'heap': [], 'generation': 0}
+            self._timeline[item] = timeline
+        entries = timeline['entries']
+        _list = self._items[item]['list']
+        del entries[len(_list):]
+        for i, entry in enumerate(_list):
+            key = self._timeline_key(entry)
+            cached = entries[i] if i < len(entries) else None
+            if cached is not None and cached['key'] == key and \
+                    (cached['next'] is None or cached['next'] - timedelta(seconds=1) > now):
+                continue
+            self._itpl[item] = OrderedDict()
+            next, value = self._get_time(entry, 'next', item, i)
+            previous, previousvalue = self._get_time(entry, 'previous', item, i)
+            cond1 = next is None and previous is not None
+            cond2 = previous is not None and next is not None and previous < next
+            if cond1 or cond2:
+                next = previous
+                value = previousvalue
+            timeline['generation'] += 1
+            cached = {'key': self._timeline_key(entry), 'next': next, 'value': value, 'itpl': self._itpl[item],
+                      'generation': timeline['generation']}
+            if i < len(entries):
+                entries[i] = cached
+            else:
+                entries.append(cached)
+            if next is not None:
+                self.logger.debug("uzsu active entry for item {} with datetime {}, value {}"
+                                  " and tzinfo {}".format(item, next, value, next.tzinfo))
+                heapq.heappush(timeline['heap'], (next, i, cached['generation'], value))
+        self._itpl[item] = OrderedDict()
+        for cached in entries:
+            self._itpl[item].update(cached['itpl'])
+        heap = timeline['heap']
+        while heap:
+            next, i, generation, value = heap[0]
+            if i < len(entries) and entries[i]['generation'] == generation:
+                return next, value
+            heapq.heappop(heap)
+        return None, None
+
+    @staticmethod
+    def _timeline_key(entry):
+        """
+        Returns the settings of an entry its switch points depend on, to detect changed entries
+
+        :param entry:   entry of the uzsu list
+        :return:        tuple of the settings
+        """
+        if not isinstance(entry, dict):
+            return entry
+        return tuple(entry.get(key) for key in ('value', 'active', 'time', 'rrule', 'dtstart'))
+
     def _set(self, item=None, value=None, caller=None):
         """
         This function sets the specific item
@@ -774,7 +826,7 @@ class UZSU(SmartPlugin):
                 longitude = self._sh.sun._obs.long
                 latitude = self._sh.sun._obs.lat
                 elevation = self._sh.sun._obs.elev
-                uzsu_sun = lib.orb.Orb('sun', longitude, latitude, elevation)
+                uzsu_sun = SunEphemeris(lib.orb.Orb('sun', longitude, latitude, elevation))
                 self.logger.debug("Created a new sun object with latitude={}, longitude={}, elevation={}".format(
                     latitude, longitude, elevation))
             except Exception as e:
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# vim: set encoding=utf-8 tabstop=4 softtabstop=4 shiftwidth=4 expandtab
+#########################################################################
+#  This file is part of SmartHomeNG.    https://github.com/smarthomeNG//
+#
+#  SmartHomeNG is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  SmartHomeNG is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with SmartHomeNG.  If not, see <http://www.gnu.org/licenses/>.
+##########################################################################
+
+import threading
+from datetime import datetime, timedelta
+
+
+class SunEphemeris:
+    """
+    Memoized sunrise and sunset times of a lib.orb.Orb object
+
+    The times for a given day are calculated once per degree offset and kept in a table keyed on
+    (rise/set, day, degree offset). Minute offsets are added to the cached time, the orb object does
+    the same. The next sunrise/sunset from now (no day given) is cached until it has passed.
+    """
+
+    def __init__(self, orb):
+        """
+        :param orb: lib.orb.Orb object for the sun
+        """
+        self._orb = orb
+        self._table = {}
+        self._next = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def rise(self, doff=0, moff=0, dt=None):
+        return self._get('rise', doff, moff, dt)
+
+    def set(self, doff=0, moff=0, dt=None):
+        return self._get('set', doff, moff, dt)
+
+    def _get(self, kind, doff, moff, dt):
+        if dt is None:
+            if doff != 0 or moff != 0:
+                return getattr(self._orb, kind)(doff, moff)
+            next_time = self._next.get(kind)
+            if next_time is None or next_time <= datetime.now(next_time.tzinfo):
+                next_time = getattr(self._orb, kind)()
+                self._next[kind] = next_time
+            return next_time
+        key = (kind, dt, doff)
+        value = self._table.get(key)
+        if value is None:
+            with self._lock:
+                self.misses += 1
+                value = getattr(self._orb, kind)(doff, 0, dt=dt)
+                self._table[key] = value
+        else:
+            self.hits += 1
+        return value + timedelta(minutes=moff) if moff else value
+
+    def expire(self, before):
+        """
+        Remove the times of the days before the given day from the table
+
+        :param before: first day to keep (timezone aware datetime at midnight)
+        """
+        with self._lock:
+            for key in [key for key in self._table if key[1] < before]:
+                del self._table[key]
+            self._next = {}
+
+    def precompute(self, days):
+        """
+        Calculate the times of the given days for all degree offsets in use (at least 0)
+
+        :param days: list of timezone aware datetimes at midnight
+        """
+        offsets = {key[2] for key in self._table} | {0}
+        for dt in days:
+            for doff in offsets:
+                self.rise(doff, 0, dt)
+                self.set(doff, 0, dt)
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# vim: set encoding=utf-8 tabstop=4 softtabstop=4 shiftwidth=4 expandtab
+#########################################################################
+#  This file is part of SmartHomeNG.    https://github.com/smarthomeNG//
+#
+#  SmartHomeNG is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  SmartHomeNG is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with SmartHomeNG.  If not, see <http://www.gnu.org/licenses/>.
+##########################################################################
+
+import bisect
+import threading
+
+try:
+    import numpy
+    NUMPY_IMPORTED = True
+except Exception:
+    NUMPY_IMPORTED = False
+
+try:
+    from scipy import interpolate
+    SCIPY_IMPORTED = True
+except Exception:
+    SCIPY_IMPORTED = False
+
+
+class Interpolant:
+    """
+    Interpolation function through a list of points
+
+    cubic uses the monotone cubic interpolation of scipy (PchipInterpolator). linear is calculated with
+    NumPy or, if NumPy is not installed, in pure Python. Like scipy's interp1d, linear interpolation raises
+    a ValueError for times outside of the points. Without scipy cubic falls back to linear.
+    """
+
+    def __init__(self, kind, points):
+        """
+        :param kind:    'cubic' or 'linear'
+        :param points:  sorted list of (time, value) tuples, times as timestamps in milliseconds
+        """
+        self.kind = kind if kind == 'linear' or SCIPY_IMPORTED else 'linear'
+        self.x = [float(x) for x, _ in points]
+        self.y = [float(y) for _, y in points]
+        if len(self.x) < 2:
+            raise ValueError("at least two points are needed for {} interpolation".format(self.kind))
+        self._cubic = interpolate.PchipInterpolator(self.x, self.y) if self.kind == 'cubic' else None
+
+    def __call__(self, times):
+        """
+        Evaluate the interpolation at the given times
+
+        :param times:   list of timestamps in milliseconds
+        :return:        list of the interpolated values
+        """
+        if self._cubic is not None:
+            return [float(value) for value in self._cubic(times)]
+        if min(times) < self.x[0] or max(times) > self.x[-1]:
+            raise ValueError("A value in x_new is outside of the interpolation range.")
+        if NUMPY_IMPORTED:
+            return [float(value) for value in numpy.interp(times, self.x, self.y)]
+        values = []
+        for time in times:
+            index = min(max(bisect.bisect_right(self.x, time), 1), len(self.x) - 1)
+            x0, x1 = self.x[index - 1], self.x[index]
+            y0, y1 = self.y[index - 1], self.y[index]
+            values.append(y0 if x1 == x0 else y0 + (y1 - y0) * (time - x0) / (x1 - x0))
+        return values
+
+
+class InterpolationEngine:
+    """
+    Keeps one interpolant per item, rebuilt only if the interpolation points or the type change
+    """
+
+    def __init__(self):
+        self._interpolants = {}
+        self._lock = threading.Lock()
+        self.builds = 0
+        self.evaluations = 0
+
+    def get(self, item, kind, points):
+        """
+        Return the cached interpolant of an item, a new one is built if the points or type changed
+
+        :param item:    uzsu item
+        :param kind:    'cubic' or 'linear'
+        :param points:  sorted list of (time, value) tuples
+        :return:        Interpolant
+        """
+        key = (kind, tuple(points))
+        with self._lock:
+            cached = self._interpolants.get(item)
+            if cached is not None and cached[0] == key:
+                return cached[1]
+        interpolant = Interpolant(kind, points)
+        with self._lock:
+            self._interpolants[item] = (key, interpolant)
+            self.builds += 1
+        return interpolant
+
+    def evaluate(self, item, kind, points, times):
+        """
+        Evaluate the interpolation of an item at several times in one call
+
+        :param item:    uzsu item
+        :param kind:    'cubic' or 'linear'
+        :param points:  sorted list of (time, value) tuples
+        :param times:   list of timestamps in milliseconds
+        :return:        list of the interpolated values
+        """
+        values = self.get(item, kind, points)(times)
+        self.evaluations += 1
+        return values
+
+    def remove(self, item):
+        """
+        Remove the interpolant of an item
+
+        :param item:    uzsu item
+        """
+        with self._lock:
+            self._interpolants.pop(item, None)
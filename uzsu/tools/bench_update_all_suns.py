@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+# vim: set encoding=utf-8 tabstop=4 softtabstop=4 shiftwidth=4 expandtab
+#########################################################################
+#  This file is part of SmartHomeNG.    https://github.com/smarthomeNG//
+#
+#  SmartHomeNG is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  SmartHomeNG is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with SmartHomeNG.  If not, see <http://www.gnu.org/licenses/>.
+##########################################################################
+
+"""
+Benchmark for the midnight sun update of the uzsu plugin
+
+Builds uzsu items with sunrise/sunset based entries (with and without rrule, degree and minute
+offsets) and measures the midnight pass: UZSU._update_all_suns followed by a new schedule of
+every item as it is done on a new day. Without --no-cache the sun times are served by the
+ephemeris table (ephemeris.SunEphemeris), with --no-cache every time is calculated by lib.orb.
+
+The short sleep of _get_time between two sun calculations of a rrule is skipped, use --sleep
+to include it.
+
+Has to be started from the base directory of SmartHomeNG:
+
+    python3 plugins/uzsu/tools/bench_update_all_suns.py -i 80 -e 15
+    python3 plugins/uzsu/tools/bench_update_all_suns.py -i 80 -e 15 --no-cache
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..')))
+
+from lib.shtime import Shtime
+import plugins.uzsu as uzsu
+from plugins.uzsu import UZSU
+from plugins.uzsu.ephemeris import SunEphemeris
+
+
+class DummyProperty:
+
+    def __init__(self, path):
+        self.path = path
+        self.type = 'num'
+
+
+class DummyItem:
+
+    def __init__(self, path, value):
+        self.property = DummyProperty(path)
+        self.conf = {'uzsu_item': path + '.target'}
+        self._value = value
+        self.writes = 0
+
+    def __call__(self, value=None, caller=None, source=None):
+        if value is None:
+            return self._value
+        self._value = value
+        self.writes += 1
+
+    def __str__(self):
+        return self.property.path
+
+    def changed_by(self):
+        return 'bench'
+
+
+class DummyObserver:
+
+    def __init__(self, latitude, longitude):
+        self.lat = latitude
+        self.long = longitude
+        self.elev = 0
+
+
+class DummySun:
+
+    def __init__(self, latitude, longitude):
+        self._obs = DummyObserver(latitude, longitude)
+
+
+class DummySmarthome:
+
+    def __init__(self, latitude, longitude):
+        self.sun = DummySun(latitude, longitude)
+
+
+class BenchUZSU(UZSU):
+    """
+    UZSU plugin without SmartHomeNG, only the attributes needed for scheduling are set
+    """
+
+    def __init__(self, latitude, longitude, cache):
+        self.logger = logging.getLogger('uzsu_bench')
+        self.alive = True
+        self.itemsApi = self
+        self._timezone = Shtime.get_instance().tzinfo()
+        self._sh = DummySmarthome(latitude, longitude)
+        self._uzsu_sun = None
+        self._items = {}
+        self._planned = {}
+        self._update_count = {'todo': 0, 'done': 0}
+        self._itpl = {}
+        self._timeline = {}
+        self._remove_duplicates = False
+        self._interpolation_interval = 5
+        self._interpolation_type = 'none'
+        self._interpolation_precision = 2
+        self._backintime = 0
+        if not cache:
+            self._uzsu_sun = self._create_sun()._orb
+
+    def return_item(self, path):
+        return lambda value, caller=None, source=None: None
+
+    def get_iattr_value(self, conf, attr):
+        return conf.get(attr)
+
+    def scheduler_add(self, name, obj, value=None, next=None, **kwargs):
+        pass
+
+    def scheduler_remove(self, name):
+        pass
+
+    def scheduler_trigger(self, name, by=None):
+        pass
+
+    def _update_ephemeris(self):
+        if isinstance(self._uzsu_sun, SunEphemeris):
+            super()._update_ephemeris()
+
+
+def build_items(count, entries):
+    times = ['sunrise', 'sunset', 'sunrise+30m', 'sunset-15m', 'sunrise-6', 'sunset+4', '06:00<sunrise<08:00',
+             'sunset<21:30', '07:15', '22:00']
+    rrules = ['FREQ=WEEKLY;BYDAY=MO,TU,WE,TH,FR,SA,SU', 'FREQ=WEEKLY;BYDAY=MO,TU,WE,TH,FR', 'FREQ=WEEKLY;BYDAY=SA,SU']
+    items = []
+    for index in range(count):
+        uzsu_list = []
+        for entry in range(entries):
+            uzsu_entry = {'value': entry % 2, 'active': True, 'time': times[(index + entry) % len(times)]}
+            if entry % 3 != 2:
+                uzsu_entry['rrule'] = rrules[(index + entry) % len(rrules)]
+            uzsu_list.append(uzsu_entry)
+        value = {'active': True, 'list': uzsu_list,
+                 'interpolation': {'type': 'none', 'interval': 5, 'initialized': False, 'initage': 0, 'itemtype': 'num'}}
+        items.append(DummyItem('bench.uzsu{}'.format(index), value))
+    return items
+
+
+def midnight(plugin, items):
+    plugin._timeline = {}
+    start = time.perf_counter()
+    plugin._update_all_suns(caller='scheduler')
+    suns = time.perf_counter() - start
+    for item in items:
+        plugin._schedule(item, caller='bench')
+    return suns, time.perf_counter() - start
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Benchmark for the midnight sun update of the uzsu plugin')
+    parser.add_argument('-i', '--items', dest='items', type=int, default=80, help='number of uzsu items')
+    parser.add_argument('-e', '--entries', dest='entries', type=int, default=15, help='number of entries per item')
+    parser.add_argument('-r', '--rounds', dest='rounds', type=int, default=3, help='number of midnight passes')
+    parser.add_argument('--lat', dest='latitude', type=float, default=52.52, help='latitude of the location')
+    parser.add_argument('--long', dest='longitude', type=float, default=13.40, help='longitude of the location')
+    parser.add_argument('--no-cache', dest='cache', action='store_false', help='calculate every sun time with lib.orb')
+    parser.add_argument('--sleep', dest='sleep', action='store_true', help='include the sleep between sun calculations of a rrule')
+    args = parser.parse_args()
+
+    if not args.sleep:
+        uzsu.sleep = lambda seconds: None
+
+    plugin = BenchUZSU(args.latitude, args.longitude, args.cache)
+    items = build_items(args.items, args.entries)
+    for item in items:
+        plugin._items[item] = item()
+
+    suns_total = 0
+    total = 0
+    for _ in range(args.rounds):
+        suns, duration = midnight(plugin, items)
+        suns_total += suns
+        total += duration
+    print("{} items with {} entries, {} midnight passes, {}".format(
+        args.items, args.entries, args.rounds, 'ephemeris table' if args.cache else 'no cache'))
+    print("_update_all_suns: {:.3f} s, midnight pass with schedule of all items: {:.3f} s (per pass)".format(
+        suns_total / args.rounds, total / args.rounds))
+    if args.cache:
+        print("ephemeris table: {} hits, {} calculations".format(plugin._uzsu_sun.hits, plugin._uzsu_sun.misses))
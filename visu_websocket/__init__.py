@@ -34,6 +34,7 @@ import ssl
 import struct
 import threading
 import socket
+import zlib
 
 import collections
 
@@ -43,6 +44,8 @@ from lib.logic import Logics
 from lib.module import Modules
 from lib.model.smartplugin import *
 
+SERIES_STAGGER = 10     # seconds over which the refreshes of the series are spread
+
 
 #########################################################################
 
@@ -83,6 +86,9 @@ class WebSocket(SmartPlugin):
         self.acl = self.get_parameter_value('acl')
         self.wsproto = self.get_parameter_value('wsproto')
         self.querydef = self.get_parameter_value('querydef')
+        self.update_window = self.get_parameter_value('update_window')
+        self.send_backlog = self.get_parameter_value('send_backlog')
+        self.deflate_threshold = self.get_parameter_value('deflate_threshold')
 
         if self.acl in ('true', 'yes'):
             self.acl = 'rw'
@@ -104,7 +110,7 @@ class WebSocket(SmartPlugin):
                 self._init_complete = False
                 return
 
-        self.websocket = _websocket(self.get_sh(), self, self.ip, self.port, self.tls, self.wsproto, self.querydef)
+        self.websocket = _websocket(self.get_sh(), self, self.ip, self.port, self.tls, self.wsproto, self.querydef, self.update_window, self.send_backlog, self.deflate_threshold)
 
         self.init_webinterface()
 
@@ -117,7 +123,8 @@ class WebSocket(SmartPlugin):
         """
         self.logger.debug("run {}".format(__name__))
         self.alive = True
-        self.scheduler_add('series', self.websocket._update_series, cycle=10, prio=5)
+        self.scheduler_add('series', self.websocket._update_series, cycle=1, prio=5)
+        self.websocket.start_flush()
         self.logger.debug("running {}".format(__name__))
 
 
@@ -233,6 +240,8 @@ class WebSocket(SmartPlugin):
             infos['hostname'] = client.hostname
             infos['browser'] = client.browser
             infos['browserversion'] = client.browserversion
+            infos['coalesced'] = client.item_stats['coalesced']
+            infos['compression'] = client.compression_ratio()
 
             yield infos
         return
@@ -300,6 +309,9 @@ class WebInterface(SmartPluginWebIf):
             client['hostname'] = clientinfo.get('hostname', '')
             client['browser'] = clientinfo.get('browser', '')
             client['browserversion'] = clientinfo.get('browserversion', '')
+            client['coalesced'] = clientinfo.get('coalesced', 0)
+            ratio = clientinfo.get('compression')
+            client['compression'] = '' if ratio is None else '{0:.0f} %'.format(ratio * 100)
             clients.append(client)
 
         plgitems = []
@@ -329,7 +341,7 @@ class _websocket(lib.connection.Server):
     Websocket specific class of the Plugin. Handles the websocket connections
     """
 
-    def __init__(self, sh, plugin, ip, port, tls, wsproto, querydef ):
+    def __init__(self, sh, plugin, ip, port, tls, wsproto, querydef, update_window=0, send_backlog=0, deflate_threshold=0):
         lib.connection.Server.__init__(self, ip, port)
         self.logger = logging.getLogger(__name__)
         self._sh = sh
@@ -341,6 +353,16 @@ class _websocket(lib.connection.Server):
         self.clients = []
         self.visu_items = {}
         self.visu_logics = {}
+        self.subscriptions = {}         # item path -> {client: [monitored paths (with .property.)]}, entries are replaced, never changed in place
+        self._client_subscriptions = {} # client -> item paths monitored by the client
+        self._subscriptions_lock = threading.Lock()
+        self.update_window = update_window / 1000   # seconds item updates are collected per client before sending
+        self.send_backlog = send_backlog            # bytes in the send buffer of a client from which item updates are held back
+        self.deflate_threshold = deflate_threshold  # minimum message size compressed with permessage-deflate, 0 = extension disabled
+        self._flush_thread = None
+        self._flush_event = threading.Event()
+        self.series = {}                # sid -> {'update': next refresh, 'params': series parameters, 'clients': set of clients}
+        self._series_lock = threading.Lock()
 
         self.tls_crt = '/usr/local/smarthome/etc/home.crt'
         self.tls_key = '/usr/local/smarthome/etc/home.key'
@@ -373,7 +395,31 @@ class _websocket(lib.connection.Server):
         client = websockethandler(self._sh, self, sock, address, self.visu_items, self.visu_logics, self.proto, self.querydef)
         self.clients.append(client)
 
+    def start_flush(self):
+        """
+        Start the thread sending the collected item updates (if update_window or send_backlog is configured)
+        """
+        if not (self.update_window or self.send_backlog) or self._flush_thread is not None:
+            return
+        self._flush_event.clear()
+        self._flush_thread = threading.Thread(target=self._flush, name='plugins.visu_websocket.flush')
+        self._flush_thread.daemon = True
+        self._flush_thread.start()
+
+    def _flush(self):
+        interval = self.update_window or 0.1
+        while not self._flush_event.wait(interval):
+            for client in list(self.clients):
+                try:
+                    client.flush_items()
+                except Exception as e:
+                    self.logger.warning("_websocket / _flush: cannot send item updates to client {0}, error {1}".format(client.addr, e))
+
     def stop(self):
+        if self._flush_thread is not None:
+            self._flush_event.set()
+            self._flush_thread.join(2)
+            self._flush_thread = None
         for client in self.clients:
             try:
                 client.close()
@@ -383,49 +429,189 @@ class _websocket(lib.connection.Server):
 
     def update_item(self, item_name, item_value, source):
         """
-        Dispatch the new value of an item to all connected clients
+        Dispatch the new value of an item to the clients monitoring it
         """
-        for client in list(self.clients):
+        subscribers = self.subscriptions.get(item_name)
+        if not subscribers:
+            return
+        # clients monitoring the same paths get the same data, unless they are the source of the change
+        groups = {}
+        for client, candidates in subscribers.items():
+            groups.setdefault((tuple(candidates), client.addr == source), []).append(client)
+        for (candidates, is_source), clients in groups.items():
             try:
-                client.update_item(item_name, item_value, source)
+                items = clients[0].item_update_data(item_name, item_value, source, candidates)
+            except:
+                continue
+            if len(items):
+                clients = [client for client in clients if not client.queue_items(items)]
+                self.broadcast(clients, {'cmd': 'item', 'items': items})
+
+    def broadcast(self, clients, data):
+        """
+        Send the same data to several clients
+
+        The data is encoded to JSON and framed only once (per frame type), all clients are
+        handed the same bytes object. Clients using permessage-deflate compress the shared
+        JSON payload themselves, as the compression context is kept per connection.
+
+        :param clients: list of websockethandler
+        :param data: data to send
+        """
+        payload = None
+        frames = {}
+        for client in clients:
+            frame_type = client.frame_type
+            if frame_type is None:
+                continue
+            try:
+                if client.deflate_active():
+                    if payload is None:
+                        payload = json_encode(data)
+                    if client.send_message(payload):
+                        continue
+                frame = frames.get(frame_type)
+                if frame is None:
+                    if payload is None:
+                        payload = json_encode(data)
+                    frame = frames[frame_type] = FRAMES[frame_type](payload)
+                client.send_frame(frame)
             except:
                 pass
 
+    def set_monitor(self, client, paths):
+        """
+        Update the subscription index with the items monitored by a client
+
+        :param client: websockethandler of the client
+        :param paths: monitored item paths (may contain .property.)
+        """
+        monitored = {}
+        for path in paths:
+            monitored.setdefault(path.split('.property.')[0], []).append(path)
+        with self._subscriptions_lock:
+            for item_name in self._client_subscriptions.get(client, set()) - set(monitored):
+                subscribers = dict(self.subscriptions.get(item_name, {}))
+                subscribers.pop(client, None)
+                if subscribers:
+                    self.subscriptions[item_name] = subscribers
+                else:
+                    self.subscriptions.pop(item_name, None)
+            for item_name, candidates in monitored.items():
+                subscribers = dict(self.subscriptions.get(item_name, {}))
+                subscribers[client] = candidates
+                self.subscriptions[item_name] = subscribers
+            if monitored:
+                self._client_subscriptions[client] = set(monitored)
+            else:
+                self._client_subscriptions.pop(client, None)
+
     def remove_client(self, client):
+        self.set_monitor(client, [])
+        with self._series_lock:
+            for sid in [sid for sid, series in self.series.items() if client in series['clients']]:
+                self._series_unsubscribe(client, sid)
         self.clients.remove(client)
 
 
     def _send_event(self, event, data):
+        clients = []
         for client in list(self.clients):
             try:
-                client.send_event(event, data)
+                if event in client.monitor and data[client.monitor_id[event]] in client.monitor[event]:
+                    clients.append(client)
             except:
                 pass
+        if clients:
+            data = data.copy()  # don't change the orignal data dict
+            data['cmd'] = event
+            self.broadcast(clients, data)
+
+    def series_subscribe(self, client, reply):
+        """
+        Register a client for the updates of a series
+
+        Clients requesting the same series (same sid) share one registry entry, so the series is
+        refreshed only once for all of them. The refresh of a new entry is delayed by a fixed offset
+        derived from the sid, to spread the refreshes of different series over time.
+
+        :param client: websockethandler of the client
+        :param reply: reply of item.series() to the initial request of the client
+        """
+        with self._series_lock:
+            series = self.series.get(reply['sid'])
+            if series is None:
+                self.series[reply['sid']] = {'update': reply['update'] + self._series_offset(reply['sid'], reply['params']),
+                                             'params': reply['params'], 'clients': {client}}
+            else:
+                series['clients'].add(client)
+
+    def series_unsubscribe(self, client, sid):
+        """
+        Remove a client from the updates of a series
+
+        :return: True if the client was registered for the series
+        """
+        with self._series_lock:
+            return self._series_unsubscribe(client, sid)
+
+    def _series_unsubscribe(self, client, sid):
+        series = self.series.get(sid)
+        if series is None or client not in series['clients']:
+            return False
+        series['clients'].discard(client)
+        if not series['clients']:
+            del(self.series[sid])
+        return True
+
+    def _series_offset(self, sid, params):
+        """
+        Fixed delay of the refreshes of a series within SERIES_STAGGER seconds (at most one step of the series)
+        """
+        stagger = SERIES_STAGGER
+        if params.get('step'):
+            stagger = min(stagger, params['step'] / 1000)
+        return datetime.timedelta(seconds=(zlib.crc32(sid.encode()) % 1000) / 1000 * stagger)
 
     def _update_series(self):
-        for client in list(self.clients):
+        """
+        Refresh the series which are due and send the new values to all subscribed clients
+        """
+        now = self.shtime.now()
+        with self._series_lock:
+            due = [(sid, series) for sid, series in self.series.items() if series['update'] < now]
+        for sid, series in due:
+            params = series['params']
             try:
-                client.update_series()
+                reply = self.visu_items[params['item']]['item'].series(**params)
             except Exception as e:
-                self.logger.warning("_websocket / _update_series: cannot update client {0}, error {1}".format(client, e))
-                pass
+                self.logger.exception("Problem updating series for {0}: {1}".format(params, e))
+                with self._series_lock:
+                    self.series.pop(sid, None)
+                continue
+            with self._series_lock:
+                if self.series.get(sid) is not series:
+                    continue
+                series['update'] = reply['update'] + self._series_offset(sid, reply['params'])
+                series['params'] = reply['params']
+                clients = list(series['clients'])
+            del(reply['update'])
+            del(reply['params'])
+            if reply['series'] is not None:
+                self.logger.info(">SerUP {} clients: {}".format(len(clients), reply))
+                self.broadcast(clients, reply)
 
     def dialog(self, header, content):
-        for client in list(self.clients):
-            try:
-                client.json_send({'cmd': 'dialog', 'header': header, 'content': content})
-            except:
-                pass
+        self.broadcast(list(self.clients), {'cmd': 'dialog', 'header': header, 'content': content})
 
     def url(self, url, clientip=''):
+        clients = []
         for client in list(self.clients):
             ip, _, port = client.addr.partition(':')
             if (clientip == '') or (clientip == ip):
                 self.logger.debug("VISU: Websocket send url to ip={}, port={}".format(str(ip),str(port)))
-                try:
-                    client.json_send({'cmd': 'url', 'url': url})
-                except:
-                    pass
+                clients.append(client)
+        self.broadcast(clients, {'cmd': 'url', 'url': url})
 
 
 #########################################################################
@@ -447,16 +633,25 @@ class websockethandler(lib.connection.Stream):
         self.header = {}
         self.monitor = {'item': [], 'rrd': [], 'log': []}
         self.monitor_id = {'item': 'item', 'rrd': 'item', 'log': 'name'}
-        self._update_series = {}
         self.items = items
         self.rrd = False
         self.log = False
         self.logs = self._sh.return_logs()
-        self._series_lock = threading.Lock()
         self.visu_logics = visu_logics
         self.proto = proto
         self.querydef = querydef
         self.logger.info("VISU: Websocket handler uses protocol version {0}".format(self.proto))
+        self.frame_type = None          # 'rfc6455' or 'hixie76' after the handshake
+        self._pending_items = collections.OrderedDict()  # item updates collected for the next flush, path -> value
+        self._pending_lock = threading.Lock()
+        self._flushing = False          # collected updates are being sent, newer updates have to wait for them
+        self.item_stats = {'coalesced': 0}
+        self._deflater = None           # zlib compress object if permessage-deflate was negotiated
+        self._inflater = None
+        self._deflate_wbits = 15
+        self._deflate_no_context = False
+        self._deflate_lock = threading.Lock()
+        self.deflate_stats = {'raw': 0, 'compressed': 0}
         self.sw = ''
         self.swversion = ''
         self.hostname = ''
@@ -481,6 +676,98 @@ class websockethandler(lib.connection.Stream):
     def json_send(self, data):
         self.logger.info("Visu: DUMMY send to {0}: {1}".format(self.addr, data))
 
+    def queue_items(self, items):
+        """
+        Collect item updates for the next flush instead of sending them immediately
+
+        Updates are collected if an update window is configured, if the send buffer of the client holds
+        more than send_backlog bytes or if there are already updates waiting or being sent by flush_items
+        (to keep the order). Only the latest value per path is kept.
+
+        :param items: list of [path, value]
+        :return: True if the updates were collected, False if they have to be sent now
+        """
+        with self._pending_lock:
+            if not (self._dp.update_window or self._pending_items or self._flushing or self.congested()):
+                return False
+            for path, value in items:
+                if path in self._pending_items:
+                    self.item_stats['coalesced'] += 1
+                    del(self._pending_items[path])
+                self._pending_items[path] = value
+        return True
+
+    def congested(self):
+        """
+        Check if the send buffer of the client holds more than send_backlog bytes
+        """
+        if not self._dp.send_backlog:
+            return False
+        return sum(len(frame) for frame in getattr(self, 'outbuffer', ())) > self._dp.send_backlog
+
+    def flush_items(self):
+        """
+        Send the collected item updates as one item command, if the send buffer is not congested
+        """
+        if self.frame_type is None or self.congested():
+            return
+        with self._pending_lock:
+            if not self._pending_items:
+                return
+            items = [[path, value] for path, value in self._pending_items.items()]
+            self._pending_items = collections.OrderedDict()
+            self._flushing = True
+        try:
+            self.json_send({'cmd': 'item', 'items': items})
+        finally:
+            with self._pending_lock:
+                self._flushing = False
+
+    def send_frame(self, frame):
+        """
+        Send a frame already built for the protocol of this client (see _websocket.broadcast)
+        """
+        self.send(frame)
+
+    def deflate_active(self):
+        """
+        Check if messages to this client may be compressed (permessage-deflate negotiated)
+        """
+        return self._deflater is not None
+
+    def send_message(self, payload):
+        """
+        Send a payload compressed with permessage-deflate (RFC 7692) if it reaches the deflate threshold
+
+        Compression and sending are done under a lock, as the client decompresses the messages
+        in the order they are sent using the same sliding window (context takeover).
+
+        :param payload: JSON payload (bytes)
+        :return: True if the payload has been sent compressed, False if it has to be sent uncompressed
+        """
+        if self._deflater is None or len(payload) < self._dp.deflate_threshold:
+            return False
+        with self._deflate_lock:
+            if self._deflate_no_context:
+                self._deflater = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -self._deflate_wbits)
+            data = self._deflater.compress(payload) + self._deflater.flush(zlib.Z_SYNC_FLUSH)
+            if data.endswith(b'\x00\x00\xff\xff'):
+                data = data[:-4]
+            self.deflate_stats['raw'] += len(payload)
+            self.deflate_stats['compressed'] += len(data)
+            self.send(rfc6455_frame(data, rsv1=True))
+        return True
+
+    def compression_ratio(self):
+        """
+        Ratio of compressed to uncompressed size of the messages sent compressed
+
+        :return: ratio (0..1) or None if nothing has been compressed
+        """
+        if not self.deflate_stats['raw']:
+            return None
+        return self.deflate_stats['compressed'] / self.deflate_stats['raw']
+
     def handle_close(self):
         # remove circular references
         self._dp.remove_client(self)
@@ -489,12 +776,28 @@ class websockethandler(lib.connection.Stream):
         except:
             pass
 
-    def update_item(self, item_name, item_value, source):
+    def update_item(self, item_name, item_value, source, candidates=None):
         """
         send JSON data with new value of an item
+
+        :param candidates: monitored paths of this client for the item (from the subscription index of the dispatcher)
+        """
+        items = self.item_update_data(item_name, item_value, source, candidates)
+        if len(items): # only send an update if item/value pairs found to be send
+            data = {'cmd': 'item', 'items': items}
+            self.json_send(data)
+
+    def item_update_data(self, item_name, item_value, source, candidates=None):
         """
+        Build the item/value pairs to send to this client for the new value of an item
+
+        :param candidates: monitored paths of this client for the item (from the subscription index of the dispatcher)
+        :return: list of [path, value]
+        """
+        if candidates is None:
+            candidates = [candidate for candidate in self.monitor['item'] if candidate.split('.property.')[0] == item_name]
         items = []
-        for candidate in self.monitor['item']:
+        for candidate in candidates:
             try:
                 #self.logger.debug("Send update to Client {0} for candidate {1} and item_name {2}?".format(self.addr, candidate, item_name))
                 path_parts = candidate.split('.property.')
@@ -519,34 +822,7 @@ class websockethandler(lib.connection.Stream):
                 self.logger.warning("Could not send update to Client {0}: something is wrong with item path {1}, value={2}, source={3}".format(self.addr, item_name, item_value, source))
             except:
                 pass
-
-        if len(items): # only send an update if item/value pairs found to be send
-            data = {'cmd': 'item', 'items': items}
-            self.json_send(data)
-
-    def update_series(self):
-#        now = self._sh.now()
-        now = self.shtime.now()
-        self._series_lock.acquire()
-        remove = []
-        for sid, series in self._update_series.items():
-            if series['update'] < now:
-                try:
-                    reply = self.items[series['params']['item']]['item'].series(**series['params'])
-                except Exception as e:
-                    self.logger.exception("Problem updating series for {0}: {1}".format(series['params'], e))
-                    remove.append(sid)
-                    continue
-                self._update_series[reply['sid']] = {'update': reply['update'], 'params': reply['params']}
-                del(reply['update'])
-                del(reply['params'])
-                if reply['series'] is not None:
-                    # self.logger.warning("Visu: update send to {0}: {1}".format(self.addr, reply))
-                    self.logger.info(">SerUP {}: {}".format(self.addr, reply))
-                    self.json_send(reply)
-        for sid in remove:
-            del(self._update_series[sid])
-        self._series_lock.release()
+        return items
 
     def difference(self, a, b):
         return list(set(b).difference(set(a)))
@@ -613,6 +889,7 @@ class websockethandler(lib.connection.Stream):
             # monitored items will also contain those with .property. which is not right, we need to strip .property
             ### old: self.monitor['item'] = data['items']
             self.monitor['item'] = newmonitor_items
+            self._dp.set_monitor(self, newmonitor_items)
             self.logger.debug("Client {0} new monitored items are {1}".format(self.addr, newmonitor_items))
 
         elif command == 'logic':
@@ -638,9 +915,7 @@ class websockethandler(lib.connection.Stream):
                         self.logger.error("Problem fetching series for {0}: {1} - Wrong sqlite plugin?".format(path, e))
                     else:
                         if 'update' in reply:
-                            self._series_lock.acquire()
-                            self._update_series[reply['sid']] = {'update': reply['update'], 'params': reply['params']}
-                            self._series_lock.release()
+                            self._dp.series_subscribe(self, reply)
                             del(reply['update'])
                             del(reply['params'])
                         if reply['series'] is not None:
@@ -674,19 +949,15 @@ class websockethandler(lib.connection.Stream):
             try:
                 reply = self.items[path]['item'].series(series, start, end, count)
                 self.logger.info("Series cancelation: reply={}".format(reply))
-                self.logger.info("Series cancelation: self._update_series={}".format(self._update_series))
             except Exception as e:
                 self.logger.error("Problem fetching series for {0}: {1} - Wrong sqlite plugin?".format(path, e))
             else:
-                self._series_lock.acquire()
-                try:
-                    del (self._update_series[reply['sid']])
+                if self._dp.series_unsubscribe(self, reply['sid']):
                     self.logger.info("Series cancelation: Series updates for path {} canceled".format(path))
                     self.json_send({'cmd': command, 'result': "Series updates for path {} canceled".format(path)})
-                except:
+                else:
                     self.logger.warning("Series cancelation: No series for path {} found in list".format(path))
                     self.json_send({'cmd': command, 'error': "No series for path {} found in list".format(path)})
-                self._series_lock.release()
 
         elif command == 'log':
             self.log = True
@@ -852,86 +1123,184 @@ class websockethandler(lib.connection.Stream):
 
     def rfc6455_handshake(self):
         self.logger.debug("rfc6455 Handshake")
-        self.terminator = 8
+        self.terminator = 2
         self.found_terminator = self.rfc6455_parse
+        self._frame = None
+        self._fragments = []
+        self._fragments_opcode = None
+        self._fragments_rsv1 = 0
         self.json_send = self.rfc6455_send
+        self.frame_type = 'rfc6455'
         key = self.header[b'Sec-WebSocket-Key'] + b"258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
         key = base64.b64encode(hashlib.sha1(key).digest()).decode()
+        extension = self.rfc6455_negotiate_deflate() if self._dp.deflate_threshold else None
         self.send('HTTP/1.1 101 Switching Protocols\r\n'.encode())
         self.send('Upgrade: websocket\r\n'.encode())
         self.send('Connection: Upgrade\r\n'.encode())
         self.send('Sec-WebSocket-Accept: {0}\r\n'.format(key).encode())
+        if extension:
+            self.logger.debug("WebSocket: using {0} for {1}".format(extension, self.addr))
+            self.send('Sec-WebSocket-Extensions: {0}\r\n'.format(extension).encode())
         self.send('\r\n'.encode())
 
+    def rfc6455_negotiate_deflate(self):
+        """
+        Accept the first permessage-deflate offer (RFC 7692) of the client that can be served
+
+        The server keeps its compression context between messages (context takeover) unless the client
+        asks for server_no_context_takeover. Inbound messages are always inflated with a shared context,
+        which works whether the client takes over its context or not.
+
+        :return: value for the Sec-WebSocket-Extensions response header or None
+        """
+        offers = self.header.get(b'Sec-WebSocket-Extensions', b'').decode(errors='ignore')
+        for offer in offers.split(','):
+            params = [param.strip() for param in offer.split(';')]
+            if params[0] != 'permessage-deflate':
+                continue
+            response = ['permessage-deflate']
+            wbits = 15
+            no_context = False
+            for param in params[1:]:
+                name, _, value = param.partition('=')
+                name = name.strip()
+                value = value.strip().strip('"')
+                if name == 'server_no_context_takeover':
+                    no_context = True
+                    response.append(name)
+                elif name == 'client_no_context_takeover':
+                    response.append(name)
+                elif name == 'server_max_window_bits':
+                    # zlib does not support raw deflate streams with a window of 8 bits
+                    if not value.isdigit() or not 9 <= int(value) <= 15:
+                        break
+                    wbits = int(value)
+                    response.append('{0}={1}'.format(name, wbits))
+                elif name != 'client_max_window_bits':
+                    break
+            else:
+                self._deflate_wbits = wbits
+                self._deflate_no_context = no_context
+                self._deflater = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -wbits)
+                self._inflater = zlib.decompressobj(-15)
+                return '; '.join(response)
+        return None
+
     def rfc6455_parse(self, data):
-        # fin = bit_set(data[0], 7)
-        # rsv1 = bit_set(data[0], 6)
-        # rsv2 = bit_set(data[0], 5)
-        # rsv1 = bit_set(data[0], 4)
+        """
+        Parse the first two bytes of a frame and wait for the extended length/masking key or the payload
+        """
+        fin = data[0] & 0x80
+        rsv1 = data[0] & 0x40
         opcode = data[0] & 0x0f
-        if opcode == 8:
-            self.logger.debug("WebSocket: closing connection to {0}.".format(self.addr))
-            self.close()
-            return
-        header = 2
-        masked = self.bit_set(data[1], 7)
-        if masked:
-            header += 4
+        masked = data[1] & 0x80
         length = data[1] & 0x7f
+        self._frame = (fin, rsv1, opcode, masked, length)
+        extended = (2 if length == 126 else 8 if length == 127 else 0) + (4 if masked else 0)
+        if extended:
+            self.found_terminator = self.rfc6455_parse_extended
+            self.terminator = extended
+        else:
+            self._rfc6455_wait_payload()
+
+    def rfc6455_parse_extended(self, data):
+        """
+        Parse the extended payload length and the masking key of a frame
+        """
+        fin, rsv1, opcode, masked, length = self._frame
+        offset = 0
         if length == 126:
-            header += 2
-            length = int.from_bytes(data[2:4], byteorder='big')
+            length = int.from_bytes(data[0:2], byteorder='big')
+            offset = 2
         elif length == 127:
-            header += 8
-            length = int.from_bytes(data[2:10], byteorder='big')
-        read = header + length
-        if len(data) < read:  # data too short, read more
-            self.inbuffer = data + self.inbuffer
-            self.terminator = read
+            length = int.from_bytes(data[0:8], byteorder='big')
+            offset = 8
+        key = bytes(data[offset:offset + 4]) if masked else None
+        self._frame = (fin, rsv1, opcode, key, length)
+        self._rfc6455_wait_payload()
+
+    def _rfc6455_wait_payload(self):
+        length = self._frame[4]
+        if length == 0:
+            self.rfc6455_parse_payload(b'')
+        else:
+            self.found_terminator = self.rfc6455_parse_payload
+            self.terminator = length
+
+    def rfc6455_parse_payload(self, data):
+        """
+        Handle the payload of a frame: control frames (close, ping, pong) are answered directly,
+        fragmented messages are collected until the final frame has been received, compressed
+        messages (RSV1 set on the first frame) are inflated
+        """
+        fin, rsv1, opcode, key, length = self._frame
+        self._frame = None
+        self.found_terminator = self.rfc6455_parse
+        self.terminator = 2
+        if key:
+            data = rfc6455_unmask(data, key)
+
+        if opcode == 0x08:
+            self.logger.debug("WebSocket: closing connection to {0}.".format(self.addr))
+            try:
+                self.send(rfc6455_frame(bytes(data[:2]), opcode=0x08))
+            except Exception:
+                pass
+            self.close()
+            return
+        if opcode == 0x09:
+            self.send(rfc6455_frame(bytes(data), opcode=0x0A))
+            return
+        if opcode == 0x0A:
             return
-        if masked:
-            key = data[header - 4:header]
-            payload = bytearray(data[header:])
-            for i in range(length):
-                payload[i] ^= key[i % 4]
+
+        if opcode == 0x00:
+            if self._fragments_opcode is None:
+                self.logger.warning("WebSocket: continuation frame without start of message from {0}".format(self.addr))
+                return
+            self._fragments.append(data)
+            if not fin:
+                return
+            data = b''.join(self._fragments)
+            rsv1 = self._fragments_rsv1
+            self._fragments = []
+            self._fragments_opcode = None
+        elif opcode in (0x01, 0x02):
+            if not fin:
+                self._fragments = [data]
+                self._fragments_opcode = opcode
+                self._fragments_rsv1 = rsv1
+                return
         else:
-            payload = data[header:]
+            self.logger.warning("WebSocket: unknown opcode {0} from {1}".format(opcode, self.addr))
+            return
+
+        if rsv1:
+            if self._inflater is None:
+                self.logger.warning("WebSocket: compressed message from {0} without permessage-deflate".format(self.addr))
+                return
+            try:
+                data = self._inflater.decompress(bytes(data) + b'\x00\x00\xff\xff')
+            except zlib.error as e:
+                self.logger.warning("WebSocket: cannot inflate message from {0}: {1}".format(self.addr, e))
+                return
 
         #self.logger.info("rfc6455_parse: Received {}".format(data.decode()))
         try:
-            self.json_parse(payload.decode())
+            self.json_parse(bytes(data).decode())
         except Exception as e:
             self.logger.exception("_websocket.json_parse exception: {}".format(e))
-        self.terminator = 8
 
     def rfc6455_send(self, data):
-        data = json.dumps(data, cls=JSONEncoder, separators=(',', ':'))
         #self.logger.info("rfc6455_send: Sending {}".format(data))
-        header = bytearray(2)
-        header[0] = self.set_bit(header[0], 0)  # opcode text
-        header[0] = self.set_bit(header[0], 7)  # final
-        length = len(data)
-        if length < 126:
-            header[1] = length
-        elif length < ((1 << 16) - 1):
-            header[1] = 126
-            header += bytearray(length.to_bytes(2, byteorder='big'))
-        elif length < ((1 << 64) - 1):
-            header[1] = 127
-            header += bytearray(length.to_bytes(8, byteorder='big'))
-        else:
-            self.logger.warning("data to big: {0}".format(data))
-            return
-        self.send(header + data.encode())
+        payload = json_encode(data)
+        if not self.send_message(payload):
+            self.send(rfc6455_frame(payload))
 
     def hixie76_send(self, data):
-        data = json.dumps(data, cls=JSONEncoder, separators=(',', ':'))
-        self.logger.info("hixie76_send: Sending {}".format(data))
-        packet = bytearray()
-        packet.append(0x00)
-        packet.extend(data.encode())
-        packet.append(0xff)
-        self.send(packet)
+        data = json_encode(data)
+        self.logger.info("hixie76_send: Sending {}".format(data.decode()))
+        self.send(hixie76_frame(data))
 
     def hixie76_parse(self, data):
         self.logger.info("hixie76_parse: Received {}".format(data.decode().lstrip('\x00')))
@@ -960,6 +1329,7 @@ class websockethandler(lib.connection.Stream):
         self.send(key.digest())
         self.found_terminator = self.hixie76_parse
         self.json_send = self.hixie76_send
+        self.frame_type = 'hixie76'
         self.terminator = b"\xff"
 
 
@@ -981,3 +1351,61 @@ class JSONEncoder(json.JSONEncoder):
         return json.JSONEncoder.default(self, obj)
 
 
+def json_encode(data):
+    """
+    Encode data for a visu client as JSON
+
+    :return: utf-8 encoded bytes
+    """
+    return json.dumps(data, cls=JSONEncoder, separators=(',', ':')).encode()
+
+
+def rfc6455_frame(payload, opcode=0x01, rsv1=False):
+    """
+    Build a final, unmasked RFC6455 frame (text frame by default)
+
+    :param payload: bytes
+    :param rsv1: set the RSV1 bit (payload compressed with permessage-deflate)
+    :return: bytes of the frame
+    """
+    length = len(payload)
+    first = 0x80 | (0x40 if rsv1 else 0) | opcode
+    if length < 126:
+        header = bytes([first, length])
+    elif length < (1 << 16):
+        header = bytes([first, 126]) + length.to_bytes(2, byteorder='big')
+    else:
+        header = bytes([first, 127]) + length.to_bytes(8, byteorder='big')
+    return header + payload
+
+
+def rfc6455_unmask(payload, key):
+    """
+    Unmask the payload of a frame received from a client
+
+    The payload is XORed with the repeated 4 byte masking key as one big integer instead of byte by byte.
+
+    :param payload: masked payload
+    :param key: 4 byte masking key
+    :return: unmasked payload as bytes
+    """
+    length = len(payload)
+    if length == 0:
+        return b''
+    mask = (key * (length // 4 + 1))[:length]
+    return (int.from_bytes(payload, 'little') ^ int.from_bytes(mask, 'little')).to_bytes(length, 'little')
+
+
+def hixie76_frame(payload):
+    """
+    Build a hixie76 frame
+
+    :param payload: bytes
+    :return: bytes of the frame
+    """
+    return b'\x00' + payload + b'\xff'
+
+
+FRAMES = {'rfc6455': rfc6455_frame, 'hixie76': hixie76_frame}
+
+
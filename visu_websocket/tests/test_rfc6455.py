@@ -0,0 +1,244 @@
+import json
+import logging
+import random
+import unittest
+import zlib
+
+from plugins.visu_websocket import websockethandler, rfc6455_frame, rfc6455_unmask
+
+
+class Receiver:
+    """
+    Mimics lib.connection.Stream: the received bytes are collected in the input buffer and handed to
+    found_terminator as soon as the terminator (number of bytes) is available
+    """
+
+    def setup_receiver(self):
+        self.logger = logging.getLogger(__name__)
+        self.addr = '127.0.0.1:50000'
+        self.inbuffer = bytearray()
+        self.received = []
+        self.sent = []
+        self.closed = False
+
+    def json_parse(self, data):
+        self.received.append(data)
+
+    def send(self, data, close=False):
+        self.sent.append(bytes(data))
+        return True
+
+    def close(self):
+        self.closed = True
+
+    def feed(self, data):
+        self.inbuffer.extend(data)
+        while not self.closed and len(self.inbuffer) >= self.terminator:
+            data = self.inbuffer[:self.terminator]
+            self.inbuffer = self.inbuffer[self.terminator:]
+            self.found_terminator(data)
+
+
+class Handler(Receiver, websockethandler):
+    """
+    websockethandler after the rfc6455 handshake, without a connection
+    """
+
+    def __init__(self):
+        self.setup_receiver()
+        self.terminator = 2
+        self.found_terminator = self.rfc6455_parse
+        self._frame = None
+        self._fragments = []
+        self._fragments_opcode = None
+        self._fragments_rsv1 = 0
+        self._inflater = None
+
+
+class ReferenceHandler(Receiver):
+    """
+    Frame parser of the plugin before the incremental parser (reads 8 bytes and puts the data back into the
+    input buffer if the frame is longer, unmasks byte by byte). Only handles complete text and close frames
+    of at least 8 bytes.
+    """
+
+    def __init__(self):
+        self.setup_receiver()
+        self.terminator = 8
+        self.found_terminator = self.rfc6455_parse
+
+    def rfc6455_parse(self, data):
+        opcode = data[0] & 0x0f
+        if opcode == 8:
+            self.close()
+            return
+        header = 2
+        masked = not 0 == (data[1] & (1 << 7))
+        if masked:
+            header += 4
+        length = data[1] & 0x7f
+        if length == 126:
+            header += 2
+            length = int.from_bytes(data[2:4], byteorder='big')
+        elif length == 127:
+            header += 8
+            length = int.from_bytes(data[2:10], byteorder='big')
+        read = header + length
+        if len(data) < read:
+            self.inbuffer = data + self.inbuffer
+            self.terminator = read
+            return
+        if masked:
+            key = data[header - 4:header]
+            payload = bytearray(data[header:])
+            for i in range(length):
+                payload[i] ^= key[i % 4]
+        else:
+            payload = data[header:]
+        self.json_parse(payload.decode())
+        self.terminator = 8
+
+
+def client_frame(payload, opcode=0x01, fin=True, key=b'\x37\xfa\x21\x3d', rsv1=False):
+    """
+    Build a frame as sent by a client, masked if a key is given
+    """
+    length = len(payload)
+    first = (0x80 if fin else 0) | (0x40 if rsv1 else 0) | opcode
+    mask = 0x80 if key else 0
+    if length < 126:
+        header = bytes([first, mask | length])
+    elif length < (1 << 16):
+        header = bytes([first, mask | 126]) + length.to_bytes(2, byteorder='big')
+    else:
+        header = bytes([first, mask | 127]) + length.to_bytes(8, byteorder='big')
+    if key:
+        return header + key + bytes(byte ^ key[index % 4] for index, byte in enumerate(payload))
+    return header + payload
+
+
+def message(length):
+    """
+    JSON command of the given length in bytes (at least 11)
+    """
+    text = json.dumps({'cmd': 'x' * (length - 11)})
+    assert len(text.encode()) == length
+    return text
+
+
+class TestRfc6455(unittest.TestCase):
+
+    def feed(self, handler, data, chunk=1):
+        for index in range(0, len(data), chunk):
+            handler.feed(data[index:index + chunk])
+
+    def test_unmask(self):
+        rnd = random.Random(6455)
+        for length in list(range(0, 10)) + [125, 126, 1000, 65537]:
+            payload = bytes(rnd.getrandbits(8) for _ in range(length))
+            key = bytes(rnd.getrandbits(8) for _ in range(4))
+            expected = bytearray(payload)
+            for i in range(length):
+                expected[i] ^= key[i % 4]
+            self.assertEqual(bytes(expected), rfc6455_unmask(payload, key), "length {}".format(length))
+            self.assertEqual(payload, rfc6455_unmask(rfc6455_unmask(payload, key), key))
+
+    def test_byte_by_byte_as_reference(self):
+        # payload lengths around the 7 bit, 16 bit and 64 bit length encodings
+        lengths = [13, 50, 125, 126, 127, 1000, 65535, 65536, 70000]
+        for key in [b'\x37\xfa\x21\x3d', b'\x00\x00\x00\x00', None]:
+            data = b''.join(client_frame(message(length).encode(), key=key) for length in lengths)
+            reference = ReferenceHandler()
+            self.feed(reference, data)
+            for chunk in [1, 7, 4096]:
+                handler = Handler()
+                self.feed(handler, data, chunk)
+                self.assertEqual(reference.received, handler.received, "key {}, chunk size {}".format(key, chunk))
+                self.assertEqual([message(length) for length in lengths], handler.received)
+                self.assertEqual(0, len(handler.inbuffer))
+                self.assertEqual(2, handler.terminator)
+
+    def test_utf8_as_reference(self):
+        text = json.dumps({'cmd': 'item', 'items': [['wohnen.licht', 'äöü €']]}, ensure_ascii=False)
+        data = client_frame(text.encode()) * 3
+        reference = ReferenceHandler()
+        handler = Handler()
+        self.feed(reference, data)
+        self.feed(handler, data)
+        self.assertEqual(reference.received, handler.received)
+        self.assertEqual([text] * 3, handler.received)
+
+    def test_close_as_reference(self):
+        data = client_frame(message(20).encode()) + client_frame(b'\x03\xe8', opcode=0x08) + client_frame(message(20).encode())
+        reference = ReferenceHandler()
+        handler = Handler()
+        self.feed(reference, data)
+        self.feed(handler, data)
+        self.assertTrue(reference.closed)
+        self.assertTrue(handler.closed)
+        self.assertEqual(reference.received, handler.received)
+        self.assertEqual([rfc6455_frame(b'\x03\xe8', opcode=0x08)], handler.sent)
+
+    def test_fragmented(self):
+        text = message(300)
+        payload = text.encode()
+        reference = ReferenceHandler()
+        self.feed(reference, client_frame(payload))
+        fragments = [payload[:1], payload[1:130], payload[130:131], payload[131:]]
+        data = client_frame(fragments[0], fin=False)
+        for fragment in fragments[1:-1]:
+            data += client_frame(fragment, opcode=0x00, fin=False)
+        data += client_frame(fragments[-1], opcode=0x00)
+        handler = Handler()
+        self.feed(handler, data + client_frame(payload))
+        self.assertEqual(reference.received * 2, handler.received)
+
+    def test_fragmented_with_control_frames(self):
+        text = message(60)
+        payload = text.encode()
+        data = client_frame(payload[:20], fin=False) + client_frame(b'ping', opcode=0x09) + \
+            client_frame(payload[20:40], opcode=0x00, fin=False) + client_frame(b'', opcode=0x0A) + \
+            client_frame(payload[40:], opcode=0x00)
+        handler = Handler()
+        self.feed(handler, data)
+        self.assertEqual([text], handler.received)
+        self.assertEqual([rfc6455_frame(b'ping', opcode=0x0A)], handler.sent)
+        self.assertFalse(handler.closed)
+
+    def test_empty_and_unmasked_frames(self):
+        text = message(13)
+        data = client_frame(b'', opcode=0x09) + client_frame(text.encode(), key=None) + \
+            client_frame(b'', opcode=0x01, fin=False) + client_frame(text.encode(), opcode=0x00)
+        handler = Handler()
+        self.feed(handler, data)
+        self.assertEqual([text, text], handler.received)
+        self.assertEqual([rfc6455_frame(b'', opcode=0x0A)], handler.sent)
+
+    def test_continuation_without_start(self):
+        text = message(20)
+        handler = Handler()
+        self.feed(handler, client_frame(b'abc', opcode=0x00) + client_frame(text.encode()))
+        self.assertEqual([text], handler.received)
+
+    def test_compressed(self):
+        text = message(2000)
+        deflater = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+        first = deflater.compress(text.encode()) + deflater.flush(zlib.Z_SYNC_FLUSH)
+        second = deflater.compress(text.encode()) + deflater.flush(zlib.Z_SYNC_FLUSH)
+        self.assertEqual(b'\x00\x00\xff\xff', first[-4:])
+        second = second[:-4]
+        data = client_frame(first[:-4], rsv1=True) + \
+            client_frame(second[:5], fin=False, rsv1=True) + client_frame(second[5:], opcode=0x00)
+        handler = Handler()
+        handler._inflater = zlib.decompressobj(-15)
+        self.feed(handler, data)
+        self.assertEqual([text, text], handler.received)
+
+    def test_compressed_without_deflate(self):
+        handler = Handler()
+        self.feed(handler, client_frame(zlib.compress(b'{}')[2:-4], rsv1=True) + client_frame(message(13).encode()))
+        self.assertEqual([message(13)], handler.received)
+
+
+if __name__ == '__main__':
+    unittest.main()